@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+"""
+Timings of the strategies of large "in" lists, see LargeTermsStrategy in conf.ini
+
+Generation only, with a schema file, or generation and search with an index:
+  large_terms.py --schema tests/data/sample_2017_schema.json --field .id
+  large_terms.py --index foo --field .id --hosts http://localhost:9200
+"""
+import json
+import argparse
+import logging
+import time
+
+from sel import config
+from sel.sel import SEL
+
+from elastic import elastic_connect
+
+
+STRATEGIES = ["terms", "chunks", "lookup"]
+
+
+def options():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--field", required=True)
+    parser.add_argument("--schema")
+    parser.add_argument("--index")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--max-terms", type=int, default=65536)
+    parser.add_argument("--hosts", nargs="+")
+    parser.add_argument("--http-auth")
+    return parser.parse_args()
+
+
+def build_sel(strategy, max_terms, elastic=None):
+    conf = config.read()
+    conf["Queries"]["LargeTermsStrategy"] = strategy
+    conf["Queries"]["MaxTermsCount"] = str(max_terms)
+    conf["Queries"]["MaxInValues"] = "0"
+    conf["Queries"]["PlanCacheSize"] = "0"
+    return SEL(elastic, conf=conf, log_level=logging.ERROR)
+
+
+def timings(field, size, strategy, max_terms, schema=None, index=None, elastic=None):
+    """ Timings in milliseconds of generating, and searching if elastic is given, a large list """
+    sel = build_sel(strategy, max_terms, elastic=elastic)
+    query = {"query": {"field": field, "comparator": "in", "value": [str(i) for i in range(size)]}}
+
+    start = time.perf_counter()
+    sel.generate_query(query, schema=schema, index=index)
+    result = {"generate": (time.perf_counter() - start) * 1000}
+
+    if elastic is not None:
+        start = time.perf_counter()
+        response = sel.search(index, query)
+        result["search"] = (time.perf_counter() - start) * 1000
+        result["took"] = response["results"]["took"]
+
+    return result
+
+
+if __name__ == "__main__":
+    args = options()
+
+    schema = None
+    if args.schema:
+        with open(args.schema, "r") as fd:
+            schema = json.load(fd)
+
+    elastic = None
+    if args.index:
+        elastic = elastic_connect(hosts=args.hosts, http_auth=args.http_auth)
+
+    for size in args.sizes:
+        for strategy in STRATEGIES:
+            try:
+                result = timings(args.field, size, strategy, args.max_terms,
+                                 schema=schema, index=args.index, elastic=elastic)
+                result = ", ".join(f"{k}: {v:.1f}ms" for k, v in result.items())
+            except Exception as exc:
+                result = f"error: {exc}"
+            print(f"{size} values, {strategy}: {result}")
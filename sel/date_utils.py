@@ -1,6 +1,7 @@
 import re
 import time
 import datetime
+import functools
 from dateutil.relativedelta import relativedelta
 from .utils import InvalidClientInput
 
@@ -14,6 +15,24 @@ DATE_FORMAT = {
     "second":  "%Y-%m-%d %H:%M:%S",
 }
 
+# Dates of DATE_FORMAT formats, the number of groups found gives the format
+DATE_REGEX = re.compile(
+    r"(\d{4})(?:-(\d{1,2})(?:-(\d{1,2})(?:\s+(\d{1,2})(?::(\d{1,2})(?::(\d{1,2}))?)?)?)?)?"
+)
+
+# Date format by number of date elements
+DATE_FORMAT_BY_ELEMENTS = list(DATE_FORMAT.values())
+
+# strftime directives of DATE_FORMAT, as str.format fields of a datetime
+STRFTIME_FIELDS = {
+    "%Y": "{0.year:04d}",
+    "%m": "{0.month:02d}",
+    "%d": "{0.day:02d}",
+    "%H": "{0.hour:02d}",
+    "%M": "{0.minute:02d}",
+    "%S": "{0.second:02d}",
+}
+
 ELASTIC_TO_DATETIME_FORMAT_TABLE = [
     {"from": "yyyy", "to": r"%Y"},
     {"from": "MM",   "to": r"%m"},
@@ -58,6 +77,7 @@ INTERVAL_DATE_FORMAT = {
     "minute":  DATE_FORMAT["minute"],
     "second":  DATE_FORMAT["second"],
 }
+@functools.lru_cache(maxsize=256)
 def date_format_from_interval(interval):
     """
     Avoid to display too low date element if not necessary.
@@ -103,14 +123,42 @@ def date_add_to_last_element(date, value, date_format):
 
     raise InvalidClientInput(f"Invalid date format: '{date}'")
 
+@functools.lru_cache(maxsize=4096)
 def str_date_to_datetime(str_date):
-    for date_format in DATE_FORMAT.values():
-        try:
-            return datetime.datetime.strptime(str_date, date_format), date_format
-        except ValueError:
-            pass
+    """
+    Datetime and format of a date of one of DATE_FORMAT formats,
+    the format is detected by one regex match. Results are cached, datetimes are immutable
+    """
+    match = DATE_REGEX.fullmatch(str_date)
+    if match is None:
+        raise InvalidClientInput(f"Invalid date format: {str_date}")
+
+    elements = [int(e) for e in match.groups() if e is not None]
+    try:
+        date = datetime.datetime(*(elements + [1] * (3 - len(elements))))
+    except ValueError:
+        raise InvalidClientInput(f"Invalid date format: {str_date}")
+
+    return date, DATE_FORMAT_BY_ELEMENTS[len(elements) - 1]
+
+
+@functools.lru_cache(maxsize=256)
+def date_formatter(date_format):
+    """
+    Function formatting a datetime as strftime with date_format, compiled once by format
+    Shared by query generation and results formatting
+    """
+    if not re.fullmatch(r"[^%]*(?:%[YmdHMS][^%]*)*", date_format):
+        return lambda date: date.strftime(date_format)
+
+    template = date_format.replace("{", "{{").replace("}", "}}")
+    template = re.sub(r"%[YmdHMS]", lambda m: STRFTIME_FIELDS[m.group(0)], template)
+    return template.format
+
 
-    raise InvalidClientInput(f"Invalid date format: {str_date}")
+def format_date(date, date_format):
+    """ Datetime as string of date_format, see date_formatter """
+    return date_formatter(date_format)(date)
 
 
 def month_to_datetime(date):
@@ -128,14 +176,16 @@ def first_day_of_next_month(d):
     return next_month - datetime.timedelta(days=(next_month.day - 1))
 
 def add_months(d, months):
-    for i in range(0, months):
-        d = first_day_of_next_month(d)
-    return d
+    """ First day of the month <months> after d, d if months is not positive """
+    if months <= 0:
+        return d
+    return first_day_of_month(d) + relativedelta(months=months)
 
 def remove_months(d, months):
-    for i in range(0, months):
-        d = first_day_of_month(first_day_of_month(d) - datetime.timedelta(days=1))
-    return d
+    """ First day of the month <months> before d, d if months is not positive """
+    if months <= 0:
+        return d
+    return first_day_of_month(d) - relativedelta(months=months)
 
 def last_day_of_month(d):
     return add_months(d, 1) - datetime.timedelta(1)
@@ -0,0 +1,89 @@
+"""
+Cache of generated queries, the plans, by schema fingerprint and canonical query object
+
+A plan is a result of SEL.generate_query. Its key holds the fingerprint of the schema,
+the query object, no_deleted and the configuration values read by the generation,
+then a plan is only reused for the same inputs. Plans of a schema are dropped when it changes.
+"""
+import json
+import copy
+
+from .utils import LRUCache
+
+
+# Configuration values read by query generation, and by the schema reader for query fields
+CONF_KEYS = {
+    "Queries": [
+        "AutoSort", "DefaultExcludeDeletedDocuments", "DefaultObjectSortField",
+        "DefaultObjectSubfield", "DefaultQueryStringFieldPath", "FilterContext",
+        "LargeTermsStrategy", "MaxTermsCount", "OptimizeQueries", "TermsLookupIndex", "TimeZone"
+    ],
+    "Aggregations": ["DefaultSize", "DefaultDateInterval"],
+}
+
+
+class PlanCache:
+    """
+    Thread safe cache of generated queries, least recently used plans are evicted first
+
+    :param max_size: Maximum number of plans, 0 to disable
+    """
+
+    def __init__(self, max_size):
+        self.plans = LRUCache(max_size)
+
+
+    def get(self, conf, fingerprint, query_obj, no_deleted, generator):
+        """
+        Plan of a query object, call generator to get it on missing plan
+        Returned plans are copies, free to be modified
+        """
+        key = plan_key(conf, fingerprint, query_obj, no_deleted)
+        if key is None:
+            return generator()
+        return thaw(self.plans.get(key, lambda: freeze(generator())))
+
+
+    def drop(self, fingerprint):
+        """ Remove plans of a schema fingerprint """
+        self.plans.discard(lambda key: key[0] == fingerprint)
+
+
+    def stats(self):
+        return self.plans.stats()
+
+
+def plan_key(conf, fingerprint, query_obj, no_deleted):
+    """ Key of the plan of a query object, None if it can not be cached """
+    # Random sort without seed is seeded by the current time
+    for sort in query_obj.get("sort") or []:
+        if isinstance(sort, dict) and sort.get("field") == "random" and "seed" not in sort:
+            return None
+
+    try:
+        canonical = json.dumps(query_obj, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+    values = tuple(
+        conf.get(section, key, raw=True, fallback=None)
+        for section, keys in CONF_KEYS.items() for key in keys
+    )
+    return fingerprint, canonical, no_deleted, values
+
+
+def freeze(plan):
+    """ Plan to store, as JSON if it is the same once decoded, faster to copy than objects """
+    try:
+        dump = json.dumps(plan)
+        if json.loads(dump) == plan:
+            return True, dump
+    except (TypeError, ValueError):
+        pass
+    return False, plan
+
+
+def thaw(stored):
+    """ Copy of a stored plan """
+    is_json, plan = stored
+    return json.loads(plan) if is_json else copy.deepcopy(plan)
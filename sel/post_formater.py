@@ -1,4 +1,3 @@
-from datetime import datetime
 from . import utils, date_utils
 
 
@@ -95,10 +94,11 @@ class PostFormater(object):
         Warning: Modify warns without returning it
         """
         date_format = date_utils.date_format_from_interval(aggreg_data["aggreg"]["interval"])
+        formatter = date_utils.date_formatter(date_format)
 
         for bucket in data["buckets"]:
             start = timestamp_to_datetime(bucket["key"])
-            bucket["key_as_string"] = datetime.strftime(start, date_format)
+            bucket["key_as_string"] = formatter(start)
 
         return data["buckets"]
 
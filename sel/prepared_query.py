@@ -0,0 +1,218 @@
+"""
+Prepared queries, generated once then bound to values
+
+A prepared query holds placeholders: filter values "$name", eg. "author = $name and date >= $from".
+It is generated once, each filter holding placeholders leaves a slot in the Elasticsearch query.
+Binding values only builds the clauses of these filters, their fields are already resolved,
+then copies the containers from the query root to the slots.
+Slots are kept by the query optimizer, bound clauses are not merged with their siblings.
+"""
+import re
+
+from . import query_ast, query_budget
+from .query_generator import QueryGenerator, large_terms_warnings
+from .utils import InvalidClientInput
+
+
+PLACEHOLDER = re.compile(r"\$[A-Za-z_]\w*")
+
+
+class Placeholder(str):
+    """ Placeholder of a filter value, the string "$name" """
+
+    @property
+    def name(self):
+        return self[1:]
+
+
+class PreparingGenerator(QueryGenerator):
+    """
+    QueryGenerator leaving a slot for each filter clause holding placeholders
+
+    slots are tuples (clause, (group_nested, field, comparator, value)),
+    the clause is the slot dictionary, the rest the format_filter_clause arguments.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slots = []
+
+
+    def format_query_exists(self, nested, field, query):
+        if placeholders_of(query["value"]):
+            raise InvalidClientInput(f"exists: '{field['str_path']}' can not use a placeholder")
+        return super().format_query_exists(nested, field, query)
+
+
+    def format_filter_clause(self, group_nested, field, comparator, value, terms_lookups=None):
+        names = placeholders_of(value)
+        if not names:
+            return super().format_filter_clause(
+                group_nested, field, comparator, value, terms_lookups=terms_lookups
+            )
+
+        clause = {"placeholders": sorted(names), "slot": len(self.slots)}
+        self.slots.append((clause, (group_nested, field, comparator, value)))
+        return clause
+
+
+class PreparedQuery:
+    """
+    SEL query generated once, to bind to values of its placeholders
+
+    :param sel: SEL instance
+    :param reader: SchemaReader of the index(es) schema
+    :param query_obj: SEL query object, see SEL._to_queryobject
+    :param no_deleted: True to filter out deleted documents (if configured to)
+    """
+
+    def __init__(self, sel, reader, query_obj, no_deleted=True):
+        self.conf = sel.conf
+        self.limits = sel.query_limits
+        self.generator = PreparingGenerator(
+            sel.conf, reader.schema, log_level=sel.log_level, schema_reader=reader
+        )
+        self.template = sel._generate_query(
+            with_placeholders(query_obj), reader, no_deleted, generator=self.generator
+        )
+        self.names = placeholders_of(self.template["internal_query"])
+        self.data_placeholders = bool(placeholders_of(self.template["query_data"]))
+
+        self.slots = [args for _, args in self.generator.slots]
+        markers = {id(clause): index for index, (clause, _) in enumerate(self.generator.slots)}
+        self.spine = build_spine(self.template["elastic_query"], markers)
+
+
+    @property
+    def parameters(self):
+        """ Filters of each placeholder name, as field path, field type and comparator """
+        parameters = {name: [] for name in self.names}
+        for _, field, comparator, value in self.slots:
+            parameter = {
+                "field": field["pretty_str_path"],
+                "type": field["element"]["type"],
+                "comparator": comparator
+            }
+            for name in placeholders_of(value):
+                if parameter not in parameters[name]:
+                    parameters[name].append(parameter)
+        return parameters
+
+
+    def bind(self, values=None, **kwargs):
+        """
+        Generated query with the placeholders replaced by values
+        Containers of elastic_query are shared with the prepared query out of the path
+        from the root to the filters of placeholders, they must not be modified.
+        Bound values are checked against the query budget and warned about as generate_query does.
+        Thread safe, a prepared query can be bound by concurrent callers
+
+        :param values: Value by placeholder name, kwargs are added to them
+        :return: Dictionary warns, elastic_query, internal_query, query_data, see SEL.generate_query.
+                 The query of elastic_query matches the same documents as the generated one,
+                 without merging bound clauses by the query optimizer
+        """
+        values = dict(values, **kwargs) if values else kwargs
+        if values.keys() != self.names:
+            missing = ", ".join(sorted(self.names - values.keys()))
+            unknown = ", ".join(sorted(values.keys() - self.names))
+            raise InvalidClientInput(
+                f"Prepared query values mismatch, missing: [{missing}], unknown: [{unknown}]"
+            )
+
+        warns = list(self.template["warns"])
+        terms_lookups = {}
+        clauses = []
+        warned = set()
+        for group_nested, field, comparator, template_value in self.slots:
+            value = substitute(template_value, values)
+            query_budget.check_query({"query": {"comparator": comparator, "value": value}}, **self.limits)
+
+            # A filter also used by an auto sort has a slot for each, it is warned once
+            if comparator == "in" and isinstance(value, (list, tuple)) and id(template_value) not in warned:
+                warned.add(id(template_value))
+                warns += large_terms_warnings(self.conf, field["str_path"], len(value))
+
+            clauses.append(self.generator.format_filter_clause(
+                group_nested, field, comparator, value, terms_lookups=terms_lookups
+            ))
+
+        query_data = self.template["query_data"]
+        if self.data_placeholders:
+            query_data = substitute(query_data, values)
+        if terms_lookups:
+            query_data = dict(
+                query_data, terms_lookup={**query_data.get("terms_lookup", {}), **terms_lookups}
+            )
+
+        return {
+            "warns": warns,
+            "elastic_query": fill(self.template["elastic_query"], self.spine, clauses),
+            "internal_query": substitute(self.template["internal_query"], values),
+            "query_data": query_data
+        }
+
+
+def with_placeholders(obj, in_value=False):
+    """ Frozen query object with its "$name" filter values as Placeholder """
+    if isinstance(obj, dict):
+        return query_ast.Node(
+            (k, with_placeholders(v, in_value or (k == "value" and "field" in obj)))
+            for k, v in obj.items()
+        )
+    if isinstance(obj, (list, tuple)):
+        return tuple(with_placeholders(v, in_value) for v in obj)
+    if in_value and isinstance(obj, str) and PLACEHOLDER.fullmatch(obj):
+        return Placeholder(obj)
+    return obj
+
+
+def placeholders_of(obj):
+    """ Placeholder names in obj """
+    if isinstance(obj, Placeholder):
+        return {obj.name}
+    if isinstance(obj, dict):
+        obj = list(obj.values())
+    if isinstance(obj, (list, tuple)):
+        return set().union(*[placeholders_of(v) for v in obj])
+    return set()
+
+
+def substitute(obj, values):
+    """ Copy of obj with placeholders replaced by their values """
+    if isinstance(obj, Placeholder):
+        return values[obj.name]
+    if isinstance(obj, dict):
+        return {k: substitute(v, values) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [substitute(v, values) for v in obj]
+    return obj
+
+
+def build_spine(body, markers):
+    """
+    Tree of the keys from body root to marker dictionaries, found by identity
+    Leaves are indexes of markers
+    """
+    spine = {}
+    stack = [(body, ())]
+    while stack:
+        obj, path = stack.pop()
+        if id(obj) in markers:
+            node = spine
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = markers[id(obj)]
+        elif isinstance(obj, dict):
+            stack += [(v, path + (k,)) for k, v in obj.items()]
+        elif isinstance(obj, list):
+            stack += [(v, path + (i,)) for i, v in enumerate(obj)]
+    return spine
+
+
+def fill(obj, spine, clauses):
+    """ Copy of obj containers along spine, with clauses at its leaves """
+    obj = list(obj) if isinstance(obj, list) else dict(obj)
+    for key, sub in spine.items():
+        obj[key] = clauses[sub] if isinstance(sub, int) else fill(obj[key], sub, clauses)
+    return obj
@@ -0,0 +1,93 @@
+"""
+Immutable query trees, the internal form of SEL query objects
+
+The parser and the object query path both produce frozen trees: dictionaries are Node,
+lists are tuples. Trees are shared instead of copied, a change builds a new node
+which keeps the unchanged children. Nodes are hashable, by structure.
+"""
+
+SCALARS = (str, int, float, bool, type(None))
+
+
+class Node(dict):
+    """
+    Frozen query object dictionary, read it as a dictionary
+
+    Mutations raise TypeError, use replace and without to get a changed node.
+    Copies are the node itself.
+    """
+
+    __slots__ = ("_hash",)
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        object.__setattr__(self, "_hash", None)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"Node is immutable, can not set '{key}'")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"Node is immutable, can not delete '{key}'")
+
+    def __immutable(self, *args, **kwargs):
+        raise TypeError("Node is immutable, use replace or without to change it")
+
+    __setitem__ = __delitem__ = __immutable
+    clear = pop = popitem = setdefault = update = __ior__ = __immutable
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, "_hash", hash(frozenset(self.items())))
+        return self._hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    def __repr__(self):
+        return f"Node({dict.__repr__(self)})"
+
+    def replace(self, **changes):
+        """ New node with changed values, changes are frozen """
+        values = dict(self)
+        for key, value in changes.items():
+            values[key] = freeze(value)
+        return Node(values)
+
+    def without(self, *keys):
+        """ New node without keys """
+        return Node((k, v) for k, v in self.items() if k not in keys)
+
+
+def freeze(obj):
+    """ Frozen tree of a query object, dictionaries to Node, lists to tuples """
+    if isinstance(obj, Node):
+        return obj
+    if isinstance(obj, dict):
+        return Node((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        if all_scalars(obj):
+            return tuple(obj)
+        return tuple(freeze(v) for v in obj)
+    return obj
+
+
+def thaw(obj):
+    """ Mutable copy of a frozen tree, Node to dictionaries, tuples to lists """
+    if isinstance(obj, dict):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        if all_scalars(obj):
+            return list(obj)
+        return [thaw(v) for v in obj]
+    return obj
+
+
+def all_scalars(items):
+    """ Are items all scalars, eg. values of an "in" filter, copied without recursion """
+    return all(isinstance(v, SCALARS) for v in items)
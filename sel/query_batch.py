@@ -0,0 +1,75 @@
+"""
+Generation of query batches, spread over a pool of processes
+
+Parsing and generation are CPU bound, so a batch is split in chunks generated by worker
+processes. Each worker receives the configuration and the compiled schema once, at its start.
+Queries generated by a process share one QueryGenerator, and its SchemaReader field resolutions.
+"""
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+from .schema_reader import SchemaReader
+from .query_generator import QueryGenerator
+
+
+# Chunks by worker, more chunks balance better the load of workers
+CHUNKS_BY_WORKER = 4
+
+# SEL instance, SchemaReader and QueryGenerator of the worker process, see init_worker
+_worker = None
+
+
+def generate(sel, reader, queries, no_deleted=True, workers=None):
+    """
+    Generate queries with sel on the schema of reader, in order
+
+    :param workers: Number of processes, default: number of CPUs, 1 to generate in this process
+    :return: List of generate_query results, or {"error": {"type", "message"}} for failed queries
+    """
+    queries = list(queries)
+    workers = min(workers or os.cpu_count() or 1, len(queries))
+
+    if workers <= 1:
+        generator = build_generator(sel, reader)
+        return [generate_one(sel, reader, query, no_deleted, generator) for query in queries]
+
+    size = -(-len(queries) // (workers * CHUNKS_BY_WORKER))
+    chunks = [queries[i:i + size] for i in range(0, len(queries), size)]
+    initargs = (type(sel), sel.conf, sel.log_level, reader.schema, reader.index)
+
+    results = []
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=initargs) as pool:
+        for chunk in pool.map(generate_chunk, chunks, itertools.repeat(no_deleted)):
+            results += chunk
+    return results
+
+
+def generate_one(sel, reader, query, no_deleted, generator=None):
+    """ generate_query result of one query, errors are returned as result """
+    try:
+        query_obj = sel._to_queryobject(query)
+        return sel._plan_query(
+            query_obj, no_deleted, reader.get_fingerprint(), lambda: reader, generator=generator
+        )
+    except Exception as exc:
+        return {"error": {"type": type(exc).__name__, "message": str(exc)}}
+
+
+def init_worker(sel_class, conf, log_level, schema, schema_index):
+    """ Build SEL and SchemaReader of a worker process, without Elasticsearch connection """
+    global _worker
+    reader = SchemaReader(conf, schema, use_index=schema_index is not None,
+                          schema_index=schema_index)
+    sel = sel_class(None, conf=conf, log_level=log_level)
+    _worker = (sel, reader, build_generator(sel, reader))
+
+
+def generate_chunk(queries, no_deleted):
+    sel, reader, generator = _worker
+    return [generate_one(sel, reader, query, no_deleted, generator) for query in queries]
+
+
+def build_generator(sel, reader):
+    """ QueryGenerator shared by the queries of a batch """
+    return QueryGenerator(sel.conf, reader.schema, log_level=sel.log_level, schema_reader=reader)
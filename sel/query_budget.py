@@ -0,0 +1,117 @@
+"""
+Complexity budget of queries, to bound parsing and generation cost of a single query
+
+- max_tokens: tokens of a query string, or filters, aggregations and sorts of a query object
+- max_group_depth: nesting depth of groups, "not" and "where" queries
+- max_in_values: values of an "in" / "nin" filter
+- max_subaggreg_depth: nesting depth of subaggregations
+- max_literal_length: characters of a value of a query string, see MaxLiteralLength
+
+A limit of 0 disables its check. Query strings are checked while parsed by
+query_string_descent, query objects and query strings parsed by other parsers by check_query.
+"""
+from .utils import InvalidClientInput
+
+
+LIMITS = {
+    "max_tokens": "MaxTokens",
+    "max_group_depth": "MaxGroupDepth",
+    "max_in_values": "MaxInValues",
+    "max_subaggreg_depth": "MaxSubaggregDepth",
+}
+
+MESSAGES = {
+    "max_tokens": "more than {limit} tokens",
+    "max_group_depth": "groups nested deeper than {limit} levels",
+    "max_in_values": "more than {limit} values in an 'in' list",
+    "max_subaggreg_depth": "subaggregations nested deeper than {limit} levels",
+    "max_literal_length": "value longer than {limit} characters",
+}
+
+
+def read_limits(conf):
+    """ Budget limits from [Queries] section of the configuration """
+    return {name: conf["Queries"].getint(key) for name, key in LIMITS.items()}
+
+
+def over_budget(name, limit, pos=None):
+    """ Raise InvalidClientInput for the exceeded limit <name>, pos: [line, global position] """
+    str_pos = f" at line {pos[0]}, global position {pos[1]}" if pos else ""
+    message = MESSAGES[name].format(limit=limit)
+    if name == "max_tokens" and pos is None:
+        message = f"more than {limit} filters, aggregations and sorts"
+    raise InvalidClientInput(f"Query too complex{str_pos}: {message}.")
+
+
+def check_query(query, max_tokens=0, max_group_depth=0, max_in_values=0, max_subaggreg_depth=0,
+                max_literal_length=0):
+    """
+    Check complexity of a query object, raise InvalidClientInput if over budget
+    Malformed parts are ignored, they are reported by the query generator
+    """
+    if not isinstance(query, dict):
+        return
+
+    elements = 0
+    queries = [(query.get("query"), 1)]
+
+    aggregs = [(a, 0) for a in values_of(query.get("aggregations"))]
+    while aggregs:
+        aggreg, depth = aggregs.pop()
+        if max_subaggreg_depth and depth > max_subaggreg_depth:
+            over_budget("max_subaggreg_depth", max_subaggreg_depth)
+
+        elements += 1
+        queries.append((aggreg.get("where"), 1))
+        aggregs += [(a, depth + 1) for a in values_of(aggreg.get("subaggreg"))]
+
+    for sort in query.get("sort") or []:
+        if isinstance(sort, dict):
+            elements += 1
+            queries.append((sort.get("where"), 1))
+
+    while queries:
+        item, depth = queries.pop()
+        if not isinstance(item, dict):
+            continue
+
+        if max_group_depth and depth > max_group_depth:
+            over_budget("max_group_depth", max_group_depth)
+
+        if isinstance(item.get("items"), (list, tuple)):
+            queries += [(i, depth + 1 if is_group(i) else depth) for i in item["items"]]
+            continue
+
+        if "not" in item:
+            queries.append((item["not"], depth + 1))
+            continue
+
+        elements += 1
+        if max_tokens and elements > max_tokens:
+            over_budget("max_tokens", max_tokens)
+
+        value = item.get("value")
+        if max_in_values and item.get("comparator") in ["in", "nin"] \
+           and isinstance(value, (list, tuple)) and len(value) > max_in_values:
+            over_budget("max_in_values", max_in_values)
+
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if max_literal_length \
+           and any(isinstance(v, str) and len(v) > max_literal_length for v in values):
+            over_budget("max_literal_length", max_literal_length)
+
+        queries.append((item.get("where"), depth + 1))
+
+    if max_tokens and elements > max_tokens:
+        over_budget("max_tokens", max_tokens)
+
+
+def values_of(aggregations):
+    """ Aggregations of a name -> aggregation dictionary """
+    if not isinstance(aggregations, dict):
+        return []
+    return [a for a in aggregations.values() if isinstance(a, dict)]
+
+
+def is_group(item):
+    return isinstance(item, dict) and isinstance(item.get("items"), (list, tuple))
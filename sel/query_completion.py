@@ -0,0 +1,157 @@
+"""
+Autocomplete of query strings, keystroke after keystroke
+
+The query is parsed until the cursor by the descent parser, tokens it tries at the cursor
+are the expected ones. Parse states of the previous text are kept: the parse of the next
+text resumes from the last top level element, aggregation or sort of their common prefix,
+then from the last element of each bracketed group parsed again.
+"""
+import re
+import bisect
+import threading
+
+from .query_string_descent import (
+    DescentParser, KEYWORDS, COMPARATOR, NUMERICAL_COMPARATOR, NAME, INTEGER, FIELD_PATH, WORD,
+    UNQUOTED_VALUE, LEFT_BRACKET, RIGHT_BRACKET, LEFT_PARENTHESIS, RIGHT_PARENTHESIS, COMMA, COLON
+)
+from .query_string_parser import unexpect_manager
+from .utils import InvalidClientInput
+
+
+# Characters of the token being typed at the cursor, value like or comparator
+TOKEN_CHARACTERS = [re.compile(r"[\w\-\.\#\@\$/*]"), re.compile(r"[!<>=~]")]
+
+# Kinds of expected tokens, with the regex a partial token must match
+KINDS = {
+    "<field>": FIELD_PATH,
+    "<value>": UNQUOTED_VALUE,
+    "<quoted>": None,
+    "<name>": NAME,
+    "<integer>": INTEGER,
+    "<word>": WORD,
+}
+
+EXPECTED_TOKENS = {
+    COMPARATOR: ["=", "!=", "~", "!~", ">", ">=", "<", "<="],
+    NUMERICAL_COMPARATOR: [">", ">=", "<", "<="],
+    LEFT_BRACKET: ["["],
+    RIGHT_BRACKET: ["]"],
+    LEFT_PARENTHESIS: ["("],
+    RIGHT_PARENTHESIS: [")"],
+    COMMA: [","],
+    COLON: [":"],
+    FIELD_PATH: ["<field>"],
+    UNQUOTED_VALUE: ["<value>"],
+    NAME: ["<name>"],
+    INTEGER: ["<integer>"],
+    WORD: ["<word>"],
+}
+EXPECTED_TOKENS = {(r.pattern, r.flags): tokens for r, tokens in EXPECTED_TOKENS.items()}
+EXPECTED_TOKENS.update({(r.pattern, r.flags): [word] for word, r in KEYWORDS.items()})
+EXPECTED_TOKENS["quoted"] = ["<quoted>"]
+
+
+class QueryCompleter:
+    """
+    Autocomplete of a query string being typed, thread safe
+
+    :param limits: Parse limits, see query_string_descent.parse
+    """
+
+    def __init__(self, **limits):
+        self.limits = limits
+        self.text = ""
+        self.checkpoints = []
+        self.resumed_at = 0
+        self._lock = threading.Lock()
+
+
+    def complete(self, query_string, cursor=None, schema_reader=None, size=10):
+        """
+        Expected tokens at the cursor and parse error of the query until the cursor
+
+        :param query_string: Query string being typed
+        :param cursor: Cursor position, default: end of the query string
+        :param schema_reader: SchemaReader to complete field paths
+        :param size: Maximum number of field paths
+        :return: Dictionary
+                 - token: partial token before the cursor, completions start with it
+                 - expected: expected keywords, symbols and kinds of token, eg. "<field>"
+                 - fields: field paths starting with the token, if a field is expected
+                 - error: parse error of the query until the cursor, None if valid
+        """
+        text = query_string if cursor is None else query_string[:cursor]
+        token = partial_token(text)
+        token_start = len(text) - len(token)
+
+        with self._lock:
+            parser, error = self.__parse(text, None if token else len(text))
+            self.text, self.checkpoints = text, parser.checkpoints
+
+            # Tokens expected before the partial one, resumed from the parse above
+            if token:
+                parser, _ = self.__parse(text[:token_start], token_start)
+
+        expected = []
+        for key in parser.scanner.expected:
+            expected += [t for t in EXPECTED_TOKENS[key] if t not in expected and completes(t, token)]
+
+        fields = []
+        if schema_reader is not None and "<field>" in expected:
+            fields = schema_reader.complete_field(token, size=size)
+
+        return {"token": token, "expected": expected, "fields": fields, "error": error}
+
+
+    def __parse(self, text, expect_at):
+        """ Parse text, resumed from a checkpoint of the previous text, return parser and error """
+        parser = DescentParser(text, **self.limits)
+        parser.scanner.expect_at = expect_at
+
+        common = common_prefix_length(self.text, text)
+        examined = [c["examined"] for c in self.checkpoints]
+        position = bisect.bisect_right(examined, common)
+
+        parser.checkpoints = []
+        parser.resume_from(self.checkpoints[:position])
+
+        try:
+            parser.query()
+            error = unexpect_manager(text, parser.scanner.remaining())
+        except InvalidClientInput as exc:
+            error = exc.message
+
+        self.resumed_at = parser.resumed_at
+        return parser, error
+
+
+def partial_token(text):
+    """ Token being typed at the end of text, read backward to not scan the whole text """
+    for characters in TOKEN_CHARACTERS:
+        start = len(text)
+        while start > 0 and characters.match(text, start - 1):
+            start -= 1
+        if start < len(text):
+            return text[start:]
+    return ""
+
+
+def completes(expected, token):
+    """ True if the expected token can complete the partial token """
+    if expected not in KINDS:
+        return expected.startswith(token.lower())
+    if not token:
+        return True
+    return KINDS[expected] is not None and KINDS[expected].fullmatch(token) is not None
+
+
+def common_prefix_length(first, second):
+    """ Length of the common prefix of two strings, by bisection of string comparisons """
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[:middle] == second[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
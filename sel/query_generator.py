@@ -1,11 +1,10 @@
 import json
-import copy
 import time
-import datetime
+import hashlib
 import re
 import logging
 
-from . import schema_reader, utils, date_utils
+from . import schema_reader, utils, date_utils, query_ast, query_optimizer
 from .schema_reader import SchemaReader
 from .utils import InternalServerError, InvalidClientInput
 
@@ -30,17 +29,30 @@ EXTENDED_QUERY_KEYS = [
     "version", "indices_boost", "min_score"
 ]
 
+# Extended query keys using the score of hits
+SCORING_QUERY_KEYS = ["min_score", "rescore"]
+
+# Filter of deleted documents, added by SEL to queries, never auto sorted
+# Found by identity, a user filter equal to it is auto sorted
+DELETED_FILTER = query_ast.freeze({"field": ".deleted", "comparator": "!=", "value": True})
+
+# Sort field of index order, cheapest order for scroll and bulk operations
+DOC_SORT_FIELD = "_doc"
+
 COMPARATORS_MAPPING = {">": "gt", ">=": "gte", "<": "lt", "<=": "lte", "=": "eq"}
 
 
 class QueryGenerator:
 
-    def __init__(self, conf, schema, log_level=logging.INFO):
+    def __init__(self, conf, schema, log_level=logging.INFO, schema_reader=None):
         self.logger = logging.getLogger("query_generator")
         self.logger.setLevel(log_level)
 
         self.conf = conf
-        self.schema_reader = SchemaReader(conf, schema)
+        self.schema_reader = schema_reader if schema_reader else SchemaReader(conf, schema)
+
+        # Values of terms lookup documents by id, of the query being generated, see format_terms
+        self.terms_lookups = {}
 
 
 ################################################################################
@@ -52,9 +64,9 @@ class QueryGenerator:
         Build exists function query
         """
         value = to_boolean(field["str_path"], query["value"])
-        query["comparator"] = query.get("comparator", "=")
+        comparator = query.get("comparator", "=").lower()
 
-        if query["comparator"] != "=":
+        if comparator != "=":
             raise InvalidClientInput(f"exists: '{field['str_path']}' may only use comparator = or !=")
         query = format_nested_query(nested, {"exists": {"field": field["str_path"]}})
         if value == False:
@@ -68,56 +80,76 @@ class QueryGenerator:
         """
         field = self.schema_reader.get_field_info(item["field"], functions=True, nested=group_nested)
         nested = field["nested"] if field["str_nested"] != group_nested else None
-        item["comparator"] = item.get("comparator", "=").lower()
+        comparator = item.get("comparator", "=").lower()
         value = item["value"]
 
         if field["function"] == "exists":
             return field["str_path"], self.format_query_exists(nested, field, item)
 
-        if item["comparator"] == "in" and not isinstance(value, list):
+        if comparator == "in" and isinstance(value, (list, tuple)):
+            warns += large_terms_warnings(self.conf, field["str_path"], len(value))
+
+        clause = self.format_filter_clause(group_nested, field, comparator, value)
+        return field["str_path"], format_nested_query(nested, clause)
+
+
+    def format_filter_clause(self, group_nested, field, comparator, value, terms_lookups=None):
+        """
+        Build the clause of a filter on a resolved field, without its nested context
+        - check and convert the value to the field type
+        - terms lookup documents are added to terms_lookups, default: the generator ones
+        """
+        if comparator == "in" and not isinstance(value, (list, tuple)):
             raise InvalidClientInput("Value of in or nin comparator MUST be a list")
-        if item["comparator"] == "range" and not isinstance(value, dict):
+        if comparator == "range" and not isinstance(value, dict):
             raise InvalidClientInput("Value of range or nrange comparator MUST be a dict")
-        if item["comparator"] not in ["in", "range"] and isinstance(value, (list, dict)):
+        if comparator not in ["in", "range"] and isinstance(value, (list, tuple, dict)):
             raise InvalidClientInput("Value MUST be a string, int, float or boolean")
 
         field_type = field["element"]["type"]
+        if comparator == "in":
+            values = terms_values(field_type, value, field["str_path"])
+            return self.format_terms(field["str_path"], values, terms_lookups=terms_lookups)
+
         value = boolean_manager(field_type, value, field["str_path"])
         value = numerical_manager(field_type, value, field["str_path"])
 
-        if item["comparator"] == "=" and field_type != "date":
-            return field["str_path"], format_nested_query(nested, {"term": {field["str_path"]: value}})
+        if comparator == "=" and field_type != "date":
+            return {"term": {field["str_path"]: value}}
 
-        elif item["comparator"] == "~":
+        elif comparator == "~":
             if field_type not in ["keyword", "text"]:
                 raise InvalidClientInput(f"'{field['str_path']}' Only keyword and text fields may use such comparator ~ or !~")
-            return field["str_path"], format_nested_query(nested, self.format_query_string(group_nested, item, path=field["str_path"]))
-
-        elif item["comparator"] == "in":
-            return field["str_path"], format_nested_query(nested, {"terms": {field["str_path"]: value}})
+            return self.format_query_string(group_nested, {"value": value}, path=field["str_path"])
 
-        elif item["comparator"] == "prefix":
-            return field["str_path"], format_nested_query(nested, {"prefix": {field["str_path"]: value}})
+        elif comparator == "prefix":
+            return {"prefix": {field["str_path"]: value}}
 
         if not is_numerical(field_type):
-            raise InvalidClientInput(f"'{field['str_path']}' Only numerical field may use such comparator (range, >, >=, <, <=): {item['comparator']}")
+            raise InvalidClientInput(f"'{field['str_path']}' Only numerical field may use such comparator (range, >, >=, <, <=): {comparator}")
 
 
         if field_type == "date":
-            range_query = format_date_query(item["comparator"], value, self.conf["Queries"]["TimeZone"])
+            range_query = format_date_query(comparator, value, self.conf["Queries"]["TimeZone"])
 
         else:
-            if item["comparator"] == "range":
+            if comparator == "range":
                 range_query = {}
                 for sub_comparator, sub_value in value.items():
                     range_query[to_elastic_comparator(sub_comparator)] = sub_value
 
             else:
-                comparator_name = to_elastic_comparator(item["comparator"])
+                comparator_name = to_elastic_comparator(comparator)
                 range_query = {comparator_name: value}
 
 
-        return field["str_path"], format_nested_query(nested, {"range": {field["str_path"]: range_query}})
+        return {"range": {field["str_path"]: range_query}}
+
+
+    def format_terms(self, path, values, terms_lookups=None):
+        """ Build terms query of values, see format_terms function """
+        terms_lookups = self.terms_lookups if terms_lookups is None else terms_lookups
+        return format_terms(self.conf, path, values, terms_lookups)
 
 
     def format_where_query_filter(self, warns, group_nested, group_aggreg, item):
@@ -240,18 +272,18 @@ class QueryGenerator:
         """
         if not query:
             return {"match_all": {}} if top_level else None
-        if isinstance(query, list):
+        if isinstance(query, (list, tuple)):
             raise InvalidClientInput(f"Invalid query type: list\nQuery: {json.dumps(query)}")
 
         queries = []
         not_queries = []
         for item in query.get("items", [query]):
 
-            copy_item = copy.deepcopy(item)
+            filter_item = item
             if item.get("comparator", "") in NEGATIVE_COMPARATOR:
-                copy_item["comparator"] = item["comparator"][1:]
+                filter_item = query_ast.freeze(item).replace(comparator=item["comparator"][1:])
 
-            sub_query = self.__format_query_mapper(warns, copy_item, nested=nested,
+            sub_query = self.__format_query_mapper(warns, filter_item, nested=nested,
                                                    group_aggreg=group_aggreg)
             if sub_query is not None:
                 if item.get("comparator", "") in NEGATIVE_COMPARATOR:
@@ -303,36 +335,38 @@ class QueryGenerator:
         aggreg = aggreg_set_default_parameter(field, aggreg, self.conf)
 
         aggreg_data = {
-            "field": field,
+            "field": field.to_dict(),
             "query_field": schema_reader.path_to_pretty(field["query_field"]),
-            "aggreg": copy.deepcopy(aggreg)
+            "aggreg": query_ast.thaw(aggreg)
         }
 
-        if aggreg["size"] > 0:
-            aggreg["size"] += 1
+        size = aggreg["size"]
+        if size > 0:
+            size += 1
 
-        if aggreg["type"] not in AGGREG_TYPES:
+        aggreg_type = aggreg["type"]
+        if aggreg_type not in AGGREG_TYPES:
             raise InvalidClientInput(
                 f"aggreg: {path}, only {','.join(AGGREG_TYPES)} are allowed as aggregation type"
             )
 
-        query = {"terms": {"field": path, "size": aggreg["size"]}}
-        if aggreg["type"] != "aggreg":
+        query = {"terms": {"field": path, "size": size}}
+        if aggreg_type != "aggreg":
             aggreg_obj = {"field": path}
 
-            if aggreg["type"] in NUMERICAL_AGGREG_TYPES and \
+            if aggreg_type in NUMERICAL_AGGREG_TYPES and \
                not is_numerical(field["element"]["type"]):
                 raise InvalidClientInput(f"aggreg: {path}, only numerical fields might use such aggregation type")
 
-            if aggreg["type"] in AGGREG_TYPE_MAPPING:
-                aggreg["type"] = AGGREG_TYPE_MAPPING[aggreg["type"]]
+            if aggreg_type in AGGREG_TYPE_MAPPING:
+                aggreg_type = AGGREG_TYPE_MAPPING[aggreg_type]
 
-            if aggreg["type"] == "cardinality":
+            if aggreg_type == "cardinality":
                 aggreg_obj["precision_threshold"] = 40000
 
-            query = {aggreg["type"]: aggreg_obj}
+            query = {aggreg_type: aggreg_obj}
 
-        if aggreg["type"] == "histogram":
+        if aggreg_type == "histogram":
             ## aggreg: date is set to histogram in aggreg_set_default_parameter
             query = self.format_aggreg_histogram(path, field, aggreg.get("interval"))
         elif aggreg.get("interval") is not None:
@@ -399,7 +433,7 @@ class QueryGenerator:
         Warning: Modify warns without returning it
         """
         if aggreg.get("where"):
-            sub = copy.deepcopy(query)
+            sub = query
             sub_filter = self.format_query_group(warns, aggreg["where"],
                                                  nested=context_str_nested,
                                                  group_aggreg=True)
@@ -407,12 +441,12 @@ class QueryGenerator:
             query = {"filter": sub_filter, "aggs": {"sub": sub}}
 
             if query_data is not None:
-                where = copy.deepcopy(flatten_query(aggreg["where"]))
+                where = [query_ast.thaw(elm) for elm in flatten_query(aggreg["where"])]
                 for elm in where:
                     elm["field"] = self.schema_reader.get_field_info(
                         elm["field"],
                         nested=context_str_nested,
-                        functions=True)
+                        functions=True).to_dict()
                 query_data["where"] = where
 
         return query
@@ -531,6 +565,10 @@ class QueryGenerator:
         for item in sorts:
             self.logger.debug("sort: %s" % json.dumps(item))
 
+            if item["field"] == DOC_SORT_FIELD:
+                sorts_queries.append({DOC_SORT_FIELD: {"order": item.get("order", "asc").lower()}})
+                continue
+
             query = {
                 "order": item.get("order", "desc").lower(),
             }
@@ -593,12 +631,14 @@ class QueryGenerator:
         return sorts_queries
 
 
-    def auto_sort_generator(self, query):
+    def auto_sort_generator(self, query, query_data=None):
         """
         Generate auto-sorting in function of the query
           1. Flatten all filters out of groups and operators
           2. Forward where inside generated sort
-          3. Do sort on first 3 found fields
+          3. Do sort on first 3 found fields, except the deleted documents filter
+
+        Warning: Modify query_data without returning it
         """
         sub_properties = self.conf["Queries"]["DefaultObjectSortField"].split(",")
 
@@ -610,20 +650,20 @@ class QueryGenerator:
             if original_field.get("error"):
                 return None
 
-            copy_filter = copy.deepcopy(query_filter)
-            where = copy_filter
-            if "where" in copy_filter:
+            sub_filter = query_filter
+            where = query_filter
+            if "where" in query_filter:
 
-                if "value" not in copy_filter:
+                if "value" not in query_filter:
 
-                    while "where" in copy_filter and "value" not in copy_filter:
+                    while "where" in sub_filter and "value" not in sub_filter:
 
-                        copy_filter = copy_filter["where"]
-                        if copy_filter.get("items"):
-                            copy_filter = copy_filter["items"][0]
+                        sub_filter = sub_filter["where"]
+                        if sub_filter.get("items"):
+                            sub_filter = sub_filter["items"][0]
 
-                        if "field" in copy_filter:
-                            query_field = copy_filter["field"]
+                        if "field" in sub_filter:
+                            query_field = sub_filter["field"]
                             sub_field = self.schema_reader.get_field_info(
                                 query_field,
                                 sub_properties=sub_properties,
@@ -635,9 +675,8 @@ class QueryGenerator:
                 else:
                     where = {
                         "operator": "and",
-                        "items": [copy_filter] + [copy_filter["where"]]
+                        "items": [query_ast.freeze(query_filter).without("where"), query_filter["where"]]
                     }
-                    del copy_filter["where"]
 
             obj = {
                 "auto_sort": True,
@@ -650,7 +689,7 @@ class QueryGenerator:
             self.logger.debug("auto_sort: %s" % json.dumps(obj))
             return obj
 
-        flatten = flatten_query(query)
+        flatten = self.auto_sort_filters(flatten_query(query), query_data)
         new_auto_sorts = [gen_sort(q) for q in flatten if q.get("field")]
         return [s for s in new_auto_sorts[:3] if s is not None]
 
@@ -664,16 +703,96 @@ class QueryGenerator:
         return body
 
 
+################################################################################
+####### Simple queries
+################################################################################
+
+    def generate_simple_query(self, warns, data, query_data=None):
+        """
+        Short path of generate_query for a query of filters without where, joined by "and",
+        eg. a single filter and the deleted documents filter, without aggregation nor sort.
+        Return the same body than generate_query, None if the query is not simple
+
+        Warning: Modify warns and query_data without returning it
+        """
+        items = simple_filters(data)
+        if items is None:
+            return None
+
+        queries = []
+        not_queries = []
+        for item in items:
+            negative, filter_item = positive_filter(item)
+            _, query = self.format_query_filter(warns, None, filter_item)
+            (not_queries if negative else queries).append(query)
+
+        if len(queries) == 1 and len(not_queries) == 0:
+            body = {"query": queries[0]}
+        else:
+            es_query = {}
+            if queries:
+                es_query["must"] = queries
+            if not_queries:
+                es_query["must_not"] = not_queries
+            body = {"query": {"bool": es_query}}
+
+        # Same as auto_sort_generator then format_sorts, on filters without where
+        sorts = []
+        sub_properties = self.conf["Queries"]["DefaultObjectSortField"].split(",")
+        meta = data["meta"] if data.get("meta") else {}
+        auto_sorts = []
+        if self.conf["Queries"].getboolean("AutoSort") \
+           and not self.skip_auto_sort(meta, query_data):
+            auto_sorts = self.auto_sort_filters(items, query_data)[:3]
+
+        for item in auto_sorts:
+            field = self.schema_reader.get_field_info(item["field"], sub_properties=sub_properties,
+                                                      can_raise=False)
+            if field.get("error"):
+                continue
+
+            nested = field.get("str_nested")
+            if nested and self.schema_reader.get_field_info(nested).get("str_nested") != nested:
+                return None
+
+            sort = {"order": "desc"}
+            if nested:
+                sort["nested_path"] = nested
+
+            negative, filter_item = positive_filter(item)
+            _, where = self.format_query_filter([], nested, filter_item)
+            sort["nested_filter"] = {"bool": {"must_not": [where]}} if negative else where
+            sorts.append({field["str_path"]: sort})
+
+        if sorts:
+            body["sort"] = sorts
+
+        body = utils.set_if_exists(meta, body, ["from", "size"])
+        body["query"] = self.finalize_query(body)
+        return body
+
+
 ################################################################################
 ####### Generate Query
 ################################################################################
 
     def generate_query(self, warns, data):
         """
+        Generate the query body and query data of a query object,
+        data is read only, either a dictionary or a query_ast tree
+
         Warning: Modify warns without returning it
         """
-        data = copy.deepcopy(data)
-        self.logger.debug("input query: %s" % json.dumps(data))
+        data = query_ast.freeze(data)
+        query_data = {}
+        self.terms_lookups = {}
+
+        body = self.generate_simple_query(warns, data, query_data=query_data)
+        if body is not None:
+            return body, self.add_terms_lookups(query_data)
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("input query: %s" % json.dumps(data))
 
         query = data.get("query")
         meta = data["meta"] if data.get("meta") else {}
@@ -683,10 +802,11 @@ class QueryGenerator:
         sorts = data["sort"] if data.get("sort") else []
         sorts, auto_sort, random_seed = sort_query_controller(self.conf, sorts)
 
-        if auto_sort and not sorts:
-            sorts += self.auto_sort_generator(query)
+        if auto_sort and not sorts and not self.skip_auto_sort(meta, query_data):
+            sorts += self.auto_sort_generator(query, query_data=query_data)
+        elif any(sort["field"] == DOC_SORT_FIELD for sort in sorts):
+            query_data.setdefault("auto_sort", {})["skipped"] = "index order, sort: _doc"
 
-        query_data = {}
         body = {"query": self.format_query_group(warns, query, top_level=True)}
         if data.get("aggregations"):
             body["aggregations"] = self.format_aggregations(
@@ -695,13 +815,83 @@ class QueryGenerator:
         if sorts:
             body["sort"] = self.format_sorts(warns, sorts)
 
+        body = utils.set_if_exists(meta, body, ["from", "size"])
+        body["query"] = self.finalize_query(body, data.get("extended"), random_seed)
+
         if random_seed:
             body = self.build_random_sort(body, random_seed)
 
-        body = utils.set_if_exists(meta, body, ["from", "size"])
-        body = utils.set_if_exists(data.get("extended"), body, EXTENDED_QUERY_KEYS)
+        body = utils.set_if_exists(query_ast.thaw(data.get("extended")), body, EXTENDED_QUERY_KEYS)
+
+        return body, self.add_terms_lookups(query_data)
+
+
+    def add_terms_lookups(self, query_data):
+        """ Query data with the terms lookup documents of the generated query, if any """
+        if self.terms_lookups:
+            query_data["terms_lookup"] = {**query_data.get("terms_lookup", {}), **self.terms_lookups}
+            self.terms_lookups = {}
+        return query_data
+
+
+    def skip_auto_sort(self, meta, query_data=None):
+        """
+        Should auto sort be skipped, when its sorts are wasted: no hits returned
+        The reason is reported in query_data["auto_sort"]
+
+        Warning: Modify query_data without returning it
+        """
+        if not no_hits(meta):
+            return False
+
+        if query_data is not None:
+            query_data.setdefault("auto_sort", {})["skipped"] = "no hits returned, meta size is 0"
+        return True
 
-        return body, query_data
+
+    def auto_sort_filters(self, filters, query_data=None):
+        """
+        Filters to auto sort on, except the deleted documents filter added by SEL
+        Its exclusion is reported in query_data["auto_sort"]
+
+        Warning: Modify query_data without returning it
+        """
+        kept = [item for item in filters if item is not DELETED_FILTER]
+        if len(kept) < len(filters) and query_data is not None:
+            query_data.setdefault("auto_sort", {})["excluded"] = "deleted documents filter, .deleted != true"
+        return kept
+
+
+    def finalize_query(self, body, extended=None, random_seed=None):
+        """
+        Query of body in filter context and optimized, according to configuration
+        See FilterContext and OptimizeQueries
+        """
+        query = body["query"]
+        scored = is_scored(body, extended, random_seed)
+
+        if self.use_filter_context(scored, random_seed):
+            query = filter_context(query)
+
+        if self.conf["Queries"].getboolean("OptimizeQueries"):
+            max_terms = self.conf["Queries"].getint("MaxTermsCount")
+            query = query_optimizer.optimize(query, scored=scored, max_terms=max_terms)
+
+        return query
+
+
+    def use_filter_context(self, scored, random_seed=None):
+        """
+        Should the query be in filter context, according to FilterContext configuration
+        In auto mode, only if hits are not sorted by score
+        """
+        if random_seed:
+            return False
+
+        if self.conf["Queries"]["FilterContext"].lower() != "auto":
+            return self.conf["Queries"].getboolean("FilterContext")
+
+        return not scored
 
 
     def format_query_string(self, group_nested, query, path=None):
@@ -724,6 +914,38 @@ class QueryGenerator:
 ### Utils
 ################################################################################
 
+def is_scored(body, extended=None, random_seed=None):
+    """
+    Are hits scored: with random sort or scoring extended keys,
+    or hits are returned without sort
+    """
+    if random_seed or any(key in (extended or {}) for key in SCORING_QUERY_KEYS):
+        return True
+    return "sort" not in body and not no_hits(body)
+
+
+def no_hits(meta):
+    """ Does the query return no hits, size is 0 in meta or query body """
+    return meta.get("size") in [0, "0"]
+
+
+def filter_context(query):
+    """
+    Query in filter context: not scored, and cached by Elasticsearch
+    Filter context is inherited, then only top level clauses are moved
+    """
+    if not query or "match_all" in query:
+        return query
+
+    if set(query) == {"bool"} and "should" not in query["bool"]:
+        clauses = dict(query["bool"])
+        if "must" in clauses:
+            clauses["filter"] = clauses.get("filter", []) + clauses.pop("must")
+        return {"bool": clauses}
+
+    return {"bool": {"filter": [query]}}
+
+
 def format_nested_query(nested, query):
     if nested != None:
         query = {"nested": {"path": schema_reader.path_to_string(nested), "query": query}}
@@ -764,16 +986,16 @@ def format_date_query(comparator, value, time_zone):
         date, date_format = date_utils.str_date_to_datetime(value)
         if comparator_name == "gt":
             date = date_utils.date_add_to_last_element(date, 1, date_format)
-            range_query["gte"] = datetime.datetime.strftime(date, date_format)
+            range_query["gte"] = date_utils.format_date(date, date_format)
 
         elif comparator_name == "lte":
             date = date_utils.date_add_to_last_element(date, 1, date_format)
-            range_query["lt"] = datetime.datetime.strftime(date, date_format)
+            range_query["lt"] = date_utils.format_date(date, date_format)
 
         elif comparator_name == "eq":
             range_query["gte"] = value
             date = date_utils.date_add_to_last_element(date, 1, date_format)
-            range_query["lt"] = datetime.datetime.strftime(date, date_format)
+            range_query["lt"] = date_utils.format_date(date, date_format)
 
         else:
             range_query[comparator_name] = value
@@ -781,6 +1003,43 @@ def format_date_query(comparator, value, time_zone):
     return range_query
 
 
+def simple_filters(data):
+    """
+    Filters of a query made of filters without where joined by "and", with scalar values,
+    without aggregation, sort nor extended parameters. None if the query is not such one
+    """
+    if not isinstance(data, dict) or not set(data) <= {"query", "meta"}:
+        return None
+
+    query = data.get("query")
+    if not isinstance(query, dict):
+        return None
+
+    items = [query]
+    if "items" in query:
+        if set(query) != {"operator", "items"} or query["operator"] != "and" \
+           or not isinstance(query["items"], (list, tuple)) or not query["items"]:
+            return None
+        items = query["items"]
+
+    for item in items:
+        if not isinstance(item, dict) or set(item) != {"field", "comparator", "value"} \
+           or not item["field"] or not isinstance(item["field"], str) \
+           or not isinstance(item["comparator"], str) \
+           or not isinstance(item["value"], (str, int, float, bool)):
+            return None
+
+    return items
+
+
+def positive_filter(item):
+    """ Is the filter negative and the filter with positive comparator """
+    negative = item["comparator"] in NEGATIVE_COMPARATOR
+    if negative:
+        item = query_ast.freeze(item).replace(comparator=item["comparator"][1:])
+    return negative, item
+
+
 def is_numerical(t):
     return t in ["float", "integer", "long", "double", "date"]
 
@@ -797,7 +1056,7 @@ def to_boolean(path, value):
 
 def boolean_manager(field_type, value, path):
     if field_type == "boolean":
-        if isinstance(value, list):
+        if isinstance(value, (list, tuple)):
             return [to_boolean(path, v) for v in value]
         if isinstance(value, dict):
             return {k: to_boolean(path, v) for k, v in value.items()}
@@ -812,9 +1071,74 @@ def to_float(path, value):
         raise InvalidClientInput(f"'{path}' Invalid value for numerical '{value}'")
 
 
+def terms_values(field_type, values, path):
+    """ Values of a terms query: converted to the field type in bulk, without repeated ones """
+    if field_type == "boolean":
+        values = [to_boolean(path, v) for v in values]
+
+    elif is_numerical(field_type) and field_type != "date":
+        try:
+            values = list(map(float, values))
+        except (TypeError, ValueError):
+            values = [to_float(path, v) for v in values]
+
+    try:
+        return list(dict.fromkeys(values))
+    except TypeError:
+        return list(values)
+
+
+def format_terms(conf, path, values, terms_lookups):
+    """
+    Terms query of values, over MaxTermsCount values according to LargeTermsStrategy
+    - terms: a single terms query, refused by Elasticsearch over its index.max_terms_count
+    - chunks: should of terms queries of MaxTermsCount values
+    - lookup: terms lookup of a document of TermsLookupIndex, its values are added
+      to terms_lookups by id, SEL stores them before to search, see query_data["terms_lookup"]
+
+    Warning: Modify terms_lookups without returning it
+    """
+    max_terms = conf["Queries"].getint("MaxTermsCount")
+    strategy = conf["Queries"]["LargeTermsStrategy"].lower()
+
+    if not max_terms or len(values) <= max_terms or strategy == "terms":
+        return {"terms": {path: values}}
+
+    elif strategy == "chunks":
+        return terms_query(path, values, max_terms)
+
+    elif strategy == "lookup":
+        doc_id = hashlib.sha1(json.dumps(values).encode("utf-8")).hexdigest()
+        terms_lookups[doc_id] = values
+        lookup = {"index": conf["Queries"]["TermsLookupIndex"], "id": doc_id, "path": "values"}
+        return {"terms": {path: lookup}}
+
+    raise InternalServerError(f"Invalid LargeTermsStrategy: {strategy}, allowed: terms, chunks, lookup")
+
+
+def large_terms_warnings(conf, path, count):
+    """ Warnings of a terms query of count values, over MaxTermsCount """
+    max_terms = conf["Queries"].getint("MaxTermsCount")
+    if not max_terms or count <= max_terms:
+        return []
+    strategy = conf["Queries"]["LargeTermsStrategy"].lower()
+    return [
+        f"'{path}' {count} values in an 'in' list, over Elasticsearch max terms count ({max_terms}), "
+        f"using {strategy} strategy"
+    ]
+
+
+def terms_query(path, values, max_terms):
+    """ Terms query of values, a should of terms queries of max_terms values if more """
+    if not max_terms or len(values) <= max_terms:
+        return {"terms": {path: values}}
+    chunks = [values[i:i + max_terms] for i in range(0, len(values), max_terms)]
+    return {"bool": {"should": [{"terms": {path: chunk}} for chunk in chunks]}}
+
+
 def numerical_manager(field_type, value, path):
     if is_numerical(field_type) and not field_type == "date":
-        if isinstance(value, list):
+        if isinstance(value, (list, tuple)):
             return [to_float(path, v) for v in value]
         if isinstance(value, dict):
             return {k: to_float(path, v) for k, v in value.items()}
@@ -823,17 +1147,15 @@ def numerical_manager(field_type, value, path):
 
 
 def query_map(func, query):
-    """ Apply func on all first level filters """
-    new_query = copy.deepcopy(query)
-    if "bool" in query:
-        if "must" in query["bool"]:
-            new_query["bool"]["must"] = [func(q) for q in new_query["bool"]["must"]]
-        if "should" in query["bool"]:
-            new_query["bool"]["should"] = [func(q) for q in new_query["bool"]["should"]]
-        if "must_not" in query["bool"]:
-            new_query["bool"]["must_not"] = [func(q) for q in new_query["bool"]["must_not"]]
-    else:
-        new_query = func(new_query)
+    """ Apply func on all first level filters, query is not modified """
+    if "bool" not in query:
+        return func(query)
+
+    new_query = dict(query)
+    new_query["bool"] = dict(query["bool"])
+    for key in ["must", "should", "must_not"]:
+        if key in query["bool"]:
+            new_query["bool"][key] = [func(q) for q in query["bool"][key]]
     return new_query
 
 
@@ -850,19 +1172,16 @@ def find_filter(data, str_field):
 
 
 def top_insert_filter(data, operator, new_filter):
-    data["query"] = data.get("query")
-
-    items = [new_filter, data["query"]]
+    """ New query object with new_filter joined to data query by operator """
+    data = query_ast.freeze(data)
+    items = [new_filter, data.get("query")]
     items = [i for i in items if i]
 
     if len(items) == 1:
-        data["query"] = items[0]
+        return data.replace(query=items[0])
     elif len(items) == 0:
-        del data["query"]
-    else:
-        data["query"] = {"operator": operator, "items": items}
-
-    return data
+        return data.without("query")
+    return data.replace(query={"operator": operator, "items": items})
 
 
 def aggreg_set_default_parameter(field, aggreg, conf):
@@ -872,21 +1191,21 @@ def aggreg_set_default_parameter(field, aggreg, conf):
     + Set aggreg: date to histogram
     + Set histogram: date default interval
     """
-    aggreg = copy.deepcopy(aggreg) if aggreg else {}
-    aggreg["type"] = aggreg.get("type", "aggreg").lower()
+    aggreg = query_ast.freeze(aggreg) if aggreg else query_ast.Node()
+    defaults = {"type": aggreg.get("type", "aggreg").lower()}
 
-    if field["element"]["type"] == "date" and aggreg["type"] == "aggreg":
-        aggreg["type"] = "histogram"
+    if field["element"]["type"] == "date" and defaults["type"] == "aggreg":
+        defaults["type"] = "histogram"
 
-    if aggreg["type"] == "histogram" and \
+    if defaults["type"] == "histogram" and \
        field["element"]["type"] == "date" and \
        "interval" not in aggreg:
-        aggreg["interval"] = conf["Aggregations"]["DefaultDateInterval"]
+        defaults["interval"] = conf["Aggregations"]["DefaultDateInterval"]
 
     if "size" not in aggreg:
-        aggreg["size"] = conf["Aggregations"].getint("DefaultSize")
+        defaults["size"] = conf["Aggregations"].getint("DefaultSize")
 
-    return aggreg
+    return aggreg.replace(**defaults)
 
 
 def sort_query_controller(conf, sorts):
@@ -896,7 +1215,8 @@ def sort_query_controller(conf, sorts):
          sort: auto
          sort: null
     3. Enable random sort by custom query, sort: random
-    4. Remove custom sorts (auto, null, random) from real query sorts
+    4. Disable auto sort for index order, sort: _doc
+    5. Remove custom sorts (auto, null, random) from real query sorts
     """
     auto_sort = conf["Queries"].getboolean("AutoSort")
     random_seed = None
@@ -914,6 +1234,10 @@ def sort_query_controller(conf, sorts):
             random_seed = elm.get("seed", int(time.time()))
             auto_sort = False
 
+        elif elm["field"] == DOC_SORT_FIELD:
+            auto_sort = False
+            remains.append(elm)
+
         else:
             remains.append(elm)
 
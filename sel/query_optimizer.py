@@ -0,0 +1,220 @@
+"""
+Optimization of generated Elasticsearch queries
+
+Rewrites keep the matching documents:
+- bool clauses are lifted into their parent bool, when occurrences allow it
+- sibling nested queries on the same path are merged under should and must_not,
+  one nested object matching a or b is one matching a or one matching b
+- term queries on the same field are collapsed into terms under should and must_not,
+  in terms queries of max_terms values at most
+- repeated clauses are removed
+Rewrites changing the score of hits only apply to not scored clauses.
+"""
+import json
+
+
+OCCURRENCES = ["must", "filter", "should", "must_not"]
+
+# Occurrences never scored
+NOT_SCORED_OCCURRENCES = ["filter", "must_not"]
+
+
+def optimize(query, scored=True, max_terms=0):
+    """
+    Optimized query, the query is not modified
+
+    :param query: Generated Elasticsearch query
+    :param scored: False if the score of hits is not used, eg. sorted by fields
+    :param max_terms: Maximum values of a terms query, 0 for no limit
+    """
+    if not isinstance(query, dict) or len(query) != 1:
+        return query
+
+    if "bool" in query:
+        return optimize_bool(query["bool"], scored, max_terms)
+
+    if "nested" in query and isinstance(query["nested"], dict) and "query" in query["nested"]:
+        nested = dict(query["nested"])
+        nested["query"] = optimize(nested["query"], scored, max_terms)
+        return {"nested": nested}
+
+    return query
+
+
+def optimize_bool(clauses, scored, max_terms=0):
+    """ Optimized bool query of clauses """
+    if not clauses or not set(clauses) <= set(OCCURRENCES):
+        return {"bool": clauses}
+
+    occurrences = {}
+    for occurrence, items in clauses.items():
+        items = items if isinstance(items, list) else [items]
+        item_scored = scored and occurrence not in NOT_SCORED_OCCURRENCES
+        occurrences[occurrence] = [optimize(item, item_scored, max_terms) for item in items]
+
+    occurrences = lift_clauses(occurrences, scored)
+
+    for occurrence, items in occurrences.items():
+        if occurrence == "must_not" or (occurrence == "should" and not scored):
+            items = merge_nested(items, max_terms)
+            items = merge_terms(items, max_terms)
+        if occurrence in NOT_SCORED_OCCURRENCES or not scored:
+            items = deduplicate(items)
+        occurrences[occurrence] = items
+
+    occurrences = {k: v for k, v in occurrences.items() if v}
+
+    # Single clause, same matching and score
+    if len(occurrences) == 1:
+        occurrence, items = next(iter(occurrences.items()))
+        if occurrence in ["must", "should"] and len(items) == 1:
+            return items[0]
+
+    return {"bool": occurrences}
+
+
+def lift_clauses(occurrences, scored):
+    """
+    Lift clauses of children bool queries into their parent:
+    - must/filter children without should, unless the parent has should,
+      its must/filter clauses make them optional
+    - should children made of should only, into should if the parent should clauses
+      are required or not scored
+    - must_not children made of should only (not a or b is not a and not b)
+      or of a single must/filter clause
+    """
+    required_should = not (occurrences.get("must") or occurrences.get("filter"))
+    lifted = {occurrence: [] for occurrence in occurrences}
+
+    def add(occurrence, items):
+        lifted.setdefault(occurrence, []).extend(items)
+
+    for occurrence, items in occurrences.items():
+        for item in items:
+            child = bool_clauses(item)
+
+            if child is None:
+                add(occurrence, [item])
+
+            elif occurrence in ["must", "filter"] and "should" not in occurrences \
+                 and set(child) <= {"must", "filter", "must_not"}:
+                for child_occurrence, child_items in child.items():
+                    if child_occurrence == "must":
+                        child_occurrence = occurrence
+                    add(child_occurrence, child_items)
+
+            elif occurrence == "should" and set(child) == {"should"} \
+                 and (required_should or not scored):
+                add("should", child["should"])
+
+            elif occurrence == "must_not" and set(child) == {"should"}:
+                add("must_not", child["should"])
+
+            elif occurrence == "must_not" and len(child) == 1 \
+                 and set(child) <= {"must", "filter"} and len(next(iter(child.values()))) == 1:
+                add("must_not", next(iter(child.values())))
+
+            else:
+                add(occurrence, [item])
+
+    return lifted
+
+
+def bool_clauses(query):
+    """ Clauses of a bool query as lists by occurrence, None if query is not a plain bool query """
+    if not isinstance(query, dict) or list(query) != ["bool"] or not isinstance(query["bool"], dict):
+        return None
+    clauses = query["bool"]
+    if not clauses or not set(clauses) <= set(OCCURRENCES):
+        return None
+    return {k: v if isinstance(v, list) else [v] for k, v in clauses.items()}
+
+
+def merge_nested(items, max_terms=0):
+    """ Merge nested queries on the same path into one, of should of their queries """
+    paths = {}
+    merged = []
+    for item in items:
+        nested = item.get("nested") if isinstance(item, dict) and len(item) == 1 else None
+        if not isinstance(nested, dict) or set(nested) != {"path", "query"}:
+            merged.append(item)
+            continue
+
+        if nested["path"] not in paths:
+            paths[nested["path"]] = len(merged)
+            merged.append([nested["query"]])
+        else:
+            merged[paths[nested["path"]]].append(nested["query"])
+
+    for path, index in paths.items():
+        queries = merged[index]
+        query = queries[0] if len(queries) == 1 else optimize({"bool": {"should": queries}}, False, max_terms)
+        merged[index] = {"nested": {"path": path, "query": query}}
+
+    return merged
+
+
+def merge_terms(items, max_terms=0):
+    """
+    Collapse term and terms queries on the same field into one terms query,
+    or terms queries of max_terms values if more
+    """
+    fields = {}
+    merged = []
+    for item in items:
+        field, values = term_values(item)
+        if field is None:
+            merged.append([item])
+            continue
+
+        if field not in fields:
+            fields[field] = len(merged)
+            merged.append([item, field, {}])
+        merged[fields[field]][2].update(dict.fromkeys(values))
+
+    chunked = []
+    for group in merged:
+        if len(group) == 1:
+            chunked.append(group[0])
+            continue
+
+        item, field, values = group
+        values = list(values)
+        if "term" in item and len(values) == 1:
+            chunked.append(item)
+        elif not max_terms or len(values) <= max_terms:
+            chunked.append({"terms": {field: values}})
+        else:
+            chunked += [{"terms": {field: values[i:i + max_terms]}} for i in range(0, len(values), max_terms)]
+
+    return chunked
+
+
+def term_values(item):
+    """ Field and values of a term or terms query, None, None if it is not one """
+    if not isinstance(item, dict) or len(item) != 1:
+        return None, None
+
+    kind, query = next(iter(item.items()))
+    if kind not in ["term", "terms"] or not isinstance(query, dict) or len(query) != 1:
+        return None, None
+
+    field, value = next(iter(query.items()))
+    if kind == "term" and not isinstance(value, (dict, list)):
+        return field, [value]
+    if kind == "terms" and isinstance(value, list) \
+       and not any(isinstance(v, (dict, list)) for v in value):
+        return field, value
+    return None, None
+
+
+def deduplicate(items):
+    """ Items without repeated ones """
+    found = set()
+    unique = []
+    for item in items:
+        key = json.dumps(item, sort_keys=True, default=repr)
+        if key not in found:
+            found.add(key)
+            unique.append(item)
+    return unique
@@ -0,0 +1,910 @@
+"""
+Hand written parser of the query string grammar, defined in query_string_parser
+
+It accepts the same language and builds the same objects, with the same error messages,
+than the pypeg2 grammar, kept as reference implementation.
+
+- Tokens are scanned on demand at the current position, keywords being prefix matches
+  as in the grammar, eg. "notable = 1" is "not able = 1"
+- Alternatives are selected on their first token, without memory of parsed text
+- Error positions are reported as the pypeg2 packrat parser does: a token already
+  matched at the same position, by another alternative, does not move the position
+- Quoted values are scanned in linear time, without regex, and can be limited in length
+"""
+import re
+
+from .query_string_parser import (
+    Value, Values, Comparator, NumericalComparator, InComparator, RangeComparator,
+    Operator, Order, Name, Integer, FieldPath, QueryString, RangeValue, Filter, RangeFilter,
+    Not, Context, Group, NoBracketGroup, QueryElement, AggregType, BracketAggreg, SubAggreg,
+    AggregParameter, Aggreg, SortParameter, Sort, Query, SyntaxErrorChecker,
+    AGGREG_TYPES, syntaxerror_parser, unexpect_manager
+)
+from .query_budget import over_budget
+from .utils import InvalidClientInput
+
+
+WHITESPACE = re.compile(r"\s+")
+
+# Quote styles of Value and QueryString grammars, in their order
+QUOTES = ['"""', '""', '"', "'''", "''", "'"]
+UNQUOTED_VALUE = re.compile(r'[\w\d\-\_\.\#\@\$/*]+')
+
+COMPARATOR = re.compile(r'(!=|!~|>=|>|<=|<|=|~)')
+NUMERICAL_COMPARATOR = re.compile(r'(>=|>|<=|<)')
+NAME = re.compile(r"[\w\d\.\-\_]+")
+INTEGER = re.compile(r"\d+")
+FIELD_PATH = re.compile(r"[\w\-\.]+")
+WORD = re.compile(r"\w+")
+
+LEFT_BRACKET = re.compile(r"\[")
+RIGHT_BRACKET = re.compile(r"\]")
+LEFT_PARENTHESIS = re.compile(r"\(")
+RIGHT_PARENTHESIS = re.compile(r"\)")
+COMMA = re.compile(",")
+COLON = re.compile(":")
+
+KEYWORDS = {
+    word: re.compile(word, re.IGNORECASE)
+    for word in AGGREG_TYPES + [
+        "and", "or", "not", "in", "nin", "range", "nrange", "prefix", "nprefix", "where",
+        "asc", "desc", "sort", "subaggreg", "interval", "size", "under", "graph", "seed", "mode"
+    ]
+}
+
+GROUP_KEYWORDS = SyntaxErrorChecker("group").expected_keywords
+AGGREG_KEYWORDS = SyntaxErrorChecker("aggreg").expected_keywords
+SORT_KEYWORDS = SyntaxErrorChecker("sort").expected_keywords
+
+KEYWORD_MAX_LENGTH = max(len(k) for k in GROUP_KEYWORDS | AGGREG_KEYWORDS | SORT_KEYWORDS)
+ALPHANUMERIC = re.compile(r"[0-1a-zA-Z]")
+
+
+class Scanner:
+    """
+    Scan tokens of a query string, on demand, from the current position
+
+    Keep the position reported in error messages, line and global position,
+    as the pypeg2 parser does
+
+    For autocomplete, tokens tried at <expect_at> index are kept in <expected>,
+    and <examined> is the end of the text read so far
+    """
+
+    def __init__(self, text, max_literal_length=0, max_tokens=0):
+        self.text = text
+        self.max_literal_length = max_literal_length
+        self.max_tokens = max_tokens
+        self.tokens = 0
+        self.furthest = 0
+        self.end = len(text.rstrip())
+        self.index = 0
+        self.line = 1
+        self.position = 0
+        self.matched = set()
+        self.examined = 0
+        self.expect_at = None
+        self.expected = {}
+
+        self.index = self.__skip(0)
+        self.__move(0, self.index)
+        self.__examine(self.index + 1)
+
+
+    def __skip(self, index):
+        found = WHITESPACE.match(self.text, index)
+        return found.end() if found else index
+
+
+    def __move(self, start, end):
+        self.line += self.text.count("\n", start, end)
+        self.position += end - start
+
+
+    def __examine(self, end):
+        if end > self.examined:
+            self.examined = end
+
+
+    def mark(self):
+        return self.index, self.line, self.position
+
+
+    def reset(self, state):
+        self.index, self.line, self.position = state
+
+
+    def save(self):
+        """ Full state, to resume the scan of a text with the same prefix, until examined """
+        # Matched tokens before the current position are never tried again
+        matched = set()
+        if self.furthest > self.index:
+            matched = {m for m in self.matched if m[1] >= self.index}
+
+        return (self.index, self.line, self.position, self.tokens, self.furthest,
+                self.examined, matched)
+
+
+    def restore(self, saved):
+        (self.index, self.line, self.position, self.tokens, self.furthest,
+         self.examined, matched) = saved
+        self.matched = set(matched)
+
+
+    def match(self, regex):
+        """ Match regex at the current position, skip following whitespaces, return the token """
+        key = (regex.pattern, regex.flags)
+        if self.index == self.expect_at:
+            self.expected[key] = None
+
+        found = regex.match(self.text, self.index)
+        if found is None:
+            # Longest token of the grammar, keywords, is the most a failing regex reads
+            self.__examine(self.index + KEYWORD_MAX_LENGTH + 1)
+            return None
+        return self.__consume(found.end(), key)
+
+
+    def quoted(self):
+        """
+        Match a quoted value at the current position, as grammar regexes, eg. '"((?!").)*"'
+        The value ends at the first closing quote, it can not contain a new line.
+
+        Raise InvalidClientInput if the value is longer than max_literal_length,
+        only max_literal_length characters are scanned
+        """
+        text, start = self.text, self.index
+        if start == self.expect_at:
+            self.expected["quoted"] = None
+        self.__examine(start + len(QUOTES[0]))
+
+        for quote in QUOTES:
+            if not text.startswith(quote, start):
+                continue
+
+            content = start + len(quote)
+            limit = len(text)
+            if self.max_literal_length > 0:
+                limit = min(limit, content + self.max_literal_length + len(quote))
+
+            new_line = text.find("\n", content, limit)
+            closing = text.find(quote, content, limit if new_line == -1 else new_line)
+
+            if closing != -1:
+                return self.__consume(closing + len(quote), quote)
+            # Unclosed until the end of text, the next character could close it
+            self.__examine(limit + 1 if new_line == -1 else new_line + 1)
+
+            if new_line == -1 and limit < len(text):
+                raise InvalidClientInput(
+                    f"Invalid syntax at line {self.line}, global position {self.position}: "
+                    f"quoted value longer than {self.max_literal_length} characters."
+                )
+
+        return None
+
+
+    def __consume(self, end, key):
+        """ Consume token until end, skip following whitespaces, return the token """
+        start = self.index
+        self.index = self.__skip(end)
+        self.__examine(self.index + 1)
+
+        # Tokens are counted once, backtracking does not count them again
+        if start >= self.furthest:
+            self.furthest = self.index
+            self.tokens += 1
+            if self.max_tokens and self.tokens > self.max_tokens:
+                over_budget("max_tokens", self.max_tokens, pos=self.pos())
+
+        # Packrat memory of the reference parser, already matched token does not move position
+        if (key, start) not in self.matched:
+            self.matched.add((key, start))
+            self.__move(start, self.index)
+
+        return self.text[start:end]
+
+
+    def keyword(self, word):
+        return self.match(KEYWORDS[word])
+
+
+    def remaining(self):
+        return self.text[self.index:]
+
+
+    def pos(self):
+        return [self.line, self.position]
+
+
+    def error(self, name):
+        """ Raise an invalid syntax error, expecting <name> """
+        syntaxerror_parser(None, self.remaining(), pos=[self.line, self.position], name=name)
+
+
+    def check(self, keywords):
+        """ Raise an invalid syntax error if remaining text does not start with an expected keyword """
+        self.__examine(self.index + KEYWORD_MAX_LENGTH + 1)
+        if self.index >= self.end:
+            return
+
+        head = self.text[self.index:min(self.index + KEYWORD_MAX_LENGTH + 1, self.end)].lower()
+        unexpected = True
+
+        for keyword in keywords:
+            if head.startswith(keyword):
+                unexpected = False
+                following = head[len(keyword):len(keyword) + 1]
+                if keyword != ")" and following and ALPHANUMERIC.match(following):
+                    unexpected = True
+                    break
+
+        if unexpected:
+            syntaxerror_parser(None, self.remaining(), pos=[self.line, self.position],
+                               expected_keywords=keywords)
+
+
+class DescentParser:
+    """
+    Recursive descent parser, one method by grammar element
+    See query_budget for limits, 0 to disable them
+    """
+
+    def __init__(self, text, max_literal_length=0, max_tokens=0, max_group_depth=0,
+                 max_in_values=0, max_subaggreg_depth=0):
+        self.scanner = Scanner(text, max_literal_length, max_tokens)
+        self.max_group_depth = max_group_depth
+        self.max_in_values = max_in_values
+        self.max_subaggreg_depth = max_subaggreg_depth
+        self.group_depth = 0
+        self.subaggreg_depth = 0
+
+        # List to record checkpoints of query parse, see query
+        self.checkpoints = None
+
+        # Checkpoints of a previous parse to resume from, see resume_from
+        self.resumable = []
+        self.copied = 0
+        self.top_resume = None
+        self.group_resumes = {}
+        self.resumed_at = 0
+
+
+    def __checkpoint(self, phase, query=None, subelements=(), aggregs=(), sorts=(), group=None):
+        """ Record parse state, parsed lists are only appended, their lengths are kept """
+        if self.checkpoints is None:
+            return
+
+        self.checkpoints.append({
+            "phase": phase,
+            "group": group,
+            "examined": self.scanner.examined,
+            "scanner": self.scanner.save(),
+            "query": query,
+            "subelements": (subelements, len(subelements)),
+            "aggreg": (aggregs, len(aggregs)),
+            "sort": (sorts, len(sorts))
+        })
+
+
+    def resume_from(self, checkpoints):
+        """
+        Resume the next query parse from checkpoints of a previous parse, valid for this text:
+        from the last top level one, then from the last one of each group parsed again.
+        Checkpoints before a resumed one are recorded again, the next are recorded by the parse.
+        """
+        self.resumable = checkpoints
+        self.copied = 0
+        self.top_resume = None
+        self.group_resumes = {}
+
+        for index in range(len(checkpoints) - 1, -1, -1):
+            checkpoint = checkpoints[index]
+            if checkpoint["phase"] != "group":
+                self.top_resume = index
+                break
+            self.group_resumes.setdefault(checkpoint["group"], index)
+
+
+    def __resume(self, index):
+        """ Restore the scanner state of a resumable checkpoint, return the checkpoint """
+        checkpoint = self.resumable[index]
+        self.checkpoints += self.resumable[self.copied:index]
+        self.copied = index + 1
+
+        self.scanner.restore(checkpoint["scanner"])
+        self.resumed_at = self.scanner.index
+        return checkpoint
+
+
+################################################################################
+####### Basis
+################################################################################
+
+    def value(self):
+        found = self.scanner.quoted()
+        if found is None:
+            found = self.scanner.match(UNQUOTED_VALUE)
+        return Value(found) if found is not None else None
+
+
+    def values(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        if scanner.match(LEFT_BRACKET) is None:
+            return None
+
+        value = self.value()
+        if value is None:
+            scanner.reset(state)
+            return None
+
+        values = [value]
+        while scanner.match(COMMA) is not None:
+            value = self.value()
+            if value is None:
+                scanner.error("value for list of values")
+            values += [",", value]
+
+            if self.max_in_values and len(values) > 2 * self.max_in_values - 1:
+                over_budget("max_in_values", self.max_in_values, pos=scanner.pos())
+
+        if scanner.match(RIGHT_BRACKET) is None:
+            scanner.reset(state)
+            return None
+
+        # Same string value as the reference parser, brackets are not ignored by the grammar
+        obj = Values(["[", "]"])
+        obj.values = values
+        return obj
+
+
+    def comparator(self):
+        scanner = self.scanner
+
+        found = scanner.match(COMPARATOR)
+        if found is not None:
+            return Comparator(found)
+
+        for word in ["prefix", "nprefix"]:
+            found = scanner.keyword(word)
+            if found is not None:
+                return Comparator(found)
+
+        return self.__negation(Comparator, "prefix")
+
+
+    def in_comparator(self):
+        for word in ["in", "nin"]:
+            found = self.scanner.keyword(word)
+            if found is not None:
+                return InComparator(found)
+
+        return self.__negation(InComparator, "in")
+
+
+    def range_comparator(self):
+        for word in ["range", "nrange"]:
+            found = self.scanner.keyword(word)
+            if found is not None:
+                return RangeComparator(found)
+
+        return self.__negation(RangeComparator, "range")
+
+
+    def __negation(self, comparator_type, word):
+        """ 'not <word>' comparator """
+        scanner = self.scanner
+        state = scanner.mark()
+
+        negation = scanner.keyword("not")
+        if negation is None:
+            return None
+
+        found = scanner.keyword(word)
+        if found is None:
+            scanner.reset(state)
+            return None
+
+        return comparator_type([negation, found])
+
+
+    def __terminal(self, terminal_type, regex):
+        found = self.scanner.match(regex)
+        return terminal_type(found) if found is not None else None
+
+
+    def numerical_comparator(self):
+        return self.__terminal(NumericalComparator, NUMERICAL_COMPARATOR)
+
+    def name(self):
+        return self.__terminal(Name, NAME)
+
+    def integer(self):
+        return self.__terminal(Integer, INTEGER)
+
+    def field_path(self):
+        return self.__terminal(FieldPath, FIELD_PATH)
+
+
+    def __one_of(self, terminal_type, words):
+        for word in words:
+            found = self.scanner.keyword(word)
+            if found is not None:
+                return terminal_type(found)
+        return None
+
+
+    def operator(self):
+        return self.__one_of(Operator, ["and", "or"])
+
+    def order(self):
+        return self.__one_of(Order, ["asc", "desc"])
+
+    def aggreg_type(self):
+        return self.__one_of(AggregType, AGGREG_TYPES)
+
+
+################################################################################
+####### Filters
+################################################################################
+
+    def query_string(self):
+        found = self.scanner.quoted()
+        return QueryString(found) if found is not None else None
+
+
+    def range_value(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        if scanner.match(LEFT_PARENTHESIS) is None:
+            return None
+
+        obj = RangeValue(["(", ",", ")"])
+        for position in ["first", "second"]:
+            if position == "second" and scanner.match(COMMA) is None:
+                scanner.reset(state)
+                return None
+
+            comparator = self.numerical_comparator()
+            if comparator is None:
+                scanner.error("numerical comparator")
+
+            value = self.value()
+            if value is None:
+                scanner.error("numerical or date value")
+
+            setattr(obj, f"{position}_comparator", comparator)
+            setattr(obj, f"{position}_value", value)
+
+        if scanner.match(RIGHT_PARENTHESIS) is None:
+            scanner.reset(state)
+            return None
+
+        return obj
+
+
+    def __where(self, node_type, attributes):
+        """ Node of a filter with its optional where parameter, the keyword being its string value """
+        keyword = self.scanner.keyword("where")
+        if keyword is not None:
+            attributes["where"] = self.query_element()
+            if attributes["where"] is None:
+                self.scanner.error('query after "where"')
+
+        return node(node_type, attributes, keyword or "")
+
+
+    def filter(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        field = self.field_path()
+        if field is None:
+            return None
+
+        comparator = self.comparator()
+        if comparator is not None:
+            value = self.value()
+            if value is None:
+                scanner.error("value after comparator")
+            attributes = {"field": field, "comparator": comparator, "value": value}
+
+        else:
+            comparator = self.in_comparator()
+            if comparator is not None:
+                values = self.values()
+                if values is None:
+                    scanner.error('"in values" after "in" comparator')
+
+            else:
+                comparator = self.range_comparator()
+                if comparator is None:
+                    scanner.reset(state)
+                    return None
+
+                values = self.range_value()
+                if values is None:
+                    scanner.error('range values after "range" comparator')
+
+            attributes = {"field": field, "comparator": comparator, "values": values}
+
+        return self.__where(Filter, attributes)
+
+
+    def range_filter(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        first_value = self.value()
+        first_comparator = self.numerical_comparator() if first_value is not None else None
+        field = self.field_path() if first_comparator is not None else None
+        second_comparator = self.numerical_comparator() if field is not None else None
+
+        if second_comparator is None:
+            scanner.reset(state)
+            return None
+
+        second_value = self.value()
+        if second_value is None:
+            scanner.error("numerical or date value")
+
+        return self.__where(RangeFilter, {
+            "first_value": first_value,
+            "first_comparator": first_comparator,
+            "field": field,
+            "second_comparator": second_comparator,
+            "second_value": second_value
+        })
+
+
+    def context(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        field = self.field_path()
+        if field is None:
+            return None
+
+        keyword = scanner.keyword("where")
+        if keyword is None:
+            scanner.reset(state)
+            return None
+
+        where = self.group()
+        if where is None:
+            scanner.error('bracketed query after "where"')
+
+        return node(Context, {"field": field, "where": where}, keyword)
+
+
+    def not_query(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        if scanner.keyword("not") is None:
+            return None
+
+        query = self.query_element()
+        if query is None:
+            scanner.reset(state)
+            return None
+
+        obj = Not()
+        obj.query = query
+        return obj
+
+
+    def group(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        if scanner.match(LEFT_PARENTHESIS) is None:
+            return None
+
+        subelements = self.no_bracket_group()
+        if subelements is None or scanner.match(RIGHT_PARENTHESIS) is None:
+            scanner.reset(state)
+            return None
+
+        obj = Group()
+        obj.subelements = subelements
+        return obj
+
+
+    def query_element(self):
+        self.group_depth += 1
+        if self.max_group_depth and self.group_depth > self.max_group_depth:
+            over_budget("max_group_depth", self.max_group_depth, pos=self.scanner.pos())
+
+        try:
+            for alternative in [self.group, self.not_query, self.range_filter,
+                                self.filter, self.context, self.query_string]:
+                subelements = alternative()
+                if subelements is not None:
+                    break
+            else:
+                return None
+        finally:
+            self.group_depth -= 1
+
+        self.scanner.check(GROUP_KEYWORDS)
+
+        obj = QueryElement()
+        obj.subelements = subelements
+        return obj
+
+
+    def no_bracket_group(self, subelements=None):
+        """ subelements: parsed elements and operators, to resume a top level group """
+        start = self.scanner.index
+        if subelements is None and self.group_depth > 0 and start in self.group_resumes:
+            items, length = self.__resume(self.group_resumes.pop(start))["subelements"]
+            subelements = items[:length]
+
+        if subelements is None:
+            element = self.query_element()
+            if element is None:
+                return None
+            subelements = [element]
+
+        while True:
+            if self.group_depth == 0:
+                self.__checkpoint("query", subelements=subelements)
+            else:
+                self.__checkpoint("group", subelements=subelements, group=start)
+
+            operator = self.operator()
+            if operator is None:
+                break
+
+            element = self.query_element()
+            if element is None:
+                self.scanner.error("query after and/or")
+            subelements += [operator, element]
+
+        obj = NoBracketGroup()
+        obj.subelements = subelements
+        return obj
+
+
+################################################################################
+####### Aggregations and sorts
+################################################################################
+
+    def subaggreg(self):
+        name = self.name()
+        if name is None:
+            return None
+
+        self.subaggreg_depth += 1
+        if self.max_subaggreg_depth and self.subaggreg_depth > self.max_subaggreg_depth:
+            over_budget("max_subaggreg_depth", self.max_subaggreg_depth, pos=self.scanner.pos())
+
+        try:
+            aggreg = self.bracket_aggreg()
+        finally:
+            self.subaggreg_depth -= 1
+
+        if aggreg is None:
+            self.scanner.error("bracketed aggregation for subaggregation")
+
+        obj = SubAggreg()
+        obj.name, obj.aggreg = name, aggreg
+        return obj
+
+
+    def bracket_aggreg(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        if scanner.match(LEFT_PARENTHESIS) is None:
+            return None
+
+        aggreg = self.aggreg()
+        if aggreg is None or scanner.match(RIGHT_PARENTHESIS) is None:
+            scanner.reset(state)
+            return None
+
+        obj = BracketAggreg()
+        obj.subelements = aggreg
+        return obj
+
+
+    def graph(self):
+        return self.scanner.match(WORD)
+
+
+    def __parameter(self, parameter_type, parameters):
+        """ One of parameters: (keyword, parse function, error name) """
+        for keyword, parse_function, error_name in parameters:
+            found = self.scanner.keyword(keyword)
+            if found is None:
+                continue
+
+            value = parse_function()
+            if value is None:
+                self.scanner.error(error_name)
+
+            obj = parameter_type(found)
+            setattr(obj, keyword, value)
+            return obj
+
+        return None
+
+
+    def aggreg_parameter(self):
+        return self.__parameter(AggregParameter, [
+            ("subaggreg", self.subaggreg, "name and bracketed aggreg for subaggreg"),
+            ("interval", self.value, "interval value"),
+            ("size", self.integer, 'integer after "size"'),
+            ("under", self.field_path, 'field path after "under"'),
+            ("where", self.query_element, 'query after "where"'),
+            ("graph", self.graph, 'query after "graph"')
+        ])
+
+
+    def sort_parameter(self):
+        return self.__parameter(SortParameter, [
+            ("seed", self.integer, 'integer after "seed"'),
+            ("mode", self.name, "mode name"),
+            ("under", self.field_path, 'field path after "under"'),
+            ("where", self.query_element, 'bracketed query after "where"')
+        ])
+
+
+    def __repeat(self, parse_function):
+        items = []
+        while True:
+            item = parse_function()
+            if item is None:
+                return items
+            items.append(item)
+
+
+    def aggreg(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        aggreg_type = self.aggreg_type()
+        if aggreg_type is None:
+            return None
+
+        obj = Aggreg()
+        obj.aggreg_type = aggreg_type
+
+        name = self.name()
+        if name is not None:
+            obj.name = name
+
+        if scanner.match(COLON) is None:
+            scanner.reset(state)
+            return None
+
+        obj.field = self.field_path()
+        if obj.field is None:
+            scanner.error("field path for aggregation")
+
+        obj.parameters = self.__repeat(self.aggreg_parameter)
+        scanner.check(AGGREG_KEYWORDS)
+        return obj
+
+
+    def sort(self):
+        scanner = self.scanner
+        state = scanner.mark()
+
+        keyword = scanner.keyword("sort")
+        if keyword is None:
+            return None
+
+        if scanner.match(COLON) is None:
+            scanner.reset(state)
+            return None
+
+        obj = Sort(keyword)
+        obj.field = self.field_path()
+        if obj.field is None:
+            scanner.error("field path for sort query")
+
+        order = self.order()
+        if order is not None:
+            obj.order = order
+
+        obj.parameters = self.__repeat(self.sort_parameter)
+        scanner.check(SORT_KEYWORDS)
+        return obj
+
+
+    def query(self):
+        """
+        Whole query
+
+        If checkpoints is a list, the parse state is recorded before each operator of a group,
+        top level or bracketed, aggregation and sort. The parse of a text with the same prefix,
+        until the text examined by a checkpoint, can be resumed from it, see resume_from
+        """
+        phase = "query"
+        resume = None
+        if self.top_resume is not None:
+            resume = self.__resume(self.top_resume)
+            phase = resume["phase"]
+
+        def resumed(name):
+            items, length = resume[name]
+            return items[:length]
+
+        if phase == "query":
+            query = self.no_bracket_group(None if resume is None else resumed("subelements"))
+        else:
+            query = resume["query"]
+
+        aggregs = resumed("aggreg") if phase != "query" else []
+        if phase != "sort":
+            while True:
+                self.__checkpoint("aggreg", query=query, aggregs=aggregs)
+                aggreg = self.aggreg()
+                if aggreg is None:
+                    break
+                aggregs.append(aggreg)
+
+        sorts = resumed("sort") if phase == "sort" else []
+        while True:
+            self.__checkpoint("sort", query=query, aggregs=aggregs, sorts=sorts)
+            sort = self.sort()
+            if sort is None:
+                break
+            sorts.append(sort)
+
+        obj = Query()
+        if query is not None:
+            obj.query = query
+        obj.aggreg = aggregs
+        obj.sort = sorts
+        return obj
+
+
+def node(node_type, attributes, text=""):
+    """ Grammar object of given type, string value and attributes """
+    obj = node_type(text)
+    for key, value in attributes.items():
+        setattr(obj, key, value)
+    return obj
+
+
+GRAMMAR_PARSERS = {
+    Value: DescentParser.value,
+    QueryString: DescentParser.query_string,
+    Comparator: DescentParser.comparator,
+    Filter: DescentParser.filter,
+    RangeFilter: DescentParser.range_filter,
+    Context: DescentParser.context,
+    Not: DescentParser.not_query,
+    QueryElement: DescentParser.query_element,
+    Group: DescentParser.group,
+    NoBracketGroup: DescentParser.no_bracket_group,
+    Aggreg: DescentParser.aggreg,
+    Sort: DescentParser.sort,
+    Query: DescentParser.query,
+}
+
+
+def parse(input_string, grammar=Query, **limits):
+    """
+    Parse the whole query, same as query_string_parser.parse
+
+    :param limits: max_literal_length, maximum length of quoted values, and query_budget limits,
+                   0 or missing for no limit
+    """
+    parser = DescentParser(input_string, **limits)
+    obj = GRAMMAR_PARSERS[grammar](parser)
+    if obj is None:
+        raise SyntaxError(f"expecting {grammar.__name__}")
+
+    unexpect = unexpect_manager(input_string, parser.scanner.remaining())
+    if unexpect:
+        raise InvalidClientInput(unexpect)
+
+    return obj
@@ -146,7 +146,7 @@ class Value(str):
         re.compile(r"'''((?!''').)*'''"),
         re.compile(r"''((?!'').)*''"),
         re.compile(r"'((?!').)*'"),
-        re.compile(r'[\w\d\-\_\.\#\@/*]+')
+        re.compile(r'[\w\d\-\_\.\#\@\$/*]+')
     ]
 
 class Values(str):
@@ -476,7 +476,7 @@ def unexpect_manager(input_string, remaining):
         return
 
     after = ""
-    if consumed:
+    if consumed.strip():
         last_consumed_token = re.sub(r"[ \t]+", " ", consumed.strip()).split()
         after = f" after '{last_consumed_token[-1]}'"
 
@@ -0,0 +1,206 @@
+import time
+import fnmatch
+import logging
+import threading
+
+from .utils import NotFound, LRUCache
+
+
+class SchemaCache:
+    """
+    Cache of index schemas, keyed by index expression, eg. "foo", "foo_*" or "foo,bar"
+
+    - Entries expire after <ttl> seconds, least recently used are evicted first
+    - Not found index(es) are cached too, during <not_found_ttl> seconds
+    - A <ttl> of 0 disable the cache
+    - With a <validator>, expired entries are checked before to be loaded again,
+      still valid entries are kept for <ttl> more seconds. A validator which fetched
+      the new value returns it, the loader is not called
+
+    :param ttl: Time to live of entries in seconds
+    :param max_entries: Maximum number of cached entries
+    :param not_found_ttl: Time to live of not found entries in seconds, 0 to disable
+    :param validator: Function (key, value) returning True if the value is still valid,
+                      otherwise its new value or None to call the loader
+    :param clock: Function returning current time in seconds
+    """
+
+    def __init__(self, ttl, max_entries, not_found_ttl=0, validator=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.not_found_ttl = not_found_ttl
+        self.validator = validator
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+        self._entries = LRUCache(max_entries)
+        self._lock = threading.Lock()
+
+
+    def get(self, key, loader):
+        """
+        Get value of key, call loader to get it on missing or expired entry
+
+        Can raise NotFound, if raised by the loader or cached as not found
+        """
+        entry = self._entries.peek(key)
+
+        with self._lock:
+            if entry is not None and entry["expire_at"] > self.clock():
+                self.hits += 1
+                entry["used"] = True
+
+                if entry["not_found"] is not None:
+                    raise NotFound(entry["not_found"])
+                return entry["value"]
+
+            self.misses += 1
+            stale = entry["value"] if entry is not None and entry["not_found"] is None else None
+
+        return self._refresh(key, loader, stale)
+
+
+    def set(self, key, value, ttl=None):
+        """
+        Set value of key, for ttl seconds, default: cache ttl
+        Use float("inf") to never expire
+        """
+        self._set(key, value, self.ttl if ttl is None else ttl)
+
+
+    def due(self, ahead):
+        """ Keys of entries used since their last load, expiring within <ahead> seconds """
+        limit = self.clock() + ahead
+        return [
+            key for key, entry in self._entries.items()
+            if entry["used"] and entry["not_found"] is None and entry["expire_at"] <= limit
+        ]
+
+
+    def revalidate(self, key, loader):
+        """
+        Check an entry ahead of its expiry, keep it for <ttl> more seconds if still valid,
+        otherwise call loader to replace it
+
+        Can raise NotFound and loader exceptions
+        """
+        entry = self._entries.peek(key)
+        if entry is None or entry["not_found"] is not None:
+            return
+        stale = entry["value"]
+
+        self._refresh(key, loader, stale)
+
+
+    def _refresh(self, key, loader, stale=None):
+        try:
+            checked = self._check(key, stale) if stale is not None else None
+            if checked is True:
+                with self._lock:
+                    self.revalidations += 1
+                self._set(key, stale, self.ttl)
+                return stale
+
+            value = loader() if checked is None or checked is False else checked
+        except NotFound as exc:
+            self._set(key, None, self.not_found_ttl, not_found=exc.message)
+            raise
+
+        self._set(key, value, self.ttl)
+        return value
+
+
+    def _check(self, key, value):
+        """ Validator result: True if value is still valid, otherwise its new value or None """
+        if self.validator is None:
+            return None
+
+        try:
+            return self.validator(key, value)
+        except NotFound:
+            raise
+        except Exception as exc:
+            logging.getLogger("SEL").warning(f"Schema cache: validation of '{key}' failed: {exc}")
+            return None
+
+
+    def _set(self, key, value, ttl, not_found=None):
+        if ttl <= 0:
+            return
+
+        self._entries.set(key, {
+            "value": value,
+            "not_found": not_found,
+            "used": False,
+            "expire_at": self.clock() + ttl
+        })
+
+
+    def invalidate(self, index=None):
+        """
+        Drop entries of the cache
+
+        :param index: Index name, drop all entries which expression can target it.
+                      If None, drop all entries
+        """
+        if index is None:
+            self._entries.clear()
+            return
+
+        self._entries.discard(
+            lambda key: key == index or any(fnmatch.fnmatchcase(index, p) for p in key.split(","))
+        )
+
+
+    def stats(self):
+        """ Return hits, misses, revalidations and size of the cache """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "size": self._entries.stats()["size"]
+            }
+
+
+class SchemaRefresher(threading.Thread):
+    """
+    Background thread revalidating used entries of a SchemaCache ahead of their expiry,
+    so request path does not wait for schema checks nor fetches
+
+    :param cache: SchemaCache to refresh, with a validator
+    :param loader: Function key -> value, to load changed entries
+    :param interval: Seconds between two refreshes
+    :param ahead: Revalidate entries expiring within <ahead> seconds
+    """
+
+    def __init__(self, cache, loader, interval, ahead):
+        super().__init__(name="SchemaRefresher", daemon=True)
+        self.cache = cache
+        self.loader = loader
+        self.interval = interval
+        self.ahead = ahead
+        self._stopped = threading.Event()
+
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.refresh()
+
+
+    def refresh(self):
+        """ Revalidate due entries once, return their keys """
+        keys = self.cache.due(self.ahead)
+        for key in keys:
+            try:
+                self.cache.revalidate(key, lambda: self.loader(key))
+            except Exception as exc:
+                logging.getLogger("SEL").warning(f"Schema refresher: refresh of '{key}' failed: {exc}")
+        return keys
+
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,322 @@
+import heapq
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+
+ALLOWED_FUNCTIONS = ["exists"]
+
+# Version of the layout of SchemaIndex attributes, to increase on any change of them,
+# persisted indexes of another layout are built again, see schema_store
+LAYOUT_VERSION = 1
+
+
+class SchemaIndex:
+    """
+    Flatten index of a schema, built once, to resolve field paths by lookups
+
+    Each field is indexed by its absolute path and by all suffixes of its path,
+    through a trie of reversed paths, with its nested contexts, type,
+    short path and accepted functions precomputed.
+
+    Fields are kept in schema order, depth first, as SchemaReader walkers return them.
+    """
+
+    def __init__(self, schema):
+        self.fields = []
+        self.by_path = {}
+        self.suffix_trie = trie_node()
+        self.suggest_strings = None
+
+        self.__index_properties(schema["properties"])
+        self.__compute_short_paths()
+
+
+    def __index_properties(self, properties):
+        for key, value, field_path, nested_chain in iter_properties(properties):
+            field_chain = nested_chain
+            if value.get("properties") and value.get("type") == "nested":
+                field_chain = nested_chain + (field_path,)
+
+            str_path = ".".join(field_path)
+
+            field = {
+                "position": len(self.fields),
+                "field": key,
+                "element": value,
+                "path": field_path,
+                "str_path": str_path,
+                "pretty_str_path": "." + str_path,
+                "type": value.get("type", "object"),
+                "format": value.get("format"),
+                "nested_chain": field_chain,
+                "nested": field_chain[-1] if field_chain else None,
+                "parent_nested": nested_chain[-1] if nested_chain else None,
+                "short_path": field_path,
+                "str_short_path": "." + str_path,
+                "accept_function": list(ALLOWED_FUNCTIONS)
+            }
+
+            self.fields.append(field)
+            self.by_path[field_path] = field
+
+            node = self.suffix_trie
+            for element in reversed(field_path):
+                node = node["children"].setdefault(element, trie_node())
+                node["fields"].append(field)
+
+
+    def __compute_short_paths(self):
+        """
+        Shortest path suffix which is not shared with any other field,
+        the full path if there is none.
+
+        Along a reversed path, fields sharing the suffix can only decrease,
+        then the first trie node with a single field gives its short path.
+        """
+        stack = [(child, 1) for child in self.suffix_trie["children"].values()]
+
+        while stack:
+            node, depth = stack.pop()
+
+            if len(node["fields"]) == 1:
+                field = node["fields"][0]
+                field["short_path"] = field["path"][-depth:]
+                if depth < len(field["path"]):
+                    field["str_short_path"] = ".".join(field["short_path"])
+                continue
+
+            stack += [(child, depth + 1) for child in node["children"].values()]
+
+
+    def lookup(self, query_field):
+        """
+        Fields matching a fraction path from the root of the schema
+        Absolute path starts with a dot element, eg. [".", "media", "label"]
+        """
+        if query_field[0] == ".":
+            field = self.by_path.get(tuple(query_field[1:]))
+            return [field] if field else []
+
+        node = self.suffix_trie
+        for element in reversed(query_field):
+            node = node["children"].get(element)
+            if node is None:
+                return []
+        return node["fields"]
+
+
+    def match(self, target_field):
+        """
+        Fields matching a string path, as SchemaReader.match_field
+        Eg. "label.name" for partial path or ".media.label.name" for absolute path
+        """
+        if target_field.startswith("."):
+            return self.lookup(["."] + target_field[1:].split("."))
+        return self.lookup(target_field.split("."))
+
+
+    def find(self, query_field, root=None):
+        """
+        Look for candidates of given field path, as SchemaReader.schema_finder
+
+        Return None when the root can not be resolved by the index,
+        in such case the schema walker must be used.
+        """
+        if root is None:
+            return [candidate(f, f["nested"]) for f in self.lookup(query_field)]
+
+        roots = self.match(root)
+        if len(roots) != 1:
+            return None
+
+        path = tuple(root.split("."))
+        element = roots[0]["element"]
+        properties = element.get("properties")
+        if path != roots[0]["path"] or not properties or "properties" in properties:
+            return None
+
+        # The root object itself
+        if len(query_field) == 1 and query_field[0] == path[-1]:
+            if path[-1] in element:
+                return None
+            return [{"element": element, "nested": list(path), "path": list(path)}]
+
+        field = list(query_field)
+        if field[0] == ".":
+            field = list(path) + field[1:]
+
+        depth = len(path)
+        found = [
+            candidate(f, nested_under(f, depth))
+            for f in self.lookup(field)
+            if len(f["path"]) > depth and f["path"][:depth] == path
+        ]
+
+        # Fields found from the schema root, under the root nested context
+        if not found:
+            found = [
+                candidate(f, f["nested"])
+                for f in self.lookup(query_field)
+                if f["nested"] and f["nested"][:depth] == path
+            ]
+
+        return found
+
+
+    def build_suggest_strings(self):
+        """
+        Index all path suffixes of fields, as strings, by length with their character counts
+        Fields sharing a suffix, eg. "name", share the entry.
+
+        Built on first suggestion if not called before
+        """
+        entries = {}
+        for field in self.fields:
+            if field["path"][-1].startswith("_"):
+                continue
+
+            path = field["path"]
+            strings = [".".join(path[-size:]) for size in range(1, len(path) + 1)]
+            for string in strings + [field["pretty_str_path"]]:
+                if string not in entries:
+                    entries[string] = {
+                        "string": string, "counts": dict(Counter(string)), "fields": []
+                    }
+                entries[string]["fields"].append(field)
+
+        by_length = defaultdict(list)
+        for entry in entries.values():
+            by_length[len(entry["string"])].append(entry)
+
+        self.suggest_strings = dict(by_length)
+        return self.suggest_strings
+
+
+    def suggest(self, target_field, min_score=0.6, size=3):
+        """
+        Closest fields of target_field, as SchemaReader.search_field
+        Score of a field is the best SequenceMatcher ratio between target and its path suffixes
+
+        Return list of (score, field), best scores first
+
+        Ratio is 2 * M / T, with M matching characters and T total length,
+        M can not be greater than the shorter length, neither than the common characters count.
+        Suffixes are compared from the best upper bound, until it's lower than min_score
+        or than the score of the last suggestion.
+        """
+        if self.suggest_strings is None:
+            self.build_suggest_strings()
+
+        target_length = len(target_field)
+        target_count = Counter(target_field).get
+
+        bounded = []
+        for length, entries in self.suggest_strings.items():
+            total = length + target_length
+            if 2.0 * min(length, target_length) / total < min_score:
+                continue
+
+            for entry in entries:
+                common = sum([min(n, target_count(c, 0)) for c, n in entry["counts"].items()])
+                bound = 2.0 * common / total
+                if bound >= min_score:
+                    bounded.append((bound, entry))
+
+        matcher = SequenceMatcher(None, "", target_field)
+        threshold = min_score
+        scores = {}
+
+        for bound, entry in sorted(bounded, key=lambda b: b[0], reverse=True):
+            if bound < threshold:
+                break
+
+            matcher.set_seq1(entry["string"])
+            score = matcher.ratio()
+            if score < threshold:
+                continue
+
+            for field in entry["fields"]:
+                if score > scores.get(field["position"], 0):
+                    scores[field["position"]] = score
+
+            if len(scores) >= size:
+                threshold = max(threshold, heapq.nlargest(size, scores.values())[-1])
+
+        scored_list = [(scores[p], self.fields[p]) for p in sorted(scores.keys())]
+        return sorted(scored_list, key=lambda s: s[0], reverse=True)[:size]
+
+
+################################################################################
+### Utils
+################################################################################
+
+def iter_properties(properties, path=(), nested_chain=()):
+    """
+    Iterate over fields of schema properties, depth first in schema order, without recursion
+    Yield (key, element, path, nested_chain), nested_chain being the nested paths containing the field
+
+    Elements are the schema ones, they must not be modified
+    """
+    stack = [(iter(properties.items()), path, nested_chain)]
+
+    while stack:
+        items, parent_path, chain = stack[-1]
+
+        for key, value in items:
+            if not isinstance(value, dict):
+                continue
+
+            field_path = parent_path + (key,)
+            yield key, value, field_path, chain
+
+            if value.get("properties"):
+                sub_chain = chain + (field_path,) if value.get("type") == "nested" else chain
+                stack.append((iter(value["properties"].items()), field_path, sub_chain))
+                break
+
+        else:
+            stack.pop()
+
+
+def trie_node():
+    return {"fields": [], "children": {}}
+
+
+def candidate(field, nested):
+    """ Candidate format of SchemaReader.schema_finder, safe to modify """
+    return {
+        "element": field["element"],
+        "nested": list(nested) if nested else None,
+        "path": list(field["path"])
+    }
+
+
+def field_details(field):
+    """ Field format of SchemaReader.match_field, safe to modify """
+    element = field["element"]
+    if "type" not in element:
+        element = dict(element, type="object")
+
+    nested = field["parent_nested"]
+    return {
+        "field": field["field"],
+        "element": element,
+        "path": list(field["path"]),
+        "str_path": field["str_path"],
+        "pretty_str_path": field["pretty_str_path"],
+        "nested": list(nested) if nested else None,
+        "str_nested": ".".join(nested) if nested else None,
+        "format": field["format"],
+        "short_path": list(field["short_path"]),
+        "str_short_path": field["str_short_path"],
+        "accept_function": list(field["accept_function"])
+    }
+
+
+def nested_under(field, depth):
+    """ Deepest nested context of the field under a root of given depth """
+    nested = None
+    for nested_path in field["nested_chain"]:
+        if len(nested_path) > depth:
+            nested = nested_path
+    return nested
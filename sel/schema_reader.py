@@ -1,12 +1,14 @@
 import json
+import bisect
+import hashlib
+from collections.abc import Mapping
 from difflib import SequenceMatcher
 import copy
 
 from . import meta
-from .utils import InternalServerError, InvalidClientInput
-
-
-ALLOWED_FUNCTIONS = ["exists"]
+from . import schema_index
+from .schema_index import SchemaIndex, ALLOWED_FUNCTIONS
+from .utils import InternalServerError, InvalidClientInput, LRUCache
 
 
 class SchemaError(Exception):
@@ -17,25 +19,117 @@ class SchemaError(Exception):
         return self.message
 
 
+class FieldInfo(Mapping):
+    """
+    Resolved query field, as returned by SchemaReader.get_field_info
+
+    Immutable and shared between calls, read it as a dictionary.
+    Paths are tuples, element is the schema element itself, it must not be modified.
+    Use to_dict to get a mutable copy, with lists paths.
+    """
+
+    __slots__ = ("element", "nested", "path", "query_field", "str_query_field",
+                 "str_path", "pretty_str_path", "short_path", "str_short_path",
+                 "str_nested", "accept_function", "function")
+
+    def __init__(self, values):
+        for key in self.__slots__:
+            value = values.get(key)
+            object.__setattr__(self, key, tuple(value) if isinstance(value, list) else value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"FieldInfo is immutable, can not set '{key}'")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"FieldInfo is immutable, can not delete '{key}'")
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, k) for k in self.__slots__ if k != "element"))
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self.items()),))
+
+    def __repr__(self):
+        return f"FieldInfo({self.to_dict()})"
+
+    def to_dict(self):
+        return {k: list(v) if isinstance(v, tuple) else v for k, v in self.items()}
+
+
 class SchemaReader:
+    """
+    Read the schema to resolve query fields
 
+    :param conf: Configuration of the query system
+    :param schema: Index mapping
+    :param use_index: Resolve fields with a precompiled SchemaIndex,
+                      otherwise walk the schema at each research
+    :param schema_index: Already compiled SchemaIndex of the schema, see schema_store
+    """
 
-    def __init__(self, conf, schema):
+    def __init__(self, conf, schema, use_index=True, schema_index=None):
         self.conf = conf
         self.schema = schema
+        self.index = schema_index
+        if self.index is None and use_index:
+            self.index = SchemaIndex(schema)
+
+        self.field_infos = LRUCache(conf["Schema"].getint("FieldInfoCacheSize"))
+        self.completion_paths = None
+        self.schema_fingerprint = None
+
+        # Index the schema was fetched from, its uuid and creation date, see SEL._revalidate_schema
+        self.source = None
+
+
+    def get_fingerprint(self):
+        """ Fingerprint of the schema, computed on first call, see fingerprint """
+        if self.schema_fingerprint is None:
+            self.schema_fingerprint = fingerprint(self.schema)
+        return self.schema_fingerprint
 
 
     def get_field_info(self, field, sub_properties=None, functions=False,
                        nested=None, can_raise=True):
         """
-        Return full information about a query field
-        Can raise exceptions
+        Return full information about a query field, as an immutable FieldInfo
+        Results are memoized, not found and ambiguous fields too
+
+        Can raise SchemaError, or return a dictionary with error and suggested fields
+        if can_raise is False
         """
         if sub_properties is None:
             sub_properties = self.conf["Queries"]["DefaultObjectSubfield"].split(",")
+
+        key = (field, tuple(sub_properties),
+               tuple(functions) if isinstance(functions, list) else bool(functions), nested)
+        info = self.field_infos.get(
+            key, lambda: self.__resolve_field_info(field, sub_properties, functions, nested))
+
+        if isinstance(info, FieldInfo):
+            return info
+
+        if can_raise:
+            raise SchemaError(info["raise_message"])
+        return {"error": info["error"], "fields": copy.deepcopy(info["fields"])}
+
+
+    def __resolve_field_info(self, field, sub_properties, functions, nested):
+        """ Resolve a query field, return a FieldInfo or an error dictionary """
         frac_field = field_to_fraction(field)
         frac_field, function = self.__function_detector(frac_field, functions, root=nested)
-        fields = self.schema_finder(frac_field, root=nested)
+        fields = self.find_field(frac_field, root=nested)
         fields = self.__query_field_pretty(fields)
 
         # Not found
@@ -51,12 +145,10 @@ class SchemaReader:
                                                          sub_properties)
 
             message = "Not Found: '%s'%s.%s" % (field, under_str, suffix_str)
-            if can_raise:
-                if suggest_list:
-                    message += f"\nSuggest: {json.dumps(suggest_list)}"
-                raise SchemaError(message)
-            else:
-                return {"error": message, "fields": suggest_list}
+            raise_message = message
+            if suggest_list:
+                raise_message += f"\nSuggest: {json.dumps(suggest_list)}"
+            return {"error": message, "raise_message": raise_message, "fields": suggest_list}
 
         # Ambiguous
         elif len(fields) > 1:
@@ -66,15 +158,12 @@ class SchemaReader:
             if len(fields) > 6:
                 can_be += ", etc"
             message = f'Ambiguous: "{field}". It can be: {can_be}.'
-            if can_raise:
-                raise SchemaError(message)
-            else:
-                return {"error": message, "fields": fields}
+            return {"error": message, "raise_message": message, "fields": fields}
 
         fields = self.__query_field_object(fields, nested, sub_properties)
         found = fields[0]
         found["function"] = function
-        return found
+        return FieldInfo(found)
 
 
     def __function_detector(self, field, functions, root=None):
@@ -98,12 +187,12 @@ class SchemaReader:
         for field in fields:
             field["str_path"] = path_to_string(field["path"])
             field["pretty_str_path"] = "." + field["str_path"]
-            field["short_path"] = self.short_path(field["path"])
+            found = self.__match_one_field(field["pretty_str_path"])
+            field["short_path"] = list(found["short_path"])
             field["str_short_path"] = path_to_string(field["short_path"])
             field["str_nested"] = path_to_string(field["nested"])
-            field["accept_function"] = self.accept_function(field["pretty_str_path"])
-            if "type" not in field["element"] and "properties" in field["element"]:
-                field["element"]["type"] = "object"
+            field["accept_function"] = list(found["accept_function"])
+            field["element"] = object_element(field["element"])
         return fields
 
 
@@ -125,16 +214,11 @@ class SchemaReader:
                         if field["element"].get("type") == "nested":
                             field["nested"] = list(field["path"])
 
-                        # Select sub-properties
-                        field["element"] = field["element"]["properties"][sub]
-
-                        # Set object type (implicite in ElasticSearch)
-                        if field["element"].get("properties") and \
-                           field["element"].get("type") is None:
-                            field["element"]["type"] = "object"
+                        # Select sub-properties, with object type (implicite in ElasticSearch)
+                        field["element"] = object_element(field["element"]["properties"][sub])
 
                         # Set paths
-                        field["path"].append(sub)
+                        field["path"] = field["path"] + [sub]
                         field["str_path"] = path_to_string(field["path"])
                         field["short_path"] = self.short_path(field["path"], sub_properties=sub_properties)
                         field["str_short_path"] = path_to_string(field["short_path"])
@@ -147,13 +231,22 @@ class SchemaReader:
 ####### Utils
 ################################################################################
 
-    def accept_function(self, pretty_str_path):
-        founds = self.match_field(pretty_str_path)
+    def __match_one_field(self, pretty_str_path):
+        """ Field matching the path, with its short path and accept functions """
+        if self.index is not None:
+            founds = self.index.match(pretty_str_path)
+        else:
+            founds = self.match_field(pretty_str_path)
+
         if not founds:
             raise InternalServerError(f"Not found field: {pretty_str_path}")
         elif len(founds) > 1:
             raise InternalServerError(f"Ambigiuous path: {pretty_str_path}")
-        return founds[0]["accept_function"]
+        return founds[0]
+
+
+    def accept_function(self, pretty_str_path):
+        return list(self.__match_one_field(pretty_str_path)["accept_function"])
 
 
     def short_path(self, path, sub_properties=None):
@@ -161,12 +254,7 @@ class SchemaReader:
             path = path[:-1]
 
         pretty_str_path = "." + path_to_string(path)
-        founds = self.match_field(pretty_str_path)
-        if not founds:
-            raise InternalServerError(f"Not found field: {pretty_str_path}")
-        elif len(founds) > 1:
-            raise InternalServerError(f"Ambigiuous path: {pretty_str_path}")
-        return founds[0]["short_path"]
+        return list(self.__match_one_field(pretty_str_path)["short_path"])
 
 
     def schema_object_matching(self, field, path, root):
@@ -197,6 +285,23 @@ class SchemaReader:
         return found
 
 
+    def find_field(self, query_field, root=None):
+        """
+        Look for candidats of given field path in the schema, same as schema_finder
+        Use the precompiled schema index if available
+
+        Parameters
+         - query_field: field path split by dot '.' (can start with dot for absolute path)
+         - root: root path in string where start searching from
+        """
+        if self.index is not None and query_field:
+            found = self.index.find(query_field, root=root)
+            if found is not None:
+                return [self.__schema_finder_format_output(query_field, f) for f in found]
+
+        return self.schema_finder(query_field, root=root)
+
+
     def schema_finder(self, query_field, root=None, path=[], nested=None):
         """
         Look for candidats of given field path in the schema
@@ -265,12 +370,7 @@ class SchemaReader:
         TODO: Refacto
         """
         path = root.split(".")
-        found = self.match_field(root)
-        if len(found) == 0:
-            raise InternalServerError(f"schema_finder: '{root}' root does not exists")
-        if len(found) > 1:
-            raise InternalServerError(f"schema_finder: '{root}' ambigous root")
-        root = found[0]["element"]
+        root = self.__root_field(root)["element"]
 
         if field:
             if len(path) > 0:
@@ -286,6 +386,16 @@ class SchemaReader:
         return root, field, path
 
 
+    def __root_field(self, root):
+        """ Field of a root path in string """
+        found = self.match_field(root)
+        if len(found) == 0:
+            raise InternalServerError(f"schema_finder: '{root}' root does not exists")
+        if len(found) > 1:
+            raise InternalServerError(f"schema_finder: '{root}' ambigous root")
+        return found[0]
+
+
     def __schema_finder_format_output(self, query_field, field):
         root_prefix = ""
         if query_field[0] == ".":
@@ -329,35 +439,38 @@ class SchemaReader:
     def list_field(self, root=None, path=[], nested=None, sub_properties=None):
         """
         List all existing fields of the schema in details
+        The schema is walked without recursion and is not modified
+
+        Parameters
+         - root: properties to list, or root path in string to list the fields under
         """
         if root is None:
             root = self.schema["properties"]
         elif isinstance(root, str):
-            root, _, _ = self.__root_from_string(root, None)
+            root_field = self.__root_field(root)
+            path = root_field["path"]
+            nested = root_field["nested"]
+            if root_field["element"].get("type") == "nested":
+                nested = path
+            root = root_field["element"].get("properties", {})
+
+        nested_chain = (tuple(nested),) if nested else ()
+        properties = schema_index.iter_properties(root, tuple(path), nested_chain)
 
         fields = []
-        for key, value in root.items():
-            sub_path = copy.deepcopy(path)
-            sub_path.append(key)
-            if isinstance(value, dict):
-                value["type"] = value.get("type", "object")
-                fields.append({
-                    "field": key,
-                    "element": value,
-                    "path": sub_path,
-                    "str_path": path_to_string(sub_path),
-                    "pretty_str_path": "." + path_to_string(sub_path),
-                    "nested": nested,
-                    "str_nested": path_to_string(nested),
-                    "format": value.get("format")
-                })
-
-                if "properties" in value:
-                    sub_nested = sub_path if value.get("type") == "nested" else nested
-                    #pylint: disable-all
-                    fields += self.list_field(root=root[key]["properties"],
-                                              path=sub_path,
-                                              nested=sub_nested)
+        for key, value, field_path, chain in properties:
+            field_nested = chain[-1] if chain else None
+            str_path = ".".join(field_path)
+            fields.append({
+                "field": key,
+                "element": object_element(value),
+                "path": list(field_path),
+                "str_path": str_path,
+                "pretty_str_path": "." + str_path,
+                "nested": list(field_nested) if field_nested else None,
+                "str_nested": path_to_string(field_nested),
+                "format": value.get("format")
+            })
 
         return fields
 
@@ -391,6 +504,14 @@ class SchemaReader:
         """
         Search for the closest field in the schema
         """
+        if self.index is not None and root is None and isinstance(target_field, str):
+            scored_list = []
+            for score, field in self.index.suggest(target_field, min_score=min_score):
+                details = schema_index.field_details(field)
+                details["score"] = score
+                scored_list.append(details)
+            return scored_list
+
         fields = self.list_field(root=root, sub_properties=sub_properties)
 
         scored_list = []
@@ -399,16 +520,7 @@ class SchemaReader:
             if field["path"][-1].startswith("_"):
                 continue
 
-            best_score = 0
-            for path_size in range(1, len(field["path"]) + 2):
-                str_path = field["pretty_str_path"]
-                if path_size <= len(field["path"]):
-                    str_path = path_to_string(field["path"][-path_size:])
-                score = SequenceMatcher(None, str_path, target_field).ratio()
-                if score > best_score:
-                    best_score = score
-
-            field["score"] = best_score
+            field["score"] = field_score(field["path"], field["pretty_str_path"], target_field)
             if field["score"] >= min_score:
                 scored_list.append(field)
 
@@ -418,10 +530,23 @@ class SchemaReader:
         return sorted(scored_list, key=lambda f: f["score"], reverse=True)[:3]
 
 
+    def search_fields(self, target_fields, root=None, sub_properties=None, min_score=0.6):
+        """
+        Search for the closest fields of each target field in the schema
+        """
+        return [
+            self.search_field(target, root=root, sub_properties=sub_properties, min_score=min_score)
+            for target in target_fields
+        ]
+
+
     def match_field(self, target_field, root=None):
         """
         Found fields matching target_field path
         """
+        if self.index is not None and root is None:
+            return [schema_index.field_details(f) for f in self.index.match(target_field)]
+
         fields = self.list_field(root=root)
 
         founds = []
@@ -441,6 +566,30 @@ class SchemaReader:
         return founds
 
 
+    def complete_field(self, prefix, size=10):
+        """
+        Field paths starting with prefix, for autocomplete
+        Paths and their dotted suffixes are sorted once, then found by bisection
+        """
+        if self.completion_paths is None:
+            paths = set()
+            for field in self.list_field():
+                if field["path"][-1].startswith("_"):
+                    continue
+                paths.add(field["pretty_str_path"])
+                paths.update(path_to_string(field["path"][i:]) for i in range(len(field["path"])))
+            self.completion_paths = sorted(paths)
+
+        founds = []
+        position = bisect.bisect_left(self.completion_paths, prefix)
+        for path in self.completion_paths[position:position + size]:
+            if not path.startswith(prefix):
+                break
+            founds.append(path)
+
+        return founds
+
+
     def subfield(self, field, ignore_endswith=None, field_type=None):
         """
         List all subfield of given field path
@@ -450,7 +599,7 @@ class SchemaReader:
         field_path = field.split(".")
         if field.startswith("."):
             field_path = ["."] + field_path
-        fields = self.schema_finder(field_path)
+        fields = self.find_field(field_path)
         if len(fields) == 0:
             raise InternalServerError(f"Not found: {field}")
         elif len(fields) > 1:
@@ -471,12 +620,38 @@ class SchemaReader:
 ### Utils
 ################################################################################
 
+def fingerprint(schema):
+    """ Fingerprint of a mapping, identical for identical mappings """
+    dump = json.dumps(schema, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+
 def path_to_string(path):
     if path is not None and len(path) > 0 and path[0] != None:
         return ".".join(path)
     return None
 
 
+def object_element(element):
+    """ Element with its type, object if not set (implicite in ElasticSearch), the schema is not modified """
+    if "type" in element:
+        return element
+    return dict(element, type="object")
+
+
+def field_score(path, pretty_str_path, target_field):
+    """ Best similarity score between target field and all path suffixes of a field """
+    best_score = 0
+    for path_size in range(1, len(path) + 2):
+        str_path = pretty_str_path
+        if path_size <= len(path):
+            str_path = path_to_string(path[-path_size:])
+        score = SequenceMatcher(None, str_path, target_field).ratio()
+        if score > best_score:
+            best_score = score
+    return best_score
+
+
 def string_to_path(str_path):
     path = str_path.split(".")
     if len(path[0]) == 0:
@@ -0,0 +1,105 @@
+"""
+Persist compiled schemas on disk, to start workers without fetching and compiling schemas
+
+Files are named by the fingerprint of their mapping and contain the mapping with its
+compiled SchemaIndex and the version of its layout. An index of another layout is built
+again from the mapping. They are pickle files, only load files you have written yourself.
+"""
+import os
+import pickle
+
+from . import schema_index
+from .schema_reader import SchemaReader, fingerprint
+from .utils import InternalServerError
+
+
+STORE_VERSION = 1
+
+FILE_EXTENSION = ".schema.pickle"
+
+
+def file_path(directory, schema_fingerprint):
+    return os.path.join(directory, schema_fingerprint + FILE_EXTENSION)
+
+
+def dump(reader, directory, indexes=None):
+    """
+    Write the compiled schema of a SchemaReader into directory
+
+    :param reader: SchemaReader to persist, with its schema index
+    :param directory: Directory to write the file
+    :param indexes: Index(es) expressions this schema is used for, eg. ["foo", "bar_*"]
+    :return: Path of the written file
+    """
+    if reader.index is None:
+        raise InternalServerError("Schema store: only indexed SchemaReader can be persisted")
+
+    reader.index.build_suggest_strings()
+    schema_fingerprint = fingerprint(reader.schema)
+    path = file_path(directory, schema_fingerprint)
+
+    # Keep index(es) of the same schema already written
+    indexes = list(indexes) if indexes else []
+    if os.path.exists(path):
+        try:
+            indexes = [i for i in read(path)["indexes"] if i not in indexes] + indexes
+        except InternalServerError:
+            pass
+
+    data = {
+        "version": STORE_VERSION,
+        "fingerprint": schema_fingerprint,
+        "indexes": indexes,
+        "schema": reader.schema,
+        "index": reader.index,
+        "index_layout": schema_index.LAYOUT_VERSION
+    }
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fd:
+        pickle.dump(data, fd, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def read(path):
+    """ Read raw data of a file written by dump, check its version """
+    with open(path, "rb") as fd:
+        data = pickle.load(fd)
+
+    if not isinstance(data, dict) or data.get("version") != STORE_VERSION:
+        version = data.get("version") if isinstance(data, dict) else None
+        raise InternalServerError(
+            f"Schema store: unsupported version {version} of '{path}', expected {STORE_VERSION}"
+        )
+
+    return data
+
+
+def load(conf, path):
+    """
+    Read a compiled schema written by dump
+
+    :param conf: Configuration of the query system
+    :param path: Path of the file
+    :return: Dictionary fingerprint, indexes, reader
+    """
+    data = read(path)
+    index = data["index"]
+    if data.get("index_layout") != schema_index.LAYOUT_VERSION:
+        index = None
+
+    reader = SchemaReader(conf, data["schema"], schema_index=index)
+    reader.schema_fingerprint = data["fingerprint"]
+    return {
+        "fingerprint": data["fingerprint"],
+        "indexes": data["indexes"],
+        "reader": reader
+    }
+
+
+def load_directory(conf, directory):
+    """ Read all compiled schemas of a directory, see load. Oldest written first """
+    paths = [os.path.join(directory, n) for n in os.listdir(directory) if n.endswith(FILE_EXTENSION)]
+    return [load(conf, path) for path in sorted(paths, key=os.path.getmtime)]
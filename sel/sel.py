@@ -1,9 +1,8 @@
 # External deps
-import json
 import copy
+import json
 import logging
 from typing import List, Union, Generator, Any, Callable, Tuple
-from datetime import datetime
 from elasticsearch.exceptions import NotFoundError
 import elasticsearch
 import configparser
@@ -12,16 +11,26 @@ from collections import defaultdict
 # Internal deps
 from . import (
     meta, utils, date_utils, upload, scroll, query_generator, query_string_parser, config,
-    query_object_formator
+    query_object_formator, schema_store, query_string_descent, query_budget, simple_query,
+    query_batch, query_ast
 )
 from .utils import InternalServerError, InvalidClientInput, NotFound
 from .query_generator import QueryGenerator
 from .schema_reader import SchemaReader
+from .schema_cache import SchemaCache, SchemaRefresher
 from .post_formater import PostFormater
+from .query_completion import QueryCompleter
+from .plan_cache import PlanCache
+from .prepared_query import PreparedQuery
 
 
 DEFAULT_CONF = config.read()
 
+QUERY_STRING_PARSERS = {
+    "descent": query_string_descent,
+    "pypeg2": query_string_parser
+}
+
 
 class SEL:
     """
@@ -45,6 +54,53 @@ class SEL:
         self.conf = conf
         self.elastic = elastic
         self.PostFormater = PostFormater()
+        self.query_string_cache = utils.LRUCache(conf["Queries"].getint("QueryStringCacheSize"))
+
+        parser_name = conf["Queries"]["QueryStringParser"]
+        if parser_name not in QUERY_STRING_PARSERS:
+            raise InternalServerError(
+                f"Unknown QueryStringParser '{parser_name}', expected one of {list(QUERY_STRING_PARSERS)}"
+            )
+        self.query_string_parser = QUERY_STRING_PARSERS[parser_name]
+
+        # Limits checked while scanning, on the parsed query object with the reference parser
+        self.query_limits = query_budget.read_limits(conf)
+        self.descent_options = dict(
+            self.query_limits, max_literal_length=conf["Queries"].getint("MaxLiteralLength")
+        )
+        self.query_string_options = {}
+        if self.query_string_parser is query_string_descent:
+            self.query_string_options = self.descent_options
+
+        # Autocomplete parse states by index and session, always done by the descent parser
+        self.query_completers = utils.LRUCache(conf["Queries"].getint("CompleterCacheSize"))
+
+        # Generated queries by schema fingerprint, and last fingerprint of each index
+        self.plan_cache = PlanCache(conf["Queries"].getint("PlanCacheSize"))
+        self.schema_fingerprints = {}
+
+        # Schemas loaded by load_schemas without Elasticsearch connection, never evicted
+        self.stored_schemas = {}
+
+        validator = self._revalidate_schema if conf["Schema"].getboolean("CacheRevalidate") else None
+        self.schema_cache = SchemaCache(
+            conf["Schema"].getfloat("CacheTTL"),
+            conf["Schema"].getint("CacheMaxEntries"),
+            not_found_ttl=conf["Schema"].getfloat("CacheNotFoundTTL"),
+            validator=validator
+        )
+
+        # Background revalidation of used schemas, stop it with sel.schema_refresher.stop()
+        self.schema_refresher = None
+        refresh_interval = conf["Schema"].getfloat("RefreshInterval")
+        if elastic is not None and refresh_interval > 0:
+            self.schema_refresher = SchemaRefresher(
+                self.schema_cache,
+                self._load_schema_reader,
+                refresh_interval,
+                conf["Schema"].getfloat("RefreshAhead")
+            )
+            self.schema_refresher.start()
 
 
     def _schema_reader(self, index: str) -> SchemaReader:
@@ -54,8 +110,109 @@ class SEL:
         :param index: Index(es) to read the must recent schema, eg. "foo" or "foo,bar"
         :return: Instance of SchemaReader on the input index
         """
-        schema = self.get_schema(index)
-        return SchemaReader(self.conf, schema)
+        reader = self.stored_schemas.get(index)
+        if reader is not None:
+            return reader
+        return self.schema_cache.get(index, lambda: self._load_schema_reader(index))
+
+
+    def _load_schema_reader(
+            self, index: str, newest: str = None, source: dict = None, mapping: dict = None
+    ) -> SchemaReader:
+        """
+        Fetch schema of the given index(es) and compile it, without cache
+
+        :param index: Index(es), eg. "foo" or "foo,bar"
+        :param newest: Newest index and its source, if already fetched, see _newest_index_source
+        :param source: Source of the newest index
+        :param mapping: Mapping of the newest index, if already fetched
+        :return: SchemaReader
+        """
+        if self.elastic is None:
+            raise NotFound(f"Index(es) not found: {index}, no Elasticsearch connection nor loaded schema")
+
+        if newest is None:
+            newest, source = self._newest_index_source(index)
+        if mapping is None:
+            mapping = self._fetch_mapping(index, newest)
+
+        reader = SchemaReader(self.conf, mapping)
+        reader.source = source
+        self.__track_fingerprint(index, reader)
+        return reader
+
+
+    def __track_fingerprint(self, index: str, reader: SchemaReader) -> None:
+        """ Drop generated queries of the previous schema of index, if it has changed """
+        fingerprint = reader.get_fingerprint()
+        previous = self.schema_fingerprints.get(index)
+        if previous is not None and previous != fingerprint:
+            self.plan_cache.drop(previous)
+        self.schema_fingerprints[index] = fingerprint
+
+
+    def _revalidate_schema(self, index: str, reader: SchemaReader) -> Union[bool, SchemaReader]:
+        """
+        Cheap check of a cached schema, against the newest index of index(es):
+        its uuid and creation date, then the _meta.version if the cached mapping has one,
+        otherwise a hash of its mapping, which may have been updated in place.
+        Settings and mapping fetched by the check are used to load the new schema
+
+        :param index: Index(es) of the cached schema, eg. "foo" or "foo_*"
+        :param reader: Cached SchemaReader
+        :return: True if the cached schema is still the most recent one, otherwise the new one
+        """
+        if self.elastic is None:
+            return True
+
+        newest, source = self._newest_index_source(index)
+        if reader.source is not None and reader.source != source:
+            return self._load_schema_reader(index, newest=newest, source=source)
+
+        version = (reader.schema.get("_meta") or {}).get("version")
+
+        if version is not None:
+            response = self.elastic.indices.get_mapping(
+                index=newest, filter_path="*.mappings._meta.version"
+            )
+            mappings = response.get(newest, {}).get("mappings", {})
+            if mappings.get("_meta", {}).get("version") == version:
+                return True
+            return self._load_schema_reader(index, newest=newest, source=source)
+
+        mapping = self._fetch_mapping(index, newest)
+        if schema_store.fingerprint(mapping) == reader.get_fingerprint():
+            return True
+        return self._load_schema_reader(index, newest=newest, source=source, mapping=mapping)
+
+
+    def _newest_index_source(self, index: str) -> Tuple[str, dict]:
+        """
+        Newest created index of index(es), with its uuid and creation date, from its settings only
+
+        :param index: Index(es), eg. "foo" or "foo_*,bar"
+        :return: Index name, dictionary index, uuid and creation_date
+        """
+        try:
+            response = self.elastic.indices.get_settings(
+                index=index,
+                name="index.creation_date,index.uuid",
+                filter_path="*.settings.index.creation_date,*.settings.index.uuid"
+            )
+        except NotFoundError:
+            raise NotFound(f"Index(es) not found: {index}")
+
+        if not response:
+            raise NotFound(f"Index(es) not found: {index}")
+
+        creation_date = lambda item: int(item[1]["settings"]["index"]["creation_date"])
+        newest, settings = max(response.items(), key=creation_date)
+        settings = settings["settings"]["index"]
+        return newest, {
+            "index": newest,
+            "uuid": settings.get("uuid"),
+            "creation_date": settings["creation_date"]
+        }
 
 
     @utils.elastic_exception_detailor
@@ -63,8 +220,10 @@ class SEL:
         """
         Get must recent schema of given index(es)
 
+        Schemas are cached, see :ref:`conf.ini` Schema section and invalidate_schema
+
         :param index: Index(es) to get schema(s), eg. "foo" or "foo,bar"
-        :return: Must recent mapping
+        :return: Must recent mapping, a copy free to be modified
 
         .. code-block:: python
 
@@ -72,15 +231,110 @@ class SEL:
             {mapping ... }
 
         """
+        return copy.deepcopy(self._schema_reader(index).schema)
 
+
+    def invalidate_schema(self, index: str = None) -> None:
+        """
+        Drop cached schemas, to use after a mapping update
+
+        :param index: Index name, drop all cached expressions which can target it, eg. "foo"
+                      will also drop "foo,bar" and "fo*". If None, drop all cached schemas
+        :return: None
+
+        .. code-block:: python
+
+            > sel.invalidate_schema("foo")
+        """
+        self.schema_cache.invalidate(index)
+
+
+    def cache_stats(self) -> dict:
+        """
+        Statistics of the caches of this instance
+
+        :return: Dictionary schema, query_string, plan, each with hits, misses, size ...
+
+        .. code-block:: python
+
+            > sel.cache_stats()
+            {
+               'schema': {'hits': 41, 'misses': 1, 'revalidations': 0, 'size': 1},
+               'query_string': {'hits': 30, 'misses': 12, 'hit_rate': 0.714, 'size': 12},
+               'plan': {'hits': 28, 'misses': 14, 'hit_rate': 0.667, 'size': 14}
+            }
+        """
+        return {
+            "schema": self.schema_cache.stats(),
+            "query_string": self.query_string_cache.stats(),
+            "plan": self.plan_cache.stats()
+        }
+
+
+    @utils.elastic_exception_detailor
+    def save_schema(self, index: str, directory: str) -> str:
+        """
+        Write the compiled schema of index(es) into a directory, to be loaded by load_schemas
+
+        :param index: Index(es), eg. "foo" or "foo,bar"
+        :param directory: Directory to write the file, named by the schema fingerprint
+        :return: Path of the written file
+
+        .. code-block:: python
+
+            > sel.save_schema("foo", "/var/cache/sel")
+            '/var/cache/sel/3f7a...e21b.schema.pickle'
+        """
+        reader = self._schema_reader(index)
+        return schema_store.dump(reader, directory, indexes=[index])
+
+
+    def load_schemas(self, directory: str) -> List[str]:
+        """
+        Load compiled schemas written by save_schema into the schema cache.
+        Without Elasticsearch connection, SEL(None), loaded schemas are kept apart from the cache,
+        they never expire nor are evicted, otherwise they follow the cache TTL.
+
+        Only load files you have written yourself, they are pickle files.
+
+        :param directory: Directory of the files
+        :return: Loaded index(es)
+
+        .. code-block:: python
+
+            > sel = SEL(None)
+            > sel.load_schemas("/var/cache/sel")
+            ['foo']
+            > sel.generate_query({"query": "label = bag"}, index="foo")
+        """
+        loaded = []
+
+        for stored in schema_store.load_directory(self.conf, directory):
+            for index in stored["indexes"]:
+                self.__track_fingerprint(index, stored["reader"])
+                if self.elastic is None:
+                    self.stored_schemas[index] = stored["reader"]
+                else:
+                    self.schema_cache.set(index, stored["reader"])
+                loaded.append(index)
+
+        return loaded
+
+
+    def _fetch_mapping(self, index: str, newest: str) -> dict:
+        """
+        Request the mapping of the newest index of index(es)
+
+        :param index: Index(es) of the newest index, for the not found message
+        :param newest: Index name, see _newest_index_source
+        :return: Mapping
+        """
         try:
-            schemas = self.elastic.indices.get(index=index)
+            schemas = self.elastic.indices.get_mapping(index=newest)
         except NotFoundError:
             raise NotFound(f"Index(es) not found: {index}")
 
-        latest_created_index = meta.read_meta(schemas)[0]["index"]
-
-        return schemas[latest_created_index]["mappings"]
+        return schemas[newest]["mappings"]
 
 
     @utils.elastic_exception_detailor
@@ -116,6 +370,7 @@ class SEL:
         """
         Scroll over documents with a query, can get all documents of index(es).
         First call without scroll_id will return a scroll_id to use for next requests.
+        Documents are in index order (sort: _doc) unless the query has a sort, eg. sort: auto
 
         Warning: Don't forget to clear scroll_id after usage
 
@@ -135,7 +390,9 @@ class SEL:
 
             > sel.clear_scroll("cXVlc...")
         """
-        query_obj = self.generate_query(query, index=index)["elastic_query"]
+        query_obj = self.generate_query(self._bulk_query(query), index=index)
+        self._store_terms_lookups(query_obj["query_data"])
+        query_obj = query_obj["elastic_query"]
         scroll_id, documents = scroll.scroll(
             self.elastic, index, query_obj, cash_time, scroll_id=scroll_id
         )
@@ -183,9 +440,8 @@ class SEL:
             > list(sel.download_aggreg("foo", base_aggreg, query))
             [{'key': '1446587002614128796', 'doc_count': 1}, ...]
         """
-        query["meta"] = query["meta"] if query.get("meta") else {}
-        query["meta"]["size"] = 0
         query = self._to_queryobject(query)
+        query = query.replace(meta=dict(query.get("meta") or {}, size=0))
 
         if len(query.get("aggregations", {}).keys()) == 0:
             raise InvalidClientInput("Download aggreg MUST HAVE ONE aggregation")
@@ -193,11 +449,9 @@ class SEL:
             raise InvalidClientInput("Download aggreg MUST HAVE ONLY ONE aggregation")
 
         self.logger.debug("Partioning ...")
-        original_query = copy.deepcopy(query)
-        partition_query = copy.deepcopy(query)
-        base_aggreg["size"] = 0
+        base_aggreg = dict(base_aggreg, size=0)
         interval = base_aggreg.get("interval")
-        partition_query["aggregations"] = {"parts": base_aggreg}
+        partition_query = query.replace(aggregations={"parts": base_aggreg})
         res = self.search(index, partition_query)
 
         partitions = utils.get_lastest_sub_data(res["results"]["aggregations"]["parts"])["buckets"]
@@ -208,18 +462,16 @@ class SEL:
         )
         self.logger.debug(f"Found {len(partitions)} partitions")
 
-        aggreg_key = list(original_query["aggregations"].keys())[0]
         part_field = base_aggreg.get("field")
-        query["aggregations"][aggreg_key]["size"] = 999999 # Do something better !!
 
         self.logger.debug("Downloading aggregation buckets ...")
 
         if not partitions:
-            yield from self._download_aggreg_one_partition(index, original_query)
+            yield from self._download_aggreg_one_partition(index, query)
 
         for part in partitions:
             yield from self._download_aggreg_one_partition(
-                index, original_query, part=part, part_field=part_field, interval=interval
+                index, query, part=part, part_field=part_field, interval=interval
             )
 
 
@@ -236,8 +488,7 @@ class SEL:
         :param part_field: Field path for the partition
         :return: Buckets generator
         """
-        part_query = copy.deepcopy(query)
-        items = [part_query.get("query")]
+        items = [query.get("query")]
 
         if part:
             reader = self._schema_reader(index)
@@ -251,7 +502,7 @@ class SEL:
             else:
                 items.append({"field": part_field, "value": part["key"]})
 
-        part_query["query"] = utils.build_group("and", items)
+        part_query = query.replace(query=utils.build_group("and", items))
         res = self.search(index, part_query)
 
         aggreg_key = list(part_query["aggregations"].keys())[0]
@@ -270,7 +521,7 @@ class SEL:
         interval = interval if interval else self.conf["Aggregations"]["DefaultDateInterval"]
         delta = date_utils.interval_to_delta_time(interval)
         key, date_format = date_utils.str_date_to_datetime(key_as_string)
-        return datetime.strftime(key + delta, date_format)
+        return date_utils.format_date(key + delta, date_format)
 
 
 ##########################################################################
@@ -293,10 +544,9 @@ class SEL:
         found = query_generator.find_filter(query, "deleted")
 
         if not found and exclude_deleted_docs:
-            found_fields = reader.schema_finder([".", "deleted"])
+            found_fields = reader.find_field([".", "deleted"])
             if found_fields:
-                new_filter = {"field": ".deleted", "comparator": "!=", "value": True}
-                query = query_generator.top_insert_filter(query, "and", new_filter)
+                query = query_generator.top_insert_filter(query, "and", query_generator.DELETED_FILTER)
 
         return query
 
@@ -306,7 +556,7 @@ class SEL:
         Convert input query to query object
 
         :param input_query: SEL query (string or object)
-        :return: SEL query object
+        :return: SEL query object, frozen see query_ast, shared between calls
         """
         if input_query is None:
             input_query = {}
@@ -317,7 +567,8 @@ class SEL:
         query_obj = None
 
         if not isinstance(input_query.get("query"), str):
-            query_obj = copy.deepcopy(input_query)
+            query_budget.check_query(input_query, **self.query_limits)
+            query_obj = query_ast.freeze(input_query)
 
         elif isinstance(input_query.get("query"), str) and \
            ("aggregations" in input_query or "sort" in input_query):
@@ -328,12 +579,42 @@ class SEL:
         else:
             query_string = input_query.get("query", "")
             self.logger.debug("query string = %s", json.dumps(query_string))
-            results = query_string_parser.parse(query_string)
-            query_obj = query_object_formator.formator(results)
+            query_obj = query_ast.freeze(simple_query.parse(query_string, **self.descent_options))
+            if query_obj is None:
+                query_obj = self.query_string_cache.get(
+                    query_string, lambda: self._parse_query_string(query_string)
+                )
+
+            if input_query.get("meta") is not None:
+                query_obj = query_obj.replace(meta=input_query["meta"])
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("query object = %s", json.dumps(query_obj))
+        return query_obj
+
+
+    def _bulk_query(self, input_query: dict) -> dict:
+        """
+        Query object for scroll and bulk operations: in index order if it has no sort,
+        cheaper than sorting documents (auto sort) when all of them are read
+
+        :param input_query: SEL query (string or object)
+        :return: SEL query object, frozen see query_ast
+        """
+        query_obj = self._to_queryobject(input_query)
+        if not query_obj.get("sort"):
+            query_obj = query_obj.replace(sort=[{"field": query_generator.DOC_SORT_FIELD}])
+        return query_obj
 
-        query_obj = utils.set_if_exists(input_query, query_obj, ["meta"])
 
-        self.logger.debug("query object = %s", json.dumps(query_obj))
+    def _parse_query_string(self, query_string: str) -> dict:
+        """ Parse a query string into a frozen query object, without cache """
+        results = self.query_string_parser.parse(query_string, **self.query_string_options)
+        query_obj = query_ast.freeze(query_object_formator.formator(results))
+
+        # The descent parser checks the limits while scanning, the others do not
+        if self.query_string_parser is not query_string_descent:
+            query_budget.check_query(query_obj, **self.descent_options)
         return query_obj
 
 
@@ -364,17 +645,177 @@ class SEL:
             }
 
         """
-        warns = []
-        query_obj = None
-
         if index is None and schema is None:
             raise InternalServerError("GenerateQuery: index or schema must be given")
 
+        reader = None
         if index is not None:
-            schema = self.get_schema(index)
+            reader = self._schema_reader(index)
 
         query_obj = self._to_queryobject(query)
-        generator = QueryGenerator(self.conf, schema, log_level=self.log_level)
+
+        # Schema is compiled only if the query is not already generated
+        if reader is not None:
+            return self._plan_query(query_obj, no_deleted, reader.get_fingerprint(), lambda: reader)
+
+        fingerprint = schema_store.fingerprint(schema)
+        return self._plan_query(
+            query_obj, no_deleted, fingerprint, lambda: SchemaReader(self.conf, schema)
+        )
+
+
+    @utils.elastic_exception_detailor
+    def generate_queries(
+            self, queries: List[dict], schema: dict = None, index: str = None,
+            no_deleted: bool = True, workers: int = None
+    ) -> List[dict]:
+        """
+        Generate Elasticsearch queries from SEL queries, spread over a pool of processes
+        Each process compiles the schema once, use it to generate numerous queries
+
+        :param queries: SEL queries (string or object)
+        :param schema: Will get it back if not given
+        :param index: Index(es), can be None if schema is given, otherwise eg. "foo" or "foo,bar"
+        :param no_deleted: True to filter out deleted documents (if configured to), default: True
+        :param workers: Number of processes, default: number of CPUs, 1 to generate them in this process
+        :return: Results of generate_query, in order, or an error for each failed query
+
+        .. code-block:: python
+
+            > queries = [{"query": ".id = 93428yr9"}, {"query": ".id in"}]
+
+            > sel.generate_queries(queries, index="foo", workers=4)
+            [
+               {
+                  'warns': [],
+                  'elastic_query': {...},
+                  'internal_query': {'query': {'field': '.id', 'comparator': '=', 'value': '93428yr9'}},
+                  'query_data': {}
+               },
+               {
+                  'error': {
+                     'type': 'InvalidClientInput',
+                     'message': 'Invalid syntax at line 1, global position 6: nothing found, but "in values" was expected after "in" comparator.'
+                  }
+               }
+            ]
+        """
+        if index is None and schema is None:
+            raise InternalServerError("GenerateQueries: index or schema must be given")
+
+        reader = self._schema_reader(index) if index is not None else SchemaReader(self.conf, schema)
+        return query_batch.generate(self, reader, queries, no_deleted=no_deleted, workers=workers)
+
+
+    @utils.elastic_exception_detailor
+    def generate_query_batch(
+            self, queries: List[dict], schema: dict = None, index: str = None,
+            no_deleted: bool = True
+    ) -> List[dict]:
+        """
+        Generate Elasticsearch queries from SEL queries, in this process
+        The schema is fetched once, the queries share one QueryGenerator and its field resolutions
+
+        :param queries: SEL queries (string or object)
+        :param schema: Will get it back if not given
+        :param index: Index(es), can be None if schema is given, otherwise eg. "foo" or "foo,bar"
+        :param no_deleted: True to filter out deleted documents (if configured to), default: True
+        :return: Results of generate_query, in order, or an error for each failed query
+
+        .. code-block:: python
+
+            > queries = [{"query": ".id = 93428yr9"}, {"query": ".id in"}]
+
+            > sel.generate_query_batch(queries, index="foo")
+            [
+               {'warns': [], 'elastic_query': {...}, 'internal_query': {...}, 'query_data': {}},
+               {'error': {'type': 'InvalidClientInput', 'message': 'Invalid syntax at line 1, ...'}}
+            ]
+        """
+        if index is None and schema is None:
+            raise InternalServerError("GenerateQueryBatch: index or schema must be given")
+
+        reader = self._schema_reader(index) if index is not None else SchemaReader(self.conf, schema)
+        return query_batch.generate(self, reader, queries, no_deleted=no_deleted, workers=1)
+
+
+    @utils.elastic_exception_detailor
+    def prepare_query(
+            self, query: dict, schema: dict = None, index: str = None, no_deleted: bool = True
+    ) -> PreparedQuery:
+        """
+        Prepare a SEL query with placeholders, to generate it for numerous values
+        A placeholder is a filter value "$name", eg. "author = $name and date >= $from".
+        The query is parsed and generated once, binding values only builds the filters holding them.
+
+        :param query: SEL query (string or object) with placeholders
+        :param schema: Will get it back if not given
+        :param index: Index(es), can be None if schema is given, otherwise eg. "foo" or "foo,bar"
+        :param no_deleted: True to filter out deleted documents (if configured to), default: True
+        :return: PreparedQuery, its bind method gives results of generate_query, except the query
+                 of elastic_query when optimized (see OptimizeQueries): it matches the same documents,
+                 filters of placeholders are not merged with the other ones
+
+        .. code-block:: python
+
+            > prepared = sel.prepare_query({"query": "author = $name and date >= $from"}, index="foo")
+
+            > prepared.parameters
+            {
+               'name': [{'field': 'author', 'type': 'keyword', 'comparator': '='}],
+               'from': [{'field': 'date', 'type': 'date', 'comparator': '>='}]
+            }
+
+            > prepared.bind({"name": "toto", "from": "2018-01"})
+            {
+               'warns': [],
+               'elastic_query': {'query': {'bool': {'must': [{'term': {'author': 'toto'}}, ...]}}, ...},
+               'internal_query': {'query': {'operator': 'and', 'items': [{'field': 'author', 'comparator': '=', 'value': 'toto'}, ...]}},
+               'query_data': {}
+            }
+        """
+        if index is None and schema is None:
+            raise InternalServerError("PrepareQuery: index or schema must be given")
+
+        reader = self._schema_reader(index) if index is not None else SchemaReader(self.conf, schema)
+        return PreparedQuery(self, reader, self._to_queryobject(query), no_deleted=no_deleted)
+
+
+    def _plan_query(
+            self, query_obj: dict, no_deleted: bool, fingerprint: str,
+            reader_loader: Callable[[], SchemaReader], generator: QueryGenerator = None
+    ) -> dict:
+        """
+        Generated query from the plan cache, see _generate_query
+
+        :param fingerprint: Fingerprint of the schema
+        :param reader_loader: Give the SchemaReader of the schema, to generate a missing plan
+        :param generator: QueryGenerator on the schema, default: a new one
+        """
+        return self.plan_cache.get(
+            self.conf, fingerprint, query_obj, no_deleted,
+            lambda: self._generate_query(query_obj, reader_loader(), no_deleted, generator=generator)
+        )
+
+
+    def _generate_query(
+            self, query_obj: dict, reader: SchemaReader, no_deleted: bool = True,
+            generator: QueryGenerator = None
+    ) -> dict:
+        """
+        Generate Elasticsearch query from SEL query object
+
+        :param query_obj: SEL query object, see _to_queryobject
+        :param reader: SchemaReader of the index(es) schema
+        :param no_deleted: True to filter out deleted documents (if configured to)
+        :param generator: QueryGenerator to use, default: a new one on reader
+        :return: Dictionary warns, elastic_query, internal_query, query_data
+        """
+        warns = []
+        if generator is None:
+            generator = QueryGenerator(
+                self.conf, reader.schema, log_level=self.log_level, schema_reader=reader
+            )
 
         if no_deleted:
             query_obj = self.__filter_deleted_documents(generator.schema_reader, query_obj)
@@ -384,7 +825,7 @@ class SEL:
         return {
             "warns": list(set(warns)),
             "elastic_query": elastic_query,
-            "internal_query": query_obj,
+            "internal_query": query_ast.thaw(query_obj),
             "query_data": query_data
         }
 
@@ -430,7 +871,9 @@ class SEL:
         query_obj = self.generate_query(query, index=index, no_deleted=no_deleted)
         warns = query_obj["warns"]
 
-        self.logger.debug("es query = %s" % json.dumps(query_obj["elastic_query"]))
+        self._store_terms_lookups(query_obj["query_data"])
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("es query = %s" % json.dumps(query_obj["elastic_query"]))
         response = self.elastic.search(index=index, _source=True, **query_obj["elastic_query"])
             #analyze_wildcard=True  # Does not exists since 5.x ?
 
@@ -442,6 +885,22 @@ class SEL:
         return {"results": results, "warnings": list(set(warns))}
 
 
+    def _store_terms_lookups(self, query_data: dict) -> None:
+        """
+        Store terms lookup documents of a generated query, for LargeTermsStrategy lookup
+        Documents ids are hashes of their values, storing them again is harmless
+
+        :param query_data: Query data of a generated query, see generate_query
+        """
+        lookups = query_data.get("terms_lookup")
+        if not lookups:
+            return
+
+        documents = [{"id": doc_id, "values": values} for doc_id, values in lookups.items()]
+        index = self.conf["Queries"]["TermsLookupIndex"]
+        upload.bulk(self.elastic, index, documents, lambda d: d["id"])
+
+
     def get_one_document(self, index: str, doc_id: str) -> dict:
         """
         Get one document of an index
@@ -474,6 +933,43 @@ class SEL:
         return hits[0]
 
 
+    @utils.elastic_exception_detailor
+    def complete_query(self, index: str, query_string: str, cursor: int = None,
+                       size: int = 10, session: str = None) -> dict:
+        """
+        Autocomplete a query string being typed, call it at each keystroke
+        With a session, the parse of its previous call on the same index is resumed where
+        the texts differ, otherwise the query string is parsed from its start
+
+        :param index: Index(es) to complete field paths, eg. "foo" or "foo,bar"
+        :param query_string: Query string being typed
+        :param cursor: Cursor position in the query string, default: at the end
+        :param size: Maximum number of field paths
+        :param session: Key of the caller typing the query string, eg. a user or a text box id
+        :return: Dictionary 'token' as the partial token before the cursor, 'expected' for tokens
+                 expected at the cursor, 'fields' for field paths starting with the token
+                 and 'error' for the parse error until the cursor, None if valid
+
+        .. code-block:: python
+
+            > sel.complete_query("foo", "label = bird and med", session="user_1")
+            {
+               'token': 'med',
+               'expected': ['<value>', '<field>'],
+               'fields': ['media', 'media.image', 'media.label', ...],
+               'error': 'Invalid syntax at line 1, global position 17: "med", expect query after and/or.'
+            }
+        """
+        reader = self._schema_reader(index)
+        if session is None:
+            completer = QueryCompleter(**self.descent_options)
+        else:
+            completer = self.query_completers.get(
+                (index, session), lambda: QueryCompleter(**self.descent_options)
+            )
+        return completer.complete(query_string, cursor=cursor, schema_reader=reader, size=size)
+
+
 ##########################################################################
 # FIELD FUNCTIONS
 ##########################################################################
@@ -548,6 +1044,27 @@ class SEL:
         return reader.search_field(field_path)
 
 
+    @utils.elastic_exception_detailor
+    def search_fields(self, index: str, fields_path: List[str]) -> List[List[dict]]:
+        """
+        Search for several fields into an index, see search_field
+
+        :param index: Index(es), eg. "foo" or "foo,bar"
+        :param fields_path: The fields path to search
+        :return: Potential fields of each field path, in the same order
+
+        .. code-block:: python
+
+            > sel.search_fields("foo", ["id", "labl"])
+            [
+               [{'field': 'id', 'path': ['id'], 'score': 1.0, ...}, ...],
+               [{'field': 'label', 'path': ['media', 'label'], 'score': 0.89, ...}]
+            ]
+        """
+        reader = self._schema_reader(index)
+        return reader.search_fields(fields_path)
+
+
     @utils.elastic_exception_detailor
     def subfields(
             self, index: str, fields_path: List[str], no_empty=True
@@ -679,21 +1196,37 @@ class SEL:
         return {"action": action_id, "count": count}
 
 
-    def _delete_query_to_query(self, index: str, query: dict) -> dict:
+    def _delete_query_to_query(self, index: str, query: dict, warns: List[str]) -> dict:
         """
-        Delete query to SEL query object
+        Delete query to Elasticsearch query, in index order
+
+        - Can contains "ids" to simplify query, their terms query follows LargeTermsStrategy
 
-        - Can contains "ids" to simplify query
+        Warning: Modify warns without returning it
 
         :param index: Index(es), eg. "foo" or "foo,bar"
         :param query: SEL query (string or object) to filter documents
-        :return: SEL query
+        :param warns: List of query warnings
+        :return: Elasticsearch query
         """
         if query.get("ids"):
-            query = {"query": {"terms": {"id": query["ids"]}}}
+            ids = query_generator.terms_values("keyword", query["ids"], "id")
+            warns += query_generator.large_terms_warnings(self.conf, "id", len(ids))
+
+            terms_lookups = {}
+            query = {
+                "query": query_generator.format_terms(self.conf, "id", ids, terms_lookups),
+                "sort": [query_generator.DOC_SORT_FIELD]
+            }
+            self._store_terms_lookups({"terms_lookup": terms_lookups})
+
         elif query.get("query"):
-            query = {"query": query["query"]}
-            query = self.generate_query(query, index=index, no_deleted=False)["elastic_query"]
+            query = self._bulk_query({"query": query["query"]})
+            query = self.generate_query(query, index=index, no_deleted=False)
+            self._store_terms_lookups(query["query_data"])
+            warns += query["warns"]
+            query = query["elastic_query"]
+
         else:
             raise InvalidClientInput("Invalid input: id or query MUST BE given in input json")
 
@@ -711,7 +1244,7 @@ class SEL:
         :param query: SEL query (string or object) to match documents to delete. Can also contains "ids" to simplify query
         :param undelete: to unflag documents, default: False
         :param deleted_info: Any information you want in deleted documents
-        :return: Dictionary action_id, count
+        :return: Dictionary action_id, count, warnings
 
         .. code-block:: python
 
@@ -720,12 +1253,15 @@ class SEL:
             > query = {"ids": ["1435886281564398679"]}                             # Ids format
 
             > sel.delete_documents("foo", query)
-            {'action': 'delete', 'count': 1}
+            {'action': 'delete', 'count': 1, 'warnings': []}
         """
         action_id = "undelete" if undelete else "delete"
-        query = self._delete_query_to_query(index, query)
+        warns = []
+        query = self._delete_query_to_query(index, query, warns)
 
-        return self.__delete_documents(index, query, action_id, deleted_info=deleted_info)
+        result = self.__delete_documents(index, query, action_id, deleted_info=deleted_info)
+        result["warnings"] = list(set(warns))
+        return result
 
 
 ##########################################################################
@@ -766,7 +1302,7 @@ class SEL:
 
         :param index: Index(es) to delete documents, eg. "foo" or "foo,bar"
         :param query: SEL query (string or object) to match documents to delete. Can also contains "ids" to simplify query
-        :return: Number of deleted documents
+        :return: Number of deleted documents, warnings are logged
 
         .. code-block:: python
 
@@ -779,5 +1315,9 @@ class SEL:
             > sel.really_delete_documents("foo", query)
             0
         """
-        query = self._delete_query_to_query(index, query)
+        warns = []
+        query = self._delete_query_to_query(index, query, warns)
+        for warn in set(warns):
+            self.logger.warning(warn)
+
         return self.__really_delete_documents(index, query)
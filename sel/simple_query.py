@@ -0,0 +1,43 @@
+"""
+Short path of query string parsing, for the simplest and most frequent queries
+
+A query string made of a single filter "field comparator value", eg. "label = bag",
+is recognized by one regex instead of the parser and the formator.
+It gives the same query object, other query strings are left to the parser.
+"""
+import re
+
+
+SIMPLE_FILTER = re.compile(
+    r"\s*(?P<field>[\w\-\.]+)\s*(?P<comparator>!=|!~|>=|>|<=|<|=|~)\s*"
+    r"""(?P<value>[\w\-\.\#\@\$/*]+|"[^"\n]*"|'[^'\n]*')\s*"""
+)
+
+# Tokens of a simple filter, for max_tokens budget
+SIMPLE_FILTER_TOKENS = 3
+
+
+def parse(query_string, max_literal_length=0, max_tokens=0, **limits):
+    """
+    Query object of a single filter query string, None if the query string is not one
+    Limits are the parser ones, a query string over them is left to the parser to raise
+    """
+    found = SIMPLE_FILTER.fullmatch(query_string)
+    if found is None:
+        return None
+
+    field, comparator, value = found.group("field", "comparator", "value")
+
+    # Keyword prefix, eg. "notable = 1" is "not able = 1"
+    if field[:3].lower() == "not":
+        return None
+
+    if max_tokens and max_tokens < SIMPLE_FILTER_TOKENS:
+        return None
+
+    if value[0] in "\"'":
+        value = value[1:-1]
+        if max_literal_length and len(value) > max_literal_length:
+            return None
+
+    return {"query": {"field": field, "comparator": comparator, "value": value}}
@@ -2,6 +2,8 @@
 import functools
 import traceback
 import logging
+import threading
+from collections import OrderedDict
 
 
 class InternalServerError(Exception):
@@ -84,3 +86,86 @@ def elastic_exception_detailor(handler):
             raise _detailor(exc)
 
     return handler_wrapper
+
+
+class LRUCache:
+    """
+    Thread safe cache, least recently used entries are evicted first
+
+    :param max_size: Maximum number of entries, 0 to disable
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key, loader):
+        """ Get value of key, call loader to get it on missing entry """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            self.misses += 1
+
+        value = loader()
+        self.set(key, value)
+        return value
+
+
+    def peek(self, key):
+        """ Value of key without loading it, None on missing entry, not counted in stats """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+
+    def set(self, key, value):
+        """ Set value of key, least recently used entries are evicted """
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+    def items(self):
+        """ Copy of the entries, least recently used first """
+        with self._lock:
+            return list(self._entries.items())
+
+
+    def discard(self, predicate):
+        """ Remove entries whose key matches predicate """
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def stats(self):
+        """ Return hits, misses, hit rate and size of the cache """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries)
+            }
@@ -0,0 +1,56 @@
+import datetime
+import pytest
+
+from sel import date_utils
+from sel.utils import InvalidClientInput
+
+
+def strptime_reference(str_date):
+    """ Parsing of str_date_to_datetime by trying each format """
+    for date_format in date_utils.DATE_FORMAT.values():
+        try:
+            return datetime.datetime.strptime(str_date, date_format), date_format
+        except ValueError:
+            pass
+    return None
+
+
+class TestDateUtils:
+
+
+    @pytest.mark.parametrize("str_date", [
+        "2017", "2017-01", "2017-1", "2017-01-05", "2017-1-5", "2016-02-29",
+        "2017-01-01 5", "2017-01-01  05:07", "2017-01-01 05:07:09", "2017-12-31 23:59:59",
+    ])
+    def test_str_date_to_datetime(self, str_date):
+        assert date_utils.str_date_to_datetime(str_date) == strptime_reference(str_date)
+        assert date_utils.str_date_to_datetime(str_date) == strptime_reference(str_date)
+
+
+    @pytest.mark.parametrize("str_date", [
+        "", "17", "2017-", "2017-13", "2017-00", "2017-02-29", "2017-01-32", "2017-01-01T05",
+        "2017-01-01 24", "2017-01-01 05:60", "2017-01-01 05:07:09.1", " 2017", "2017-001",
+    ])
+    def test_invalid(self, str_date):
+        assert strptime_reference(str_date) is None
+        with pytest.raises(InvalidClientInput):
+            date_utils.str_date_to_datetime(str_date)
+
+
+    @pytest.mark.parametrize("date_format", list(date_utils.DATE_FORMAT.values()) + ["%Y/%m {x}", "%d %b %Y"])
+    def test_format_date(self, date_format):
+        date = datetime.datetime(2017, 3, 4, 5, 6, 7)
+        assert date_utils.format_date(date, date_format) == date.strftime(date_format)
+        assert date_utils.date_formatter(date_format) is date_utils.date_formatter(date_format)
+
+
+    @pytest.mark.parametrize(["months", "added", "removed"], [
+        [0, datetime.datetime(2017, 1, 31, 12), datetime.datetime(2017, 1, 31, 12)],
+        [1, datetime.datetime(2017, 2, 1, 12), datetime.datetime(2016, 12, 1, 12)],
+        [13, datetime.datetime(2018, 2, 1, 12), datetime.datetime(2015, 12, 1, 12)],
+    ])
+    def test_months(self, months, added, removed):
+        date = datetime.datetime(2017, 1, 31, 12)
+        assert date_utils.add_months(date, months) == added
+        assert date_utils.remove_months(date, months) == removed
+        assert date_utils.last_day_of_month(datetime.datetime(2016, 2, 10)) == datetime.datetime(2016, 2, 29)
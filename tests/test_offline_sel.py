@@ -1,8 +1,13 @@
-import json
 import pytest
 import logging
 
+from sel import query_batch, query_generator, config
 from sel.sel import SEL
+from sel.plan_cache import PlanCache
+from sel.query_generator import QueryGenerator
+from sel.utils import InvalidClientInput
+
+from test_utils import FakeElastic, load_schema
 
 
 @pytest.fixture(scope="session")
@@ -10,9 +15,7 @@ def osel():
     return SEL(None, log_level=logging.DEBUG)
 
 
-def load_schema():
-    with open("/tests/data/sample_2017_schema.json", "r") as fd:
-        return json.load(fd)
+DELETED_EXCLUDED = "deleted documents filter, .deleted != true"
 
 
 class TestOfflineSEL():
@@ -22,7 +25,243 @@ class TestOfflineSEL():
         res = osel.generate_query(query, schema=load_schema())
         assert res == {
             'warns': [],
-            'elastic_query': {'query': {'bool': {'must': [{'nested': {'path': 'media.label', 'query': {'term': {'media.label.name': 'bag'}}}}], 'must_not': [{'term': {'deleted': True}}]}}, 'sort': [{'deleted': {'order': 'desc', 'nested_filter': {'bool': {'must_not': [{'term': {'deleted': True}}]}}}}, {'media.label.score': {'order': 'desc', 'nested_path': 'media.label', 'nested_filter': {'term': {'media.label.name': 'bag'}}}}]},
+            'elastic_query': {'query': {'bool': {'filter': [{'nested': {'path': 'media.label', 'query': {'term': {'media.label.name': 'bag'}}}}], 'must_not': [{'term': {'deleted': True}}]}}, 'sort': [{'media.label.score': {'order': 'desc', 'nested_path': 'media.label', 'nested_filter': {'term': {'media.label.name': 'bag'}}}}]},
             'internal_query': {'query': {'operator': 'and', 'items': [{'field': '.deleted', 'comparator': '!=', 'value': True}, {'field': 'label', 'comparator': '=', 'value': 'bag'}]}},
-            'query_data': {}
+            'query_data': {'auto_sort': {'excluded': 'deleted documents filter, .deleted != true'}}
         }
+
+
+    @pytest.mark.parametrize(["mode", "query", "filtered"], [
+        ["auto", {"query": "label = bag"}, True],
+        ["auto", {"query": "label = bag or color = red sort: date"}, True],
+        ["auto", {"query": "label = bag sort: null"}, False],
+        ["auto", {"query": "label = bag sort: random"}, False],
+        ["auto", {"query": {"field": "label", "value": "bag"}, "extended": {"min_score": 1}}, False],
+        ["true", {"query": "label = bag sort: null"}, True],
+        ["false", {"query": "label = bag"}, False],
+    ])
+    def test_filter_context(self, mode, query, filtered):
+        conf = config.read()
+        conf["Queries"]["FilterContext"] = mode
+        sel = SEL(None, conf=conf, log_level=logging.DEBUG)
+
+        result = sel.generate_query(query, schema=load_schema(), no_deleted=False)
+        es_query = result["elastic_query"]["query"]
+        es_query = es_query.get("function_score", {}).get("query", es_query)
+
+        assert ("filter" in es_query.get("bool", {})) == filtered
+        if filtered:
+            conf["Queries"]["FilterContext"] = "false"
+            expected = SEL(None, conf=conf).generate_query(query, schema=load_schema(), no_deleted=False)
+            assert query_generator.filter_context(expected["elastic_query"]["query"]) == es_query
+
+
+    @pytest.mark.parametrize(["query", "sorts", "query_data"], [
+        [{"query": "label = bag"}, ["media.label.score"], {"excluded": DELETED_EXCLUDED}],
+        [{"query": ".deleted != true and color = red"}, ["deleted", "media.label.color.score"], {}],
+        [{"query": {"operator": "and", "items": [{"field": ".deleted", "comparator": "!=", "value": True},
+                                                 {"field": "color", "value": "red"}]}},
+         ["deleted", "media.label.color.score"], {}],
+        [{"query": {"field": ".deleted", "comparator": "!=", "value": True}}, ["deleted"], {}],
+        [{"query": "color = red or label = bag"}, ["media.label.color.score", "media.label.score"],
+         {"excluded": DELETED_EXCLUDED}],
+        [{"query": "label = bag", "meta": {"size": 0}}, None, {"skipped": "no hits returned, meta size is 0"}],
+        [{"query": "label = bag or color = red aggreg: label", "meta": {"size": 0}}, None,
+         {"skipped": "no hits returned, meta size is 0"}],
+        [{"query": "label = bag sort: _doc"}, ["_doc"], {"skipped": "index order, sort: _doc"}],
+        [{"query": "label = bag or color = red sort: _doc"}, ["_doc"], {"skipped": "index order, sort: _doc"}],
+        [{"query": "label = bag sort: like"}, ["like"], {}],
+    ])
+    @pytest.mark.parametrize("no_deleted", [True, False])
+    def test_auto_sort(self, osel, query, sorts, query_data, no_deleted):
+        result = osel.generate_query(query, schema=load_schema(), no_deleted=no_deleted)
+        es_query = result["elastic_query"]
+
+        if sorts is None:
+            assert "sort" not in es_query
+            assert "filter" in es_query["query"]["bool"]
+        else:
+            assert [next(iter(sort)) for sort in es_query["sort"]] == sorts
+        if not no_deleted:
+            query_data = {k: v for k, v in query_data.items() if k != "excluded"}
+        assert result["query_data"].get("auto_sort", {}) == query_data
+
+
+    def test_bulk_query(self, osel):
+        bulk_query = osel._bulk_query({"query": "label = bag"})
+        result = osel.generate_query(bulk_query, schema=load_schema())
+        assert result["elastic_query"]["sort"] == [{"_doc": {"order": "asc"}}]
+        assert result["query_data"] == {"auto_sort": {"skipped": "index order, sort: _doc"}}
+
+        bulk_query = osel._bulk_query({"query": "label = bag sort: auto"})
+        assert bulk_query == osel._to_queryobject({"query": "label = bag sort: auto"})
+
+
+    def test_query_string_cache(self):
+        sel = SEL(None, log_level=logging.DEBUG)
+        query = {"query": "label = bag and (color = red or color = blue) aggreg: label"}
+
+        first = sel._to_queryobject(query)
+        with pytest.raises(TypeError):
+            first["query"] = None
+        assert sel._to_queryobject(query) is first
+        assert sel._to_queryobject(query) == sel._parse_query_string(query["query"])
+
+        stats = sel.cache_stats()["query_string"]
+        assert stats == {"hits": 2, "misses": 1, "hit_rate": 2 / 3, "size": 1}
+
+
+    @pytest.mark.parametrize("query", [
+        {"query": "a in [" + ", ".join(str(i) for i in range(10001)) + "]"},
+        {"query": {"field": "a", "comparator": "in", "value": list(range(10001))}},
+    ])
+    def test_query_budget(self, osel, query):
+        osel._to_queryobject(query)
+
+        conf = config.read()
+        conf["Queries"]["MaxInValues"] = "10000"
+        sel = SEL(None, conf=conf, log_level=logging.DEBUG)
+        with pytest.raises(InvalidClientInput) as exc_info:
+            sel._to_queryobject(query)
+        assert "more than 10000 values in an 'in' list" in exc_info.value.message
+
+
+    @pytest.mark.parametrize(["limit", "value", "query", "expected"], [
+        ["MaxTokens", "2", "a = 1 and b = 2 or c = 3", "more than 2 filters, aggregations and sorts"],
+        ["MaxGroupDepth", "2", "a = 1 and (b = 2 or not (c = 3 or d = 4))", "groups nested deeper than 2 levels"],
+        ["MaxLiteralLength", "4", "a = 'xxxxx'", "value longer than 4 characters"],
+        ["MaxLiteralLength", "4", "a = 1 and b = 'xxxxx'", "value longer than 4 characters"],
+    ])
+    def test_query_budget_pypeg2(self, limit, value, query, expected):
+        conf = config.read()
+        conf["Queries"]["QueryStringParser"] = "pypeg2"
+        sel = SEL(None, conf=conf, log_level=logging.DEBUG)
+        sel._to_queryobject({"query": query})
+
+        conf["Queries"][limit] = value
+        sel = SEL(None, conf=conf, log_level=logging.DEBUG)
+        with pytest.raises(InvalidClientInput) as exc_info:
+            sel._to_queryobject({"query": query})
+        assert exc_info.value.message == f"Query too complex: {expected}."
+
+
+    @pytest.mark.parametrize(["strategy", "expected"], [
+        ["terms", {"terms": {"like": [1.0, 2.0, 3.0, 4.0, 5.0]}}],
+        ["chunks", {"bool": {"should": [{"terms": {"like": [1.0, 2.0]}}, {"terms": {"like": [3.0, 4.0]}},
+                                        {"terms": {"like": [5.0]}}]}}],
+        ["lookup", {"terms": {"like": {"index": "sel_terms_lookup", "id": "", "path": "values"}}}],
+    ])
+    def test_large_terms(self, strategy, expected):
+        conf = config.read()
+        conf["Queries"]["MaxTermsCount"] = "2"
+        conf["Queries"]["LargeTermsStrategy"] = strategy
+        sel = SEL(None, conf=conf, log_level=logging.DEBUG)
+
+        query = {"query": {"field": "like", "comparator": "in", "value": ["1", 2, "3", 3, "4", 5.0, "1"]}}
+        result = sel.generate_query(query, schema=load_schema(), no_deleted=False)
+        es_query = result["elastic_query"]["query"]["bool"]["filter"][0]
+
+        assert result["warns"] == [
+            f"'like' 7 values in an 'in' list, over Elasticsearch max terms count (2), using {strategy} strategy"
+        ]
+        if strategy == "lookup":
+            lookups = result["query_data"]["terms_lookup"]
+            assert list(lookups.values()) == [[1.0, 2.0, 3.0, 4.0, 5.0]]
+            expected["terms"]["like"]["id"] = next(iter(lookups))
+        assert es_query == expected
+
+        query = {"query": {"field": "like", "comparator": "in", "value": ["1", "x"]}}
+        with pytest.raises(InvalidClientInput):
+            sel.generate_query(query, schema=load_schema())
+
+
+    def test_large_terms_default(self, osel):
+        query = {"query": {"field": "like", "comparator": "in", "value": list(range(70000))}}
+        result = osel.generate_query(query, schema=load_schema(), no_deleted=False)
+        chunks = result["elastic_query"]["query"]["bool"]["filter"][0]["bool"]["should"]
+
+        assert [len(chunk["terms"]["like"]) for chunk in chunks] == [65536, 70000 - 65536]
+        assert len(result["warns"]) == 1
+
+
+    @pytest.mark.parametrize(["strategy", "expected"], [
+        ["terms", {"terms": {"id": ["1", "2", "3"]}}],
+        ["chunks", {"bool": {"should": [{"terms": {"id": ["1", "2"]}}, {"terms": {"id": ["3"]}}]}}],
+        ["lookup", {"terms": {"id": {"index": "sel_terms_lookup", "id": "", "path": "values"}}}],
+    ])
+    def test_delete_ids(self, strategy, expected):
+        conf = config.read()
+        conf["Queries"]["MaxTermsCount"] = "2"
+        conf["Queries"]["LargeTermsStrategy"] = strategy
+        elastic = FakeElastic([])
+        sel = SEL(elastic, conf=conf, log_level=logging.DEBUG)
+
+        warns = []
+        es_query = sel._delete_query_to_query("foo", {"ids": ["1", "2", "3", "1"]}, warns)
+
+        assert warns == [f"'id' 3 values in an 'in' list, over Elasticsearch max terms count (2), using {strategy} strategy"]
+        assert es_query["sort"] == ["_doc"]
+        if strategy == "lookup":
+            assert elastic.bulks == [[
+                {"index": {"_index": "sel_terms_lookup", "_id": es_query["query"]["terms"]["id"]["id"]}},
+                {"id": es_query["query"]["terms"]["id"]["id"], "values": ["1", "2", "3"]},
+            ]]
+            expected["terms"]["id"]["id"] = es_query["query"]["terms"]["id"]["id"]
+        assert es_query["query"] == expected
+
+
+    def test_generate_queries(self, osel):
+        schema = load_schema()
+        queries = [{"query": "label = bag"}, {"query": "label in"}, {"query": "labl = 1"},
+                   {"query": "label = bag aggreg: label sort: date"}] * 5
+
+        results = osel.generate_queries(queries, schema=schema, workers=2)
+        assert results == osel.generate_queries(queries, schema=schema, workers=1)
+        assert results[0] == osel.generate_query(queries[0], schema=schema)
+        assert results[3] == osel.generate_query(queries[3], schema=schema)
+        assert results[1]["error"]["type"] == "InvalidClientInput"
+        assert results[2]["error"]["type"] == "SchemaError"
+
+
+    def test_generate_query_batch(self, monkeypatch):
+        mappings = [("foo_1", {"properties": {"a": {"type": "long"}, "b": {"type": "keyword"}}})]
+        elastic = FakeElastic(mappings)
+        sel = SEL(elastic, log_level=logging.DEBUG)
+        sel.plan_cache = PlanCache(0)
+
+        generators = []
+        def build(*args, **kwargs):
+            generators.append(QueryGenerator(*args, **kwargs))
+            return generators[-1]
+        monkeypatch.setattr(query_batch, "QueryGenerator", build)
+
+        queries = [{"query": "a = 1"}, {"query": "a in"}, {"query": "b = x and a > 2 aggreg: b"}] * 3
+        results = sel.generate_query_batch(queries, index="foo_*")
+
+        assert len(generators) == 1
+        assert len([c for c in elastic.indices.calls if c.startswith("get_mapping")]) == 1
+        assert results[0] == sel.generate_query(queries[0], index="foo_*")
+        assert results[2] == sel.generate_query(queries[2], index="foo_*")
+        assert results[1]["error"]["type"] == "InvalidClientInput"
+        assert results[3:] == results[:3] * 2
+
+
+    def test_complete_query_sessions(self):
+        mappings = [("foo_1", {"properties": {"label": {"type": "keyword"}, "media": {"type": "keyword"}}})]
+        sel = SEL(FakeElastic(mappings), log_level=logging.DEBUG)
+
+        typed = {
+            "user_1": ["label = bird", "label = bird and", "label = bird and me"],
+            "user_2": ["media", "media = cat or", "media = cat or la"],
+        }
+        for first, second in zip(typed["user_1"], typed["user_2"]):
+            for session, query_string in [("user_1", first), ("user_2", second)]:
+                result = sel.complete_query("foo_*", query_string, session=session)
+                assert result == sel.complete_query("foo_*", query_string)
+
+        assert sel.complete_query("foo_*", "label = bird and me", session="user_1")["fields"] == ["media"]
+        assert sel.complete_query("foo_*", "media = cat or la", session="user_2")["fields"] == ["label"]
+
+        completers = [sel.query_completers.peek(("foo_*", session)) for session in typed]
+        assert completers[0] is not completers[1]
+        assert [completer.text for completer in completers] == ["label = bird and me", "media = cat or la"]
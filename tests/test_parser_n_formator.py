@@ -16,6 +16,7 @@ class TestParserNFormator:
     @pytest.mark.parametrize(["query", "expected"], [
         ["toto", "toto"],
         ['"toto tata titi"', "toto tata titi"],
+        ["$toto", "$toto"],
         ["toto tata titi", None], # Exception, does not match type Value
     ])
     def test_value(self, query, expected):
@@ -0,0 +1,111 @@
+import re
+import copy
+import inspect
+import logging
+import importlib
+import pytest
+
+from sel import config
+from sel.sel import SEL
+from sel.plan_cache import PlanCache, plan_key, CONF_KEYS
+
+from test_utils import FakeElastic, load_schema
+
+
+# Modules of query generation, their configuration reads are in the plan key
+GENERATION_MODULES = ["query_generator", "query_optimizer", "schema_reader", "prepared_query"]
+CONF_READ = re.compile(r'conf\["(\w+)"\](?:\.get\w*\(|\[)"(\w+)"')
+
+# Sizes of caches of the schema reader, not changing generated queries
+NOT_GENERATION_KEYS = [("Schema", "FieldInfoCacheSize")]
+
+
+class TestPlanCache:
+
+
+    def test_hit(self):
+        sel = SEL(None, log_level=logging.DEBUG)
+        schema = load_schema()
+        query = {"query": "label = bag and (date > 2018 or like > 3) aggreg: label sort: date"}
+
+        first = sel.generate_query(query, schema=schema)
+        first["elastic_query"]["query"] = None
+        second = sel.generate_query(query, schema=schema)
+
+        assert second != first
+        assert second == sel.generate_query(query, schema=schema, no_deleted=True)
+        assert sel.cache_stats()["plan"] == {"hits": 2, "misses": 1, "hit_rate": 2 / 3, "size": 1}
+
+        sel.plan_cache = PlanCache(0)
+        assert sel.generate_query(query, schema=schema) == second
+
+
+    def test_key(self):
+        conf = config.read()
+        query = {"query": {"field": "label", "value": "bag"}}
+        key = plan_key(conf, "abc", query, True)
+
+        assert key == plan_key(conf, "abc", copy.deepcopy(query), True)
+        assert key != plan_key(conf, "abd", query, True)
+        assert key != plan_key(conf, "abc", query, False)
+        assert key != plan_key(conf, "abc", {"query": {"field": "label", "value": "bags"}}, True)
+
+        other_conf = config.read()
+        other_conf["Queries"]["TimeZone"] = "+01:00"
+        assert key != plan_key(other_conf, "abc", query, True)
+
+
+    @pytest.mark.parametrize(["section", "name"], [
+        (section, name) for section, names in CONF_KEYS.items() for name in names
+    ])
+    def test_conf_change(self, section, name):
+        conf = config.read()
+        cache = PlanCache(10)
+        query = {"query": {"field": "label", "value": "bag"}}
+        cache.get(conf, "abc", query, True, lambda: {"plan": 1})
+
+        conf[section][name] = conf[section][name] + "_changed"
+        assert cache.get(conf, "abc", query, True, lambda: {"plan": 2}) == {"plan": 2}
+        assert cache.stats()["misses"] == 2
+
+
+    @pytest.mark.parametrize("module", GENERATION_MODULES)
+    def test_conf_keys(self, module):
+        """ Every configuration value read by query generation is in the plan key """
+        source = inspect.getsource(importlib.import_module(f"sel.{module}"))
+        reads = set(CONF_READ.findall(source))
+
+        keys = {(section, name) for section, names in CONF_KEYS.items() for name in names}
+        assert reads - keys - set(NOT_GENERATION_KEYS) == set()
+
+
+    @pytest.mark.parametrize(["sort", "cached"], [
+        [[{"field": "random"}], False],
+        [[{"field": "random", "seed": 3}], True],
+        [[{"field": "date"}], True],
+    ])
+    def test_random_sort(self, sort, cached):
+        key = plan_key(config.read(), "abc", {"sort": sort}, True)
+        assert (key is not None) == cached
+
+
+    def test_schema_change(self):
+        mappings = [("foo_1", {"properties": {"a": {"type": "long"}}})]
+        elastic = FakeElastic(mappings)
+        sel = SEL(elastic, log_level=logging.DEBUG)
+
+        sel.generate_query({"query": "a = 1"}, index="foo_*")
+        sel.generate_query({"query": "a > 1"}, index="foo_*")
+        assert sel.cache_stats()["plan"]["size"] == 2
+
+        # Same mapping fetched again, plans are kept
+        sel.invalidate_schema("foo_*")
+        sel.generate_query({"query": "a = 1"}, index="foo_*")
+        assert sel.cache_stats()["plan"]["size"] == 2
+
+        mappings[0] = ("foo_1", {"properties": {"a": {"type": "keyword"}}})
+        sel.invalidate_schema("foo_*")
+        result = sel.generate_query({"query": "a = 1"}, index="foo_*")
+
+        assert result["elastic_query"]["query"] == {"bool": {"filter": [{"term": {"a": "1"}}]}}
+        assert sel.cache_stats()["plan"]["size"] == 1
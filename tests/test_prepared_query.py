@@ -0,0 +1,146 @@
+import logging
+import pytest
+
+from sel import config
+from sel.sel import SEL
+from sel.utils import InvalidClientInput
+
+from test_utils import load_schema, load_documents, matches
+
+
+VALUES = {"name": "bag", "from": "2018-01", "lo": "0.2", "hi": "5", "labels": ["bag", "person"]}
+
+
+def bound_query(query, values):
+    """ Query with values instead of placeholders """
+    if isinstance(query, str):
+        if query[1:] in values:
+            return values[query[1:]]
+        for name, value in values.items():
+            query = query.replace(f"${name}", str(value))
+        return query
+    if isinstance(query, dict):
+        return {k: bound_query(v, values) for k, v in query.items()}
+    if isinstance(query, list):
+        return [bound_query(v, values) for v in query]
+    return query
+
+
+class TestPreparedQuery:
+
+
+    @pytest.mark.parametrize("query", [
+        {"query": "label = $name"},
+        {"query": "label = $name and date >= $from"},
+        {"query": "label != $name or like < $hi", "meta": {"size": 3}},
+        {"query": "date = $from and date > $from and date <= $from"},
+        {"query": "$lo <= label.score <= $hi"},
+        {"query": "label.score range (>= $lo, < $hi)"},
+        {"query": "label in [$name, person] and label ~ $name aggreg: label"},
+        {"query": "media.label = $name where label.score > $lo"},
+        {"query": {"field": "label", "comparator": "in", "value": "$labels"}},
+        {"query": {"field": "label", "value": "$name"},
+         "aggregations": {"a": {"field": "label", "where": {"field": "label.score", "comparator": ">", "value": "$lo"}}},
+         "sort": [{"field": "like", "where": {"field": "like", "comparator": "<", "value": "$hi"}}]},
+    ])
+    def test_same_as_generate(self, query):
+        sel = SEL(None, log_level=logging.DEBUG)
+        schema = load_schema()
+        prepared = sel.prepare_query(query, schema=schema)
+
+        values = {name: VALUES[name] for name in prepared.names}
+        expected = sel.generate_query(bound_query(query, values), schema=schema)
+
+        assert prepared.bind(values) == expected
+        assert prepared.bind(values) == expected
+
+
+    @pytest.mark.parametrize("query", [
+        "label = $name or label = dress or label = person",
+        "label != $name and label != dress and color != white",
+        "(label = $name or label = person) and (like > $hi or label = dress)",
+        "label in [$name, dress] or label = person sort: null",
+    ])
+    def test_same_hits_as_generate(self, query):
+        """ Bound clauses are not merged by the query optimizer, their query matches the same documents """
+        sel = SEL(None, log_level=logging.DEBUG)
+        schema = load_schema()
+        documents = load_documents()
+
+        prepared = sel.prepare_query({"query": query}, schema=schema)
+        values = {name: VALUES[name] for name in prepared.names}
+        bound = prepared.bind(values)
+        expected = sel.generate_query(bound_query({"query": query}, values), schema=schema)
+
+        bound_query_body = bound["elastic_query"].pop("query")
+        expected_query_body = expected["elastic_query"].pop("query")
+        assert bound == expected
+        assert [matches(bound_query_body, d) for d in documents] == \
+            [matches(expected_query_body, d) for d in documents]
+
+
+    @pytest.mark.parametrize("strategy", ["chunks", "lookup"])
+    def test_large_bound_list(self, strategy):
+        conf = config.read()
+        conf["Queries"]["MaxTermsCount"] = "10"
+        conf["Queries"]["LargeTermsStrategy"] = strategy
+        sel = SEL(None, conf=conf, log_level=logging.DEBUG)
+        schema = load_schema()
+
+        query = {"query": {"field": ".id", "comparator": "in", "value": "$ids"}}
+        prepared = sel.prepare_query(query, schema=schema)
+        ids = [str(i) for i in range(25)]
+        expected = sel.generate_query(bound_query(query, {"ids": ids}), schema=schema)
+
+        bound = prepared.bind(ids=ids)
+        assert len(bound["warns"]) == 1
+        assert bound["warns"] == expected["warns"]
+        assert bound["query_data"] == expected["query_data"]
+        assert prepared.bind(ids=ids[:5])["warns"] == []
+        assert prepared.generator.terms_lookups == {}
+
+
+    def test_bound_list_budget(self):
+        conf = config.read()
+        conf["Queries"]["MaxInValues"] = "10"
+        sel = SEL(None, conf=conf, log_level=logging.DEBUG)
+        query = {"query": {"field": ".id", "comparator": "nin", "value": "$ids"}}
+        prepared = sel.prepare_query(query, schema=load_schema())
+
+        prepared.bind(ids=[str(i) for i in range(10)])
+        with pytest.raises(InvalidClientInput, match="more than 10 values"):
+            prepared.bind(ids=[str(i) for i in range(11)])
+
+
+    def test_bind(self):
+        sel = SEL(None, log_level=logging.DEBUG)
+        prepared = sel.prepare_query(
+            {"query": "label = $name and like > $hi"}, schema=load_schema(), no_deleted=False
+        )
+
+        assert prepared.parameters == {
+            "name": [{"field": ".media.label", "type": "keyword", "comparator": "="}],
+            "hi": [{"field": ".like", "type": "integer", "comparator": ">"}],
+        }
+
+        first = prepared.bind(name="bag", hi=2)
+        second = prepared.bind({"name": "person"}, hi="3")
+        first_must = first["elastic_query"]["query"]["bool"]["filter"]
+        second_must = second["elastic_query"]["query"]["bool"]["filter"]
+        assert first_must[0]["nested"]["query"] == {"term": {"media.label.name": "bag"}}
+        assert second_must[0]["nested"]["query"] == {"term": {"media.label.name": "person"}}
+        assert second_must[1] == {"range": {"like": {"gt": 3.0}}}
+        assert second["internal_query"]["query"]["items"][1]["value"] == "3"
+
+        with pytest.raises(InvalidClientInput):
+            prepared.bind(name="bag")
+        with pytest.raises(InvalidClientInput):
+            prepared.bind(name="bag", hi=2, lo=1)
+        with pytest.raises(InvalidClientInput):
+            prepared.bind(name="bag", hi="abc")
+
+
+    def test_exists(self):
+        sel = SEL(None, log_level=logging.DEBUG)
+        with pytest.raises(InvalidClientInput):
+            sel.prepare_query({"query": "label.exists = $name"}, schema=load_schema())
@@ -0,0 +1,80 @@
+import copy
+import pickle
+import pytest
+
+from sel.query_ast import Node, freeze, thaw
+
+
+QUERY = {
+    "query": {"operator": "and", "items": [
+        {"field": "label", "comparator": "=", "value": "bag"},
+        {"field": "color", "comparator": "in", "value": ["red", "blue"]},
+    ]},
+    "aggregations": {"colors": {"field": "color", "where": {"field": "label", "value": "bag"}}},
+    "meta": {"size": 3},
+}
+
+
+class TestQueryAst:
+
+
+    def test_freeze(self):
+        query = freeze(QUERY)
+
+        assert isinstance(query, Node)
+        assert isinstance(query["query"]["items"], tuple)
+        assert isinstance(query["query"]["items"][1]["value"], tuple)
+        assert freeze(query) is query
+        assert thaw(query) == QUERY
+
+
+    @pytest.mark.parametrize("mutation", [
+        lambda q: q.__setitem__("meta", None),
+        lambda q: q.__delitem__("meta"),
+        lambda q: q.update({"meta": None}),
+        lambda q: q.setdefault("sort", []),
+        lambda q: q.pop("meta"),
+        lambda q: q.popitem(),
+        lambda q: q.clear(),
+        lambda q: q["meta"].__setitem__("size", 4),
+    ])
+    def test_immutable(self, mutation):
+        query = freeze(QUERY)
+        with pytest.raises(TypeError):
+            mutation(query)
+        assert thaw(query) == QUERY
+
+        with pytest.raises(AttributeError):
+            query.foo = 1
+
+
+    def test_hash(self):
+        query = freeze(QUERY)
+        same = freeze(copy.deepcopy(QUERY))
+        other = freeze(dict(QUERY, meta={"size": 4}))
+
+        assert query == same and hash(query) == hash(same)
+        assert query != other
+        assert len({query, same, other}) == 2
+
+
+    def test_replace(self):
+        query = freeze(QUERY)
+        changed = query.replace(meta={"size": 0}, sort=[{"field": "date"}])
+
+        assert changed["meta"] == {"size": 0}
+        assert changed["sort"] == ({"field": "date"},)
+        assert changed["query"] is query["query"]
+        assert query["meta"] == {"size": 3}
+        assert query.without("meta", "query") == {"aggregations": query["aggregations"]}
+
+
+    def test_copy_and_pickle(self):
+        query = freeze(QUERY)
+
+        assert copy.copy(query) is query
+        assert copy.deepcopy(query) is query
+
+        loaded = pickle.loads(pickle.dumps(query))
+        assert isinstance(loaded["query"], Node)
+        assert loaded == query and hash(loaded) == hash(query)
@@ -0,0 +1,54 @@
+import pytest
+
+from sel import query_budget
+from sel.utils import InvalidClientInput
+
+
+def nested_not(query, depth):
+    for _ in range(depth):
+        query = {"not": query}
+    return query
+
+
+def nested_subaggreg(depth):
+    aggreg = {"type": "count", "field": "label"}
+    for i in range(depth):
+        aggreg = {"type": "aggreg", "field": "label", "subaggreg": {f"sub_{i}": aggreg}}
+    return aggreg
+
+
+class TestQueryBudget:
+
+
+    @pytest.mark.parametrize(["query", "limits", "expected"], [
+        [{"query": {"field": "a", "value": 1}}, {"max_tokens": 1}, None],
+        [
+            {"query": {"operator": "and", "items": [{"field": "a", "value": 1}, {"field": "b", "value": 2}]},
+             "sort": [{"field": "c"}]},
+            {"max_tokens": 2},
+            "more than 2 filters, aggregations and sorts"
+        ],
+        [{"query": nested_not({"field": "a", "value": 1}, 3)}, {"max_group_depth": 4}, None],
+        [{"query": nested_not({"field": "a", "value": 1}, 4)}, {"max_group_depth": 4}, "groups nested deeper than 4 levels"],
+        [
+            {"sort": [{"field": "a", "where": {"field": "b", "value": 1, "where": {"field": "c", "value": 2}}}]},
+            {"max_group_depth": 1},
+            "groups nested deeper than 1 levels"
+        ],
+        [{"query": {"field": "a", "comparator": "in", "value": [1, 2]}}, {"max_in_values": 2}, None],
+        [{"query": {"field": "a", "comparator": "nin", "value": [1, 2, 3]}}, {"max_in_values": 2}, "more than 2 values in an 'in' list"],
+        [{"aggregations": {"a": nested_subaggreg(2)}}, {"max_subaggreg_depth": 2}, None],
+        [{"aggregations": {"a": nested_subaggreg(3)}}, {"max_subaggreg_depth": 2}, "subaggregations nested deeper than 2 levels"],
+        [{"query": {"field": "a", "value": "x" * 4}}, {"max_literal_length": 4}, None],
+        [{"query": {"field": "a", "value": "x" * 5}}, {"max_literal_length": 4}, "value longer than 4 characters"],
+        [{"query": {"field": "a", "comparator": "in", "value": ["x", "x" * 5]}}, {"max_literal_length": 4},
+         "value longer than 4 characters"],
+        [{"query": nested_not({"field": "a", "value": 1}, 5000)}, {}, None],
+        [{"query": "not a query", "aggregations": [], "sort": {}}, {"max_tokens": 1}, None],
+    ])
+    def test_check_query(self, query, limits, expected):
+        try:
+            query_budget.check_query(query, **limits)
+            assert expected is None
+        except InvalidClientInput as exc:
+            assert exc.message == f"Query too complex: {expected}.", exc.message
@@ -0,0 +1,148 @@
+import time
+import random
+import pytest
+
+from sel import config
+from sel.schema_reader import SchemaReader
+from sel.query_completion import QueryCompleter, partial_token, common_prefix_length
+
+from test_utils import load_schema
+
+
+CONF = config.read()
+
+TYPED_QUERIES = [
+    "label = bird and (media.image ~ 'cat' or not author.name in [a, b, \"c\"])",
+    "2018 < date <= 2019 where media.label.score > 0.5 and like nrange (> 2, < 10)",
+    "media where (label = 3 and label.score >= 0.6)\naggreg toto: label.name size 10 "
+    "subaggreg sub (count: author where like > 2) histogram: date interval month "
+    "sort: like desc mode min under media where (label = 3)",
+    "a = 1 and b = 2 or c = 3 and d prefix \"\"\"x\"\"\" sort: x",
+    "(a = 1 or (b = 2 and not (c = 3 or d = 4) or e where (f = 5 or g = 6)) and h = 7) or i = 8",
+]
+
+LONG_GROUP = "label = x and (" + " or ".join(f"media.label_{i} = value_{i}" for i in range(400))
+
+
+def schema_reader():
+    return SchemaReader(CONF, load_schema())
+
+
+def type_keystrokes(text, seed):
+    """ Texts typed to write text, with some deletions and cursor moves """
+    rnd = random.Random(seed)
+    typed = []
+    for index in range(len(text) + 1):
+        typed.append((text[:index], None))
+        if rnd.random() < 0.05:
+            typed.append((text[:rnd.randint(0, index)], None))
+        if rnd.random() < 0.05:
+            typed.append((text, rnd.randint(0, len(text))))
+    return typed
+
+
+class TestQueryCompletion:
+
+
+    @pytest.mark.parametrize(["query_string", "token", "expected"], [
+        ["", "", ["(", "not", "<quoted>", "<value>", "<field>", "aggreg", "histogram",
+                  "count", "distinct", "min", "max", "sum", "average", "stats", "sort"]],
+        ["label ", "", [">", ">=", "<", "<=", "=", "!=", "~", "!~", "prefix", "nprefix", "not",
+                        "in", "nin", "range", "nrange", "where"]],
+        ["label !", "!", ["!=", "!~"]],
+        ["label = bird ", "", ["where", "and", "or", "aggreg", "histogram", "count", "distinct", "min",
+                               "max", "sum", "average", "stats", "sort"]],
+        ["label = bird a", "a", ["and", "aggreg", "average"]],
+        ["label in [a, ", "", ["<quoted>", "<value>"]],
+        ["date range (", "", [">", ">=", "<", "<="]],
+        ["aggreg: ", "", ["<field>"]],
+        ["aggreg: label s", "s", ["subaggreg", "size", "sum", "stats", "sort"]],
+        ["sort: label ", "", ["asc", "desc", "seed", "mode", "under", "where", "sort"]],
+    ])
+    def test_expected(self, query_string, token, expected):
+        result = QueryCompleter().complete(query_string)
+        assert result["token"] == token
+        assert result["expected"] == expected
+
+
+    def test_error_and_cursor(self):
+        completer = QueryCompleter()
+        assert completer.complete("label = bird and")["error"] is not None
+        assert completer.complete("label = bird and media = cat")["error"] is None
+
+        result = completer.complete("label = bird and media = cat", cursor=5)
+        assert result["token"] == "label"
+        assert "<field>" in result["expected"]
+
+
+    def test_fields(self):
+        reader = schema_reader()
+        result = QueryCompleter().complete("label = bird and media.label.sc", schema_reader=reader)
+        assert result["fields"] == ["media.label.score"]
+
+        result = QueryCompleter().complete("label = bird and .au", schema_reader=reader)
+        assert result["fields"] == [".author", ".author.follower", ".author.name"]
+
+        result = QueryCompleter().complete("label = bird", schema_reader=reader)
+        assert result["fields"] == []
+
+
+    def test_resume(self):
+        """ Completion resumed from previous parse is the same as from scratch """
+        for seed, text in enumerate(TYPED_QUERIES):
+            completer = QueryCompleter(max_tokens=100)
+            resumed = 0
+            for typed, cursor in type_keystrokes(text, seed):
+                result = completer.complete(typed, cursor)
+                resumed += completer.resumed_at > 0
+                assert result == QueryCompleter(max_tokens=100).complete(typed, cursor), typed
+            assert resumed > 0
+
+
+    def test_resume_in_group(self):
+        """ Typing at the end of a long bracketed group resumes from its last element """
+        completer = QueryCompleter()
+        completer.complete(LONG_GROUP)
+
+        durations = []
+        for typed in [LONG_GROUP + " or", LONG_GROUP + " or l", LONG_GROUP + " or la", LONG_GROUP + " o"]:
+            start = time.perf_counter()
+            result = completer.complete(typed)
+            durations.append(time.perf_counter() - start)
+
+            assert completer.resumed_at > LONG_GROUP.rindex(" or ")
+            assert result == QueryCompleter().complete(typed), typed
+
+        assert min(durations) < 0.005
+
+
+    @pytest.mark.parametrize(["text", "expected"], [
+        ["", ""],
+        ["a = ", ""],
+        ["a = media.lab", "media.lab"],
+        ["a !", "!"],
+        ["a != b", "b"],
+        ["(a", "a"],
+    ])
+    def test_partial_token(self, text, expected):
+        assert partial_token(text) == expected
+
+
+    @pytest.mark.parametrize(["first", "second", "expected"], [
+        ["", "abc", 0],
+        ["abc", "abc", 3],
+        ["abcd", "abxd", 2],
+        ["ab", "abc", 2],
+    ])
+    def test_common_prefix_length(self, first, second, expected):
+        assert common_prefix_length(first, second) == expected
+
+
+    @pytest.mark.parametrize(["prefix", "size", "expected"], [
+        ["", 3, [".author", ".author.follower", ".author.name"]],
+        ["label.n", 10, ["label.name"]],
+        ["model.", 10, ["model.name", "model.score"]],
+        ["zzz", 10, []],
+    ])
+    def test_complete_field(self, prefix, size, expected):
+        assert schema_reader().complete_field(prefix, size=size) == expected
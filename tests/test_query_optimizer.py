@@ -0,0 +1,90 @@
+import json
+import logging
+import pytest
+
+from sel import config
+from sel.sel import SEL
+from sel.query_optimizer import optimize
+
+from test_utils import load_schema, load_documents, matches
+
+
+def nested(path, query):
+    return {"nested": {"path": path, "query": query}}
+
+
+def term(field, value):
+    return {"term": {field: value}}
+
+
+class TestQueryOptimizer:
+
+
+    @pytest.mark.parametrize(["query", "expected"], [
+        [{"bool": {"should": [term("a", 1), term("a", 2), {"bool": {"should": [term("a", 3)]}}]}},
+         {"terms": {"a": [1, 2, 3]}}],
+        [{"bool": {"must_not": [term("a", 1), {"terms": {"a": [1, 2]}}, term("b", 1)]}},
+         {"bool": {"must_not": [{"terms": {"a": [1, 2]}}, term("b", 1)]}}],
+        [{"bool": {"must_not": [nested("p", term("p.a", 1)), nested("p", term("p.b", 2))]}},
+         {"bool": {"must_not": [nested("p", {"bool": {"should": [term("p.a", 1), term("p.b", 2)]}})]}}],
+        [{"bool": {"filter": [nested("p", term("p.a", 1)), nested("p", term("p.b", 2))]}},
+         {"bool": {"filter": [nested("p", term("p.a", 1)), nested("p", term("p.b", 2))]}}],
+        [{"bool": {"filter": [{"bool": {"must": [term("a", 1)], "must_not": [term("b", 1)]}}, term("c", 1)]}},
+         {"bool": {"filter": [term("a", 1), term("c", 1)], "must_not": [term("b", 1)]}}],
+        [{"bool": {"must_not": [{"bool": {"should": [term("a", 1), term("b", 1)]}}]}},
+         {"bool": {"must_not": [term("a", 1), term("b", 1)]}}],
+        [{"bool": {"filter": [term("a", 1), term("a", 1)], "must_not": [term("b", 1), term("b", 1)]}},
+         {"bool": {"filter": [term("a", 1)], "must_not": [term("b", 1)]}}],
+        [{"bool": {"must": [{"bool": {"should": [term("a", 1)]}}]}}, term("a", 1)],
+        [{"match_all": {}}, {"match_all": {}}],
+    ])
+    def test_optimize(self, query, expected):
+        frozen = json.dumps(query)
+        assert optimize(query, scored=False) == expected
+        assert json.dumps(query) == frozen
+
+
+    def test_scored(self):
+        should = {"bool": {"should": [term("a", 1), term("a", 2), term("a", 2)]}}
+        assert optimize(should) == should
+        assert optimize(should, scored=False) == {"terms": {"a": [1, 2]}}
+
+        query = {"bool": {"must": [term("a", 1), term("a", 1)], "should": [{"bool": {"should": [term("b", 1)]}}]}}
+        assert optimize(query) == {"bool": {"must": [term("a", 1), term("a", 1)], "should": [term("b", 1)]}}
+        assert optimize(query, scored=False) == {"bool": {"must": [term("a", 1)], "should": [term("b", 1)]}}
+
+
+    def test_max_terms(self):
+        query = {"bool": {"should": [term("a", 1), {"terms": {"a": [2, 3]}}, term("a", 4), term("a", 5)]}}
+        assert optimize(query, scored=False, max_terms=2) == {"bool": {"should": [
+            {"terms": {"a": [1, 2]}}, {"terms": {"a": [3, 4]}}, {"terms": {"a": [5]}}
+        ]}}
+        assert optimize(query, scored=False, max_terms=0) == {"terms": {"a": [1, 2, 3, 4, 5]}}
+
+
+    @pytest.mark.parametrize("query", [
+        "label = bag or label = dress or label = person",
+        "label != bag and label != dress and color != white",
+        "not (label = bag or (color = white or color = black))",
+        "(like > 10 or like <= 20) and not (label.score > 0.5 and label.score <= 0.99)",
+        "label in [bag, dress] or (label = face and color nin [white, black])",
+        "not (media.label_size > 3 and (label = person or label = dress))",
+        "label = dress where (color = white or color = black) or label = bag where label.score > 0.99",
+        "(label = bag or label = person) and (label != dress or like > 10)",
+    ])
+    @pytest.mark.parametrize("sort", ["", " sort: null"])
+    def test_same_matching(self, query, sort):
+        schema = load_schema()
+        documents = load_documents()
+
+        queries = []
+        for optimized in ["false", "true"]:
+            conf = config.read()
+            conf["Queries"]["OptimizeQueries"] = optimized
+            sel = SEL(None, conf=conf, log_level=logging.DEBUG)
+            result = sel.generate_query({"query": query + sort}, schema=schema, no_deleted=False)
+            queries.append(result["elastic_query"]["query"])
+
+        base, optimized = queries
+        assert [matches(base, d) for d in documents] == \
+            [matches(optimized, d) for d in documents]
@@ -0,0 +1,140 @@
+import random
+import pytest
+
+from sel import query_string_parser, query_string_descent, query_object_formator
+from sel.query_string_parser import (
+    Value, QueryString, Comparator, Not, RangeFilter, Filter, Context,
+    Aggreg, Sort, Group, NoBracketGroup, Query
+)
+from sel.utils import InvalidClientInput
+
+import test_parser_n_formator
+
+
+TEST_GRAMMARS = {
+    "test_value": Value,
+    "test_query_string": QueryString,
+    "test_quoting": Value,
+    "test_comparator": Comparator,
+    "test_filter": Filter,
+    "test_range_filter": RangeFilter,
+    "test_context": Context,
+    "test_aggreg": Aggreg,
+    "test_sort": Sort,
+    "test_group": Group,
+    "test_nobracketgroup": NoBracketGroup,
+    "test_not_syntax": Not,
+    "test_query": Query,
+}
+
+FUZZ_TOKENS = [
+    "label", "media.label", "2018", "1", "=", "!=", "~", ">", ">=", "<", "<=", "not", "NOT",
+    "in", "nin", "range", "nrange", "prefix", "where", "and", "or", "(", ")", "[", "]", ",", ":",
+    '"q"', "'s'", "''u''", '"', "aggreg", "count", "histogram", "subaggreg", "interval", "size",
+    "under", "graph", "sort", "desc", "seed", "mode", "notable", "index", "aggrego", "\n", "#h"
+]
+
+
+def reference_queries():
+    """ Queries of parser tests, with their grammar """
+    for method_name, grammar in TEST_GRAMMARS.items():
+        mark = getattr(test_parser_n_formator.TestParserNFormator, method_name).pytestmark[0]
+        for query, _ in mark.args[1]:
+            yield query, grammar
+
+
+def parse_with(parser, query, grammar):
+    try:
+        return query_object_formator.formator(parser.parse(query, grammar=grammar))
+    except InvalidClientInput as exc:
+        return ("InvalidClientInput", exc.message)
+    except Exception as exc:
+        return (type(exc).__name__,)
+
+
+def assert_same_as_reference(query, grammar=Query):
+    expected = parse_with(query_string_parser, query, grammar)
+    res = parse_with(query_string_descent, query, grammar)
+    assert res == expected, f"Query: '{query}'\nExpected: {expected}\nGot: {res}\n"
+
+
+class TestQueryStringDescent:
+
+
+    @pytest.mark.parametrize(["query", "grammar"], list(reference_queries()))
+    def test_same_as_reference(self, query, grammar):
+        assert_same_as_reference(query, grammar)
+
+
+    @pytest.mark.parametrize(["query", "expected"], [
+        ['"foo" bar', 'Invalid syntax at line 1, global position 0: "bar" is unexpected.'],
+        ["media where label", 'Invalid syntax at line 1, global position 6: "label", expect bracketed query after "where".'],
+        ["x not in [1, ", "Invalid syntax at line 1, global position 9: nothing found, but value was expected for list of values."],
+        ["a = 1 and", "Invalid syntax at line 1, global position 9: nothing found, but query was expected after and/or."],
+        ["notable = 1 aggrego: x", 'Invalid syntax at line 1, global position 12: "aggrego: x" is unexpected.'],
+    ])
+    def test_error_message(self, query, expected):
+        with pytest.raises(InvalidClientInput) as exc_info:
+            query_string_descent.parse(query)
+        assert exc_info.value.message == expected
+        assert_same_as_reference(query)
+
+
+    @pytest.mark.parametrize("seed", range(4))
+    def test_fuzz(self, seed):
+        rnd = random.Random(seed)
+        grammars = [Query, Query, Query, Filter, Aggreg, Sort, Group, Not, Context, RangeFilter]
+
+        for _ in range(500):
+            tokens = [rnd.choice(FUZZ_TOKENS) for _ in range(rnd.randint(0, 15))]
+            query = "".join(t + rnd.choice([" ", "", "  ", "\n"]) for t in tokens)
+            assert_same_as_reference(query, rnd.choice(grammars))
+
+
+    @pytest.mark.parametrize("query", [
+        '""', '""""', '"a""b"', '"""a"b"""', '""a"b""', "'a\"b'", "'''a''b'''", "''a'b''",
+        '"a\nb"', "'a", '"a"b"', '"' + "lorem ipsum " * 1000 + '"'
+    ])
+    def test_quoted_value(self, query):
+        assert_same_as_reference(query, Value)
+        assert_same_as_reference(f"label ~ {query} and x = 1")
+
+
+    @pytest.mark.parametrize(["query", "max_literal_length", "expected"], [
+        ['x ~ "abcd"', 4, {"field": "x", "comparator": "~", "value": "abcd"}],
+        ['x ~ "abcde"', 4, None],
+        ['x ~ "abcde', 4, None],
+        ['x ~ "abcde"', 0, {"field": "x", "comparator": "~", "value": "abcde"}],
+        ['"ab\ncdef"', 4, None], # Exception, new line in quoted value, as reference parser
+    ])
+    def test_max_literal_length(self, query, max_literal_length, expected):
+        try:
+            res = query_string_descent.parse(query, max_literal_length=max_literal_length)
+            res = query_object_formator.formator(res)
+            assert res == {"query": expected}, f"Query: '{query}'\nExpected: {expected}\nGot: {res}\n"
+        except InvalidClientInput as exc:
+            assert expected is None, exc.message
+
+
+    @pytest.mark.parametrize(["query", "limits", "expected"], [
+        ["(((a = 1)))", {"max_group_depth": 4}, None],
+        ["(((a = 1)))", {"max_group_depth": 3}, "groups nested deeper than 3 levels"],
+        ["not not a = 1", {"max_group_depth": 2}, "groups nested deeper than 2 levels"],
+        ["a = 1 where (b = 2 where c = 3)", {"max_group_depth": 3}, "groups nested deeper than 3 levels"],
+        ["a in [1, 2, 3]", {"max_in_values": 3}, None],
+        ["a in [1, 2, 3, 4]", {"max_in_values": 3}, "more than 3 values in an 'in' list"],
+        ["a = 1 and b = 2", {"max_tokens": 7}, None],
+        ["a = 1 and b = 2", {"max_tokens": 6}, "more than 6 tokens"],
+        ["aggreg: a subaggreg s (count: b)", {"max_subaggreg_depth": 1}, None],
+        ["aggreg: a subaggreg s (aggreg: b subaggreg t (count: c))", {"max_subaggreg_depth": 1},
+         "subaggregations nested deeper than 1 levels"],
+        ["(" * 100 + "a = 1" + ")" * 100, {"max_group_depth": 0, "max_tokens": 0}, None],
+    ])
+    def test_budget(self, query, limits, expected):
+        try:
+            query_string_descent.parse(query, **limits)
+            assert expected is None
+        except InvalidClientInput as exc:
+            assert expected is not None, exc.message
+            assert exc.message.startswith("Query too complex at line 1, global position ")
+            assert exc.message.endswith(f": {expected}.")
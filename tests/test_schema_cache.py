@@ -0,0 +1,260 @@
+import pytest
+import logging
+
+from sel.sel import SEL
+from sel.schema_cache import SchemaCache, SchemaRefresher
+from sel.schema_reader import SchemaReader
+from sel.utils import NotFound
+
+from test_utils import FakeElastic
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSchemaCache:
+
+    def test_hit_miss(self):
+        cache = SchemaCache(60, 10)
+        calls = []
+        loader = lambda: calls.append(1) or {"properties": {}}
+
+        first = cache.get("foo", loader)
+        assert cache.get("foo", loader) is first
+        assert len(calls) == 1
+        assert cache.stats() == {"hits": 1, "misses": 1, "revalidations": 0, "size": 1}
+
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = SchemaCache(60, 10, clock=clock)
+        calls = []
+        loader = lambda: calls.append(1) or {}
+
+        cache.get("foo", loader)
+        clock.now = 59
+        cache.get("foo", loader)
+        assert len(calls) == 1
+
+        clock.now = 61
+        cache.get("foo", loader)
+        assert len(calls) == 2
+
+
+    def test_disabled(self):
+        cache = SchemaCache(0, 10)
+        calls = []
+        loader = lambda: calls.append(1) or {}
+
+        cache.get("foo", loader)
+        cache.get("foo", loader)
+        assert len(calls) == 2
+        assert cache.stats()["size"] == 0
+
+
+    def test_max_entries(self):
+        cache = SchemaCache(60, 2)
+        for key in ["a", "b", "a", "c"]:
+            cache.get(key, lambda: key)
+
+        assert [key for key, _ in cache._entries.items()] == ["a", "c"]
+
+
+    def test_not_found(self):
+        clock = FakeClock()
+        cache = SchemaCache(60, 10, not_found_ttl=5, clock=clock)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            raise NotFound("Index(es) not found: foo")
+
+        for _ in range(2):
+            with pytest.raises(NotFound, match="Index"):
+                cache.get("foo", loader)
+        assert len(calls) == 1
+
+        clock.now = 6
+        with pytest.raises(NotFound):
+            cache.get("foo", loader)
+        assert len(calls) == 2
+
+
+    @pytest.mark.parametrize(["index", "expected"], [
+        [None, []],
+        ["foo", ["bar", "bar_*"]],
+        ["bar", ["foo", "bar_*"]],
+        ["bar_2017", ["foo", "bar", "foo,bar"]],
+        ["toto", ["foo", "bar", "bar_*", "foo,bar"]],
+    ])
+    def test_invalidate(self, index, expected):
+        cache = SchemaCache(60, 10)
+        for key in ["foo", "bar", "bar_*", "foo,bar"]:
+            cache.get(key, lambda: {})
+
+        cache.invalidate(index)
+        assert [key for key, _ in cache._entries.items()] == expected
+
+
+    @pytest.mark.parametrize("valid", [True, False])
+    def test_revalidation(self, valid):
+        clock = FakeClock()
+        checks = []
+        validator = lambda key, value: checks.append(key) or valid
+        cache = SchemaCache(60, 10, validator=validator, clock=clock)
+        calls = []
+        loader = lambda: calls.append(1) or {"version": len(calls)}
+
+        cache.get("foo", loader)
+        clock.now = 61
+        assert cache.get("foo", loader) == {"version": 1 if valid else 2}
+        assert checks == ["foo"]
+        assert len(calls) == (1 if valid else 2)
+        assert cache.stats()["revalidations"] == (1 if valid else 0)
+
+        clock.now = 100
+        cache.get("foo", loader)
+        assert checks == ["foo"]
+
+
+    def test_refresher(self):
+        clock = FakeClock()
+        cache = SchemaCache(60, 10, validator=lambda key, value: key != "bar", clock=clock)
+        loaded = []
+        loader = lambda key: loaded.append(key) or key.upper()
+        refresher = SchemaRefresher(cache, loader, interval=1, ahead=15)
+
+        for key in ["foo", "bar", "cold"]:
+            cache.get(key, lambda: loader(key))
+        cache.get("foo", lambda: loader("foo"))
+        cache.get("bar", lambda: loader("bar"))
+
+        clock.now = 30
+        assert refresher.refresh() == []
+
+        clock.now = 50
+        assert refresher.refresh() == ["foo", "bar"]
+        assert loaded == ["foo", "bar", "cold", "bar"]
+        assert cache.stats()["revalidations"] == 1
+
+        # Not used since their refresh
+        assert refresher.refresh() == []
+
+        # Not refreshed, checked on request
+        clock.now = 61
+        cache.get("cold", lambda: loader("cold"))
+        assert loaded == ["foo", "bar", "cold", "bar"]
+        assert cache.stats()["revalidations"] == 2
+
+
+    @pytest.mark.parametrize(["mappings", "current", "calls"], [
+        [
+            [("foo_1", {"_meta": {"version": 2}, "properties": {}}), ("foo_2", {"_meta": {"version": 2}, "properties": {}})],
+            True, ["get_settings", "get_mapping foo_2 *.mappings._meta.version"]
+        ],
+        [
+            [("foo_1", {"_meta": {"version": 2}, "properties": {}}), ("foo_2", {"_meta": {"version": 3}, "properties": {}})],
+            False, ["get_settings", "get_mapping foo_2 *.mappings._meta.version", "get_mapping foo_2 None"]
+        ],
+        [
+            [("foo_1", {"_meta": {"version": 2}, "properties": {}}), ("foo_2", {"properties": {}})],
+            False, ["get_settings", "get_mapping foo_2 *.mappings._meta.version", "get_mapping foo_2 None"]
+        ],
+        [
+            [("foo_1", {"properties": {}}), ("foo_2", {"properties": {}})],
+            True, ["get_settings", "get_mapping foo_2 None"]
+        ],
+        [
+            [("foo_1", {"properties": {}}), ("foo_2", {"properties": {"a": {"type": "long"}}})],
+            False, ["get_settings", "get_mapping foo_2 None"]
+        ],
+    ])
+    def test_revalidate_schema(self, mappings, current, calls):
+        elastic = FakeElastic(mappings)
+        sel = SEL(elastic, log_level=logging.DEBUG)
+        reader = SchemaReader(sel.conf, mappings[0][1])
+
+        result = sel._revalidate_schema("foo_*", reader)
+        if current:
+            assert result is True
+        else:
+            assert isinstance(result, SchemaReader)
+            assert result.schema == mappings[1][1]
+            assert result.source["index"] == "foo_2"
+        assert elastic.indices.calls == calls
+
+
+    def test_revalidate_schema_source(self):
+        elastic = FakeElastic([("foo_1", {"properties": {}})])
+        sel = SEL(elastic, log_level=logging.DEBUG)
+        reader = sel._load_schema_reader("foo_*")
+        assert reader.source == {"index": "foo_1", "uuid": "uuid_foo_1", "creation_date": "0"}
+
+        elastic.indices.calls = []
+        assert sel._revalidate_schema("foo_*", reader) is True
+        assert elastic.indices.calls == ["get_settings", "get_mapping foo_1 None"]
+
+        # Mapping updated in place, fetched once
+        elastic.indices.mappings = [("foo_1", {"properties": {"a": {"type": "long"}}})]
+        elastic.indices.calls = []
+        reader = sel._revalidate_schema("foo_*", reader)
+        assert reader.schema == elastic.indices.mappings[0][1]
+        assert elastic.indices.calls == ["get_settings", "get_mapping foo_1 None"]
+
+        # Newer index, its mapping is not fetched to be checked
+        elastic.indices.mappings.append(("foo_2", {"properties": {}}))
+        elastic.indices.calls = []
+        reader = sel._revalidate_schema("foo_*", reader)
+        assert reader.source["index"] == "foo_2"
+        assert elastic.indices.calls == ["get_settings", "get_mapping foo_2 None"]
+
+
+    def test_validator_new_value(self):
+        clock = FakeClock()
+        loaded = []
+        cache = SchemaCache(60, 10, validator=lambda key, value: value + 1, clock=clock)
+        loader = lambda: loaded.append(1) or 1
+
+        assert cache.get("foo", loader) == 1
+        clock.now = 61
+        assert cache.get("foo", loader) == 2
+        assert loaded == [1]
+        assert cache.stats()["revalidations"] == 0
+
+
+    def test_validator_not_found(self):
+        clock = FakeClock()
+        loaded = []
+
+        def validator(key, value):
+            raise NotFound(f"Index(es) not found: {key}")
+
+        cache = SchemaCache(60, 10, not_found_ttl=10, validator=validator, clock=clock)
+        loader = lambda: loaded.append(1) or 1
+
+        cache.get("foo", loader)
+        clock.now = 61
+        for _ in range(2):
+            with pytest.raises(NotFound):
+                cache.get("foo", loader)
+        assert loaded == [1]
+
+
+    def test_fetch_newest_schema(self):
+        mappings = [(f"foo_{i}", {"properties": {f"field_{i}": {"type": "long"}}}) for i in range(5)]
+        elastic = FakeElastic(mappings)
+        sel = SEL(elastic, log_level=logging.DEBUG)
+
+        assert sel.get_schema("foo_*") == mappings[-1][1]
+        assert elastic.indices.calls == ["get_settings", "get_mapping foo_4 None"]
+
+        # Cached schema is not modified by callers
+        sel.get_schema("foo_*")["properties"].clear()
+        assert sel.get_schema("foo_*") == mappings[-1][1]
+        assert sel._schema_reader("foo_*").schema == mappings[-1][1]
@@ -0,0 +1,164 @@
+import copy
+import pickle
+import pytest
+
+from sel import config
+from sel.schema_reader import SchemaReader, SchemaError, path_to_string
+
+from test_utils import load_schema
+
+
+CONF = config.read()
+
+
+def all_queries(reader):
+    """ All suffixes and absolute paths of all fields, with and without function """
+    queries = ["labl", "media.toto", ".label", ".media.label.exists"]
+    for field in reader.list_field():
+        path = field["path"]
+        queries.append(field["pretty_str_path"])
+        queries += [path_to_string(path[-size:]) for size in range(1, len(path) + 1)]
+    return queries + [f"{q}.exists" for q in queries]
+
+
+def all_roots(reader):
+    """ All nested contexts of the schema """
+    nested = {f["str_path"] for f in reader.list_field() if f["element"].get("type") == "nested"}
+    return [None, "label", "media.toto"] + sorted(nested)
+
+
+def field_info(reader, field, **kwargs):
+    try:
+        return reader.get_field_info(field, can_raise=False, **kwargs)
+    except Exception as exc:
+        return type(exc), str(exc)
+
+
+class TestSchemaReader:
+
+    def test_index_matches_walker(self):
+        schema = load_schema()
+        walker = SchemaReader(CONF, schema, use_index=False)
+        reader = SchemaReader(CONF, schema)
+
+        for root in all_roots(walker):
+            for query in all_queries(walker):
+                for functions in [False, True]:
+                    kwargs = {"nested": root, "functions": functions}
+                    expected = field_info(walker, query, **kwargs)
+                    got = field_info(reader, query, **kwargs)
+                    assert got == expected, f"Query: {query}, root: {root}"
+
+
+    @pytest.mark.parametrize(["query", "root"], [
+        [["label"], None],
+        [[".", "media", "label"], None],
+        [["score"], "media.label"],
+        [[".", "score"], "media.label"],
+        [["label"], "media.label"],
+        [["name"], "media"],
+        [["deleted"], "media.label"],
+    ])
+    def test_find_field(self, query, root):
+        schema = load_schema()
+        expected = SchemaReader(CONF, schema, use_index=False).schema_finder(query, root=root)
+        assert SchemaReader(CONF, schema).find_field(query, root=root) == expected
+
+
+    def test_match_field(self):
+        schema = load_schema()
+        walker = SchemaReader(CONF, schema, use_index=False)
+        reader = SchemaReader(CONF, schema)
+
+        for query in all_queries(walker):
+            assert reader.match_field(query) == walker.match_field(query), f"Query: {query}"
+
+
+    @pytest.mark.parametrize(["query", "expected"], [
+        ["label", ["label", "label_size", "label.name"]],
+        ["labl", ["label"]],
+        ["media.label.scor", ["label.score", "color", "model.score"]],
+        [".author", [".author", ".author.name", "follower"]],
+        ["nothing_close", []],
+    ])
+    def test_search_field(self, query, expected):
+        schema = load_schema()
+        walker = SchemaReader(CONF, schema, use_index=False)
+        reader = SchemaReader(CONF, schema)
+
+        found = reader.search_field(query)
+        assert found == walker.search_field(query)
+        assert [f["str_short_path"] for f in found] == expected
+
+
+    def test_search_field_matches_walker(self):
+        schema = load_schema()
+        walker = SchemaReader(CONF, schema, use_index=False)
+        reader = SchemaReader(CONF, schema)
+
+        queries = all_queries(walker)
+        typos = [q[1:] + q[0] for q in queries] + [q[:-1] for q in queries if len(q) > 1]
+        for query in queries + typos + ["", "s", "..."]:
+            for min_score in [0.3, 0.6, 0.9]:
+                expected = walker.search_field(query, min_score=min_score)
+                assert reader.search_field(query, min_score=min_score) == expected, query
+
+        assert reader.search_fields(typos[:10]) == [walker.search_field(q) for q in typos[:10]]
+
+
+    def test_short_path(self):
+        reader = SchemaReader(CONF, load_schema())
+        short_paths = {f["str_path"]: f["str_short_path"] for f in reader.match_field("name")}
+        assert short_paths["author.name"] == ".author.name"
+        assert short_paths["media.label.model.name"] == "model.name"
+        assert reader.short_path(["media", "label", "name"], sub_properties=["name"]) == ["label"]
+        assert reader.accept_function(".media.label") == ["exists"]
+
+
+    def test_field_info_memoized(self):
+        reader = SchemaReader(CONF, load_schema())
+
+        info = reader.get_field_info("label", nested="media")
+        assert reader.get_field_info("label", nested="media") is info
+        assert reader.get_field_info("label") is not info
+        assert reader.field_infos.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3, "size": 2}
+
+        assert info["path"] == ("media", "label", "name")
+        assert info.to_dict()["path"] == ["media", "label", "name"]
+        assert pickle.loads(pickle.dumps(info)) == info
+        assert hash(info) == hash(pickle.loads(pickle.dumps(info)))
+
+        with pytest.raises(AttributeError):
+            info.path = ("label",)
+        with pytest.raises(TypeError):
+            info["path"] = ("label",)
+
+        for _ in range(2):
+            with pytest.raises(SchemaError):
+                reader.get_field_info("labl")
+            assert reader.get_field_info("labl", can_raise=False)["error"].startswith("Not Found")
+        assert reader.field_infos.stats()["misses"] == 3
+
+
+    @pytest.mark.parametrize("use_index", [True, False])
+    def test_schema_not_modified(self, use_index):
+        schema = load_schema()
+        expected = copy.deepcopy(schema)
+        reader = SchemaReader(CONF, schema, use_index=use_index)
+
+        for root in all_roots(reader):
+            for query in all_queries(reader)[:200]:
+                field_info(reader, query, nested=root)
+            if root not in ["label", "media.toto"]:
+                reader.search_field("scor", root=root)
+
+        assert schema == expected
+
+
+    def test_list_field_under_root(self):
+        reader = SchemaReader(CONF, load_schema())
+        fields = reader.list_field(root="media.label")
+
+        assert fields == [f for f in reader.list_field() if f["str_path"].startswith("media.label.")]
+        assert fields[0]["path"] == ["media", "label", "name"]
+        assert fields[0]["nested"] == ["media", "label"]
@@ -0,0 +1,92 @@
+import os
+import pickle
+import logging
+import pytest
+
+from sel import config, schema_store, schema_index
+from sel.sel import SEL
+from sel.schema_reader import SchemaReader
+from sel.utils import InternalServerError, NotFound
+
+from test_utils import load_schema
+
+
+CONF = config.read()
+
+
+class TestSchemaStore:
+
+    def test_fingerprint(self):
+        schema = load_schema()
+        assert schema_store.fingerprint(schema) == schema_store.fingerprint(load_schema())
+
+        schema["properties"]["new_field"] = {"type": "keyword"}
+        assert schema_store.fingerprint(schema) != schema_store.fingerprint(load_schema())
+
+
+    def test_dump_load(self, tmp_path):
+        reader = SchemaReader(CONF, load_schema())
+        path = schema_store.dump(reader, str(tmp_path), indexes=["foo"])
+        schema_store.dump(reader, str(tmp_path), indexes=["bar"])
+
+        assert os.path.basename(path) == schema_store.fingerprint(reader.schema) + ".schema.pickle"
+
+        loaded = schema_store.load(CONF, path)
+        assert loaded["indexes"] == ["foo", "bar"]
+        assert loaded["reader"].index.suggest_strings is not None
+
+        for field in ["label", ".media.label.score", "labl", "color.name"]:
+            expected = reader.get_field_info(field, can_raise=False)
+            assert loaded["reader"].get_field_info(field, can_raise=False) == expected
+
+
+    def test_version(self, tmp_path):
+        path = str(tmp_path / ("old" + schema_store.FILE_EXTENSION))
+        with open(path, "wb") as fd:
+            pickle.dump({"version": 0}, fd)
+
+        with pytest.raises(InternalServerError, match="unsupported version"):
+            schema_store.load(CONF, path)
+
+
+    def test_index_layout(self, tmp_path, monkeypatch):
+        reader = SchemaReader(CONF, load_schema())
+        path = schema_store.dump(reader, str(tmp_path))
+        assert schema_store.load(CONF, path)["reader"].index.suggest_strings is not None
+
+        # Index of another layout is built again from the mapping
+        monkeypatch.setattr(schema_index, "LAYOUT_VERSION", schema_index.LAYOUT_VERSION + 1)
+        loaded = schema_store.load(CONF, path)["reader"]
+        assert loaded.index.suggest_strings is None
+        assert loaded.index.by_path.keys() == reader.index.by_path.keys()
+        assert loaded.get_field_info("label") == reader.get_field_info("label")
+
+
+    def test_offline_sel(self, tmp_path):
+        schema_store.dump(SchemaReader(CONF, load_schema()), str(tmp_path), indexes=["foo"])
+
+        osel = SEL(None, log_level=logging.DEBUG)
+        assert osel.load_schemas(str(tmp_path)) == ["foo"]
+
+        query = {"query": "label = bag"}
+        expected = osel.generate_query(query, schema=load_schema())
+        assert osel.generate_query(query, index="foo") == expected
+
+
+    def test_offline_sel_over_cache_size(self, tmp_path):
+        schema = load_schema()
+        for i in range(3):
+            schema["properties"][f"field_{i}"] = {"type": "keyword"}
+            schema_store.dump(SchemaReader(CONF, dict(schema)), str(tmp_path), indexes=[f"idx{i}"])
+
+        conf = config.read()
+        conf["Schema"]["CacheMaxEntries"] = "2"
+        osel = SEL(None, conf=conf, log_level=logging.DEBUG)
+        assert sorted(osel.load_schemas(str(tmp_path))) == ["idx0", "idx1", "idx2"]
+
+        for i in range(3):
+            result = osel.generate_query({"query": f"field_{i} = bag"}, index=f"idx{i}")
+            assert result["warns"] == []
+
+        with pytest.raises(NotFound):
+            osel.generate_query({"query": "label = bag"}, index="unknown")
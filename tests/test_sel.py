@@ -111,7 +111,7 @@ class TestSEL:
 
         query = {"ids": ["1434484792463866663"]}
         res = sel.delete_documents(TEST_INDEX, query)
-        assert res == {"count": 1, "action": "delete"}
+        assert res == {"count": 1, "action": "delete", "warnings": []}
 
         res = sel.search(TEST_INDEX, {"meta": {"size": 0}})
         assert res["results"]["hits"]["total"]["value"] == 99
@@ -120,13 +120,13 @@ class TestSEL:
         assert res["results"]["hits"]["total"]["value"] == 1
 
         res = sel.delete_documents(TEST_INDEX, query)
-        assert res == {"count": 1, "action": "delete"}
+        assert res == {"count": 1, "action": "delete", "warnings": []}
 
         res = sel.search(TEST_INDEX, {"meta": {"size": 0}})
         assert res["results"]["hits"]["total"]["value"] == 99
 
         res = sel.delete_documents(TEST_INDEX, query, undelete=True)
-        assert res == {"count": 1, "action": "undelete"}
+        assert res == {"count": 1, "action": "undelete", "warnings": []}
 
         res = sel.search(TEST_INDEX, {"meta": {"size": 0}})
         assert res["results"]["hits"]["total"]["value"] == 100
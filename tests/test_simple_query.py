@@ -0,0 +1,129 @@
+import random
+import logging
+import itertools
+import pytest
+
+from sel import simple_query, query_string_parser, query_string_descent, query_object_formator
+from sel.sel import SEL
+from sel.query_generator import QueryGenerator
+from sel.plan_cache import PlanCache
+from sel.schema_reader import SchemaReader
+from sel.utils import InvalidClientInput
+
+from test_utils import load_schema
+
+
+
+COMPARATORS = ["=", "!=", "~", "!~", ">", ">=", "<", "<="]
+VALUES = ["bag", "1", "0.5", "-2", "true", "2018-01", "x*", "'a b'", '"a \' b"', '""', "''"]
+
+
+def schema_fields(schema):
+    """ Absolute paths and names of schema fields, plus functions and unknown ones """
+    fields = {"labl", "media.toto", "label.exists", "undeleted"}
+    for field in SchemaReader(SEL(None).conf, schema).list_field():
+        fields.update([field["pretty_str_path"], field["field"]])
+    return sorted(fields)
+
+
+def full_parse(parser, query_string):
+    try:
+        return query_object_formator.formator(parser.parse(query_string))
+    except InvalidClientInput:
+        return None
+
+
+def generate(sel, query, no_deleted):
+    try:
+        return sel.generate_query(query, index="test_index", no_deleted=no_deleted)
+    except Exception as exc:
+        return type(exc), str(exc)
+
+
+def random_query_string(rnd):
+    pieces = ["a", "label", ".id", "not", "nota", "and", "sort", "1", "0.5", "x*", " ", "  ",
+              "\n", "=", "!=", "~", "!~", ">", ">=", "<", "<=", "'", '"', "b c", "(", ")"]
+    return "".join(rnd.choice(pieces) for _ in range(rnd.randint(1, 6)))
+
+
+class TestSimpleQuery:
+
+
+    @pytest.mark.parametrize(["query_string", "expected"], [
+        ["label = bag", {"query": {"field": "label", "comparator": "=", "value": "bag"}}],
+        [" .id!=12 \n", {"query": {"field": ".id", "comparator": "!=", "value": "12"}}],
+        ["a ~ 'b c'", {"query": {"field": "a", "comparator": "~", "value": "b c"}}],
+        ["label = bag and a = 1", None],
+        ["notable = 1", None],
+        ["a in [1, 2]", None],
+        ["a = b aggreg: c", None],
+    ])
+    def test_parse(self, query_string, expected):
+        assert simple_query.parse(query_string) == expected
+
+
+    def test_parse_limits(self):
+        assert simple_query.parse("a = 'bcd'", max_literal_length=3) is not None
+        assert simple_query.parse("a = 'bcd'", max_literal_length=2) is None
+        assert simple_query.parse("a = b", max_tokens=3) is not None
+        assert simple_query.parse("a = b", max_tokens=2) is None
+
+
+    @pytest.mark.parametrize("parser", [query_string_descent, query_string_parser])
+    def test_same_as_parser(self, parser):
+        rnd = random.Random(15)
+        query_strings = [f"{f}{s}{c}{s}{v}" for f, c, v, s in itertools.product(
+            ["a", ".id", "media.label", "b-c", "1", "Not", "and", "sort"], COMPARATORS, VALUES, ["", " "]
+        )]
+        query_strings += [random_query_string(rnd) for _ in range(3000)]
+
+        recognized = 0
+        for query_string in query_strings:
+            query = simple_query.parse(query_string)
+            if query is not None:
+                recognized += 1
+                assert query == full_parse(parser, query_string), query_string
+        assert recognized > 1000
+
+
+    def test_same_as_generator(self, monkeypatch):
+        """ Short path gives the same result than the whole pipeline """
+        schema = load_schema()
+        sel = SEL(None, log_level=logging.WARNING)
+        reader = SchemaReader(sel.conf, schema)
+        monkeypatch.setattr(sel, "_schema_reader", lambda index: reader)
+        monkeypatch.setattr(sel, "plan_cache", PlanCache(0))
+
+        queries = []
+        values = ["bag", "0.5", "true", "2018-01", "'a b'"]
+        for field, comparator, value in itertools.product(schema_fields(schema), COMPARATORS, values):
+            queries += [
+                {"query": f"{field} {comparator} {value}"},
+                {"query": f"{field}{comparator}{value}", "meta": {"size": 3}},
+                {"query": {"operator": "and", "items": [
+                    {"field": field, "comparator": comparator, "value": value},
+                    {"field": "like", "comparator": ">", "value": 2}
+                ]}},
+            ]
+
+        results = [generate(sel, q, no_deleted) for q in queries for no_deleted in [True, False]]
+
+        monkeypatch.setattr(simple_query, "parse", lambda *args, **kwargs: None)
+        monkeypatch.setattr(QueryGenerator, "generate_simple_query", lambda *args, **kwargs: None)
+        expected = [generate(sel, q, no_deleted) for q in queries for no_deleted in [True, False]]
+
+        assert results == expected
+        assert sum(isinstance(r, dict) for r in results) > len(results) / 4
+
+
+    @pytest.mark.parametrize("query", [
+        {"query": {"field": "label", "value": "bag"}},
+        {"query": {"operator": "or", "items": [{"field": "label", "comparator": "=", "value": "bag"}]}},
+        {"query": {"field": "label", "comparator": "in", "value": ["bag"]}},
+        {"query": {"field": "label", "comparator": "=", "value": "bag"}, "sort": [{"field": "like"}]},
+        {"query": {"field": "label", "comparator": "=", "value": "bag", "where": {"field": "a", "value": 1}}},
+        {"query": None},
+    ])
+    def test_not_simple(self, query):
+        generator = QueryGenerator(SEL(None).conf, load_schema())
+        assert generator.generate_simple_query([], query) is None
@@ -1,6 +1,22 @@
+import json
+
 from sel import utils
 
 
+TEST_SCHEMA_FILE = "/tests/data/sample_2017_schema.json"
+TEST_DATA_FILE = "/tests/data/sample_2017.json"
+
+
+def load_schema():
+    with open(TEST_SCHEMA_FILE, "r") as fd:
+        return json.load(fd)
+
+
+def load_documents():
+    with open(TEST_DATA_FILE, "r") as fd:
+        return [json.loads(line) for line in fd]
+
+
 def list_equals(l1, l2):
     if len(l1) != len(l2):
         return False
@@ -48,3 +64,81 @@ def subaggreg_formator(aggreg):
         return buckets_formator(sub["buckets"])
 
     return sub["value"]
+
+
+def field_values(obj, path):
+    values = [obj]
+    for key in path:
+        values = [
+            x for v in values if isinstance(v, dict) and key in v
+            for x in (v[key] if isinstance(v[key], list) else [v[key]])
+        ]
+    return [v for v in values if v is not None]
+
+
+def matches(query, obj, context=""):
+    """ Minimal evaluator of generated Elasticsearch queries on a document """
+    (kind, body), = query.items()
+    values = lambda field: field_values(obj, field[len(context):].strip(".").split("."))
+
+    if kind == "match_all":
+        return True
+    if kind == "bool":
+        occ = {k: v if isinstance(v, list) else [v] for k, v in body.items()}
+        required = occ.get("must", []) + occ.get("filter", [])
+        if not all(matches(c, obj, context) for c in required):
+            return False
+        if any(matches(c, obj, context) for c in occ.get("must_not", [])):
+            return False
+        return bool(required) or not occ.get("should") or any(matches(c, obj, context) for c in occ["should"])
+    if kind == "nested":
+        return any(matches(body["query"], o, body["path"]) for o in values(body["path"]))
+    if kind in ["term", "terms", "prefix"]:
+        (field, expected), = body.items()
+        expected = expected if kind == "terms" else [expected]
+        if kind == "prefix":
+            return any(str(v).startswith(e) for v in values(field) for e in expected)
+        return any(str(v) == str(e) or v == e for v in values(field) for e in expected)
+    if kind == "exists":
+        return bool(values(body["field"]))
+    if kind == "range":
+        (field, bounds), = body.items()
+        ops = {"gt": float.__gt__, "gte": float.__ge__, "lt": float.__lt__, "lte": float.__le__}
+        return any(
+            all(ops[op](float(v), float(b)) for op, b in bounds.items() if op in ops)
+            for v in values(field)
+        )
+    raise NotImplementedError(kind)
+
+
+class FakeIndices:
+    """ Indices API of Elasticsearch, with one index per creation date """
+
+    def __init__(self, mappings):
+        self.mappings = mappings
+        self.calls = []
+
+    def get_settings(self, index, name, filter_path):
+        self.calls.append("get_settings")
+        return {
+            name: {"settings": {"index": {"creation_date": str(date), "uuid": f"uuid_{name}"}}}
+            for date, (name, _) in enumerate(self.mappings)
+        }
+
+    def get_mapping(self, index, filter_path=None):
+        self.calls.append(f"get_mapping {index} {filter_path}")
+        mapping = dict(self.mappings)[index]
+        if filter_path:
+            mapping = {"_meta": mapping["_meta"]} if "_meta" in mapping else {}
+        return {index: {"mappings": mapping}}
+
+
+class FakeElastic:
+
+    def __init__(self, mappings):
+        self.indices = FakeIndices(mappings)
+        self.bulks = []
+
+    def bulk(self, body, refresh):
+        self.bulks.append(body)
+        return {"items": []}